@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
 import os
+import tempfile
 from pathlib import Path
 
 from dotenv import load_dotenv
@@ -43,6 +44,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "trmnl.middleware.QueryStatsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -79,14 +81,85 @@ WSGI_APPLICATION = "byos_django.wsgi.application"
 ASGI_APPLICATION = "byos_django.asgi.application"
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.1/ref/settings/#caches
+# Shared by the web app and the workers when CACHE_REDIS_URL is set
+
+if os.environ.get("CACHE_REDIS_URL"):
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": os.environ["CACHE_REDIS_URL"],
+        }
+    }
+
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
+# The app, the scheduler and the render worker share the SQLite file: WAL lets
+# readers run alongside the writer, write transactions take the write lock when
+# they begin (instead of failing when upgrading a read lock), and a busy writer
+# is waited for up to SQLITE_BUSY_TIMEOUT seconds.
+SQLITE_BUSY_TIMEOUT = int(os.environ.get("SQLITE_BUSY_TIMEOUT", 20))
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    # Durable at checkpoints only, safe from corruption with WAL
+    "synchronous": "NORMAL",
+    # 20MB page cache (negative values are KiB)
+    "cache_size": -20000,
+    "mmap_size": 128 * 1024 * 1024,
+    "temp_store": "MEMORY",
+    "busy_timeout": SQLITE_BUSY_TIMEOUT * 1000,
+}
+# Queue the writers of all processes on a lock file, see utils/sqlite_backend
+SQLITE_SERIALIZE_WRITES = (
+    os.environ.get("SQLITE_SERIALIZE_WRITES", "false").lower() == "true"
+)
+
+SQLITE_DATABASE = {
+    "ENGINE": (
+        "utils.sqlite_backend"
+        if SQLITE_SERIALIZE_WRITES
+        else "django.db.backends.sqlite3"
+    ),
+    "NAME": os.environ.get("DB_FILE", BASE_DIR / "db.sqlite3"),
+    "OPTIONS": {
+        "init_command": ";".join(
+            f"PRAGMA {name}={value}" for name, value in SQLITE_PRAGMAS.items()
+        ),
+        "transaction_mode": "IMMEDIATE",
+        "timeout": SQLITE_BUSY_TIMEOUT,
+    },
+}
+
+# DB_ENGINE=postgres uses PostgreSQL (needs the "postgres" extra), each process
+# (web, scheduler, render worker) keeping a pool of POSTGRES_POOL_MIN_SIZE to
+# POSTGRES_POOL_MAX_SIZE connections
+POSTGRES_DATABASE = {
+    "ENGINE": "django.db.backends.postgresql",
+    "NAME": os.environ.get("POSTGRES_DB", "trmnl"),
+    "USER": os.environ.get("POSTGRES_USER", "trmnl"),
+    "PASSWORD": os.environ.get("POSTGRES_PASSWORD", ""),
+    "HOST": os.environ.get("POSTGRES_HOST", "localhost"),
+    "PORT": os.environ.get("POSTGRES_PORT", "5432"),
+    # Pooled connections are handed back to the pool after each request
+    "CONN_MAX_AGE": 0,
+    "OPTIONS": {
+        "pool": {
+            "min_size": int(os.environ.get("POSTGRES_POOL_MIN_SIZE", 2)),
+            "max_size": int(os.environ.get("POSTGRES_POOL_MAX_SIZE", 10)),
+            # Seconds to wait for a free connection before failing
+            "timeout": int(os.environ.get("POSTGRES_POOL_TIMEOUT", 10)),
+        },
+    },
+}
+
 DATABASES = {
-    "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": os.environ.get("DB_FILE", BASE_DIR / "db.sqlite3"),
-    }
+    "default": (
+        POSTGRES_DATABASE
+        if os.environ.get("DB_ENGINE", "sqlite") == "postgres"
+        else SQLITE_DATABASE
+    )
 }
 
 
@@ -135,6 +208,93 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 # application specific
 PW_SERVER = os.environ.get("PW_SERVER")
 
+# "inline": screens are rendered by the job (or request) creating them.
+# "worker": they are queued for the render worker (`manage.py renderworker`).
+RENDER_MODE = os.environ.get("RENDER_MODE", "inline")
+# Browser pages rendering concurrently in the render worker
+RENDER_WORKER_PAGES = int(os.environ.get("RENDER_WORKER_PAGES", 4))
+# Processes dithering screenshots, defaults to the number of CPUs
+RENDER_WORKER_PROCESSES = int(os.environ.get("RENDER_WORKER_PROCESSES", 0)) or None
+RENDER_WORKER_POLL_INTERVAL = float(os.environ.get("RENDER_WORKER_POLL_INTERVAL", 1))
+# A claimed screen not rendered after this many seconds can be claimed again
+RENDER_WORKER_CLAIM_TIMEOUT = int(os.environ.get("RENDER_WORKER_CLAIM_TIMEOUT", 120))
+# Default deadline (in seconds) of each browser operation of a render
+RENDER_TIMEOUT = int(os.environ.get("RENDER_TIMEOUT", 30))
+# Longest wait (in seconds) for fonts, images and the page "ready" signal before
+# capturing the page as is
+RENDER_READY_TIMEOUT = float(os.environ.get("RENDER_READY_TIMEOUT", 5))
+
+# Verified API and device keys are cached in process (up to API_KEY_CACHE_SIZE
+# keys) and in CACHES for API_KEY_CACHE_TTL seconds, which is also how long other
+# processes keep accepting a deleted key
+API_KEY_CACHE_SIZE = int(os.environ.get("API_KEY_CACHE_SIZE", 1024))
+API_KEY_CACHE_TTL = int(os.environ.get("API_KEY_CACHE_TTL", 60))
+
+# Screens accepted by a single batch call of the generate_screen API
+RENDER_JOB_MAX_SCREENS = int(os.environ.get("RENDER_JOB_MAX_SCREENS", 100))
+# Deadline (in seconds) of the render job callbacks
+RENDER_JOB_CALLBACK_TIMEOUT = int(os.environ.get("RENDER_JOB_CALLBACK_TIMEOUT", 10))
+# Hosts the render job callbacks can be POSTed to, as ALLOWED_HOSTS (".example.com"
+# matches its subdomains): none by default, API users can't have the server call
+# the internal services (redis, the browser, cloud metadata...)
+RENDER_JOB_CALLBACK_HOSTS = [
+    host for host in os.environ.get("RENDER_JOB_CALLBACK_HOSTS", "").split(",") if host
+]
+# Logs returned by a call of the log search API
+LOG_SEARCH_MAX_RESULTS = int(os.environ.get("LOG_SEARCH_MAX_RESULTS", 100))
+
+# Retention (in days) of the telemetry rollups of each resolution, and of the
+# raw device logs (0 keeps them), see trmnl.models.telemetry.delete_old_telemetry
+TELEMETRY_RETENTION_DAYS = {
+    "minute": int(os.environ.get("TELEMETRY_MINUTE_RETENTION_DAYS", 2)),
+    "hour": int(os.environ.get("TELEMETRY_HOUR_RETENTION_DAYS", 90)),
+    "day": int(os.environ.get("TELEMETRY_DAY_RETENTION_DAYS", 730)),
+}
+DEVICE_LOG_RETENTION_DAYS = int(os.environ.get("DEVICE_LOG_RETENTION_DAYS", 7))
+# Time window (in hours) of the fleet telemetry API, unless given
+TELEMETRY_DEFAULT_WINDOW_HOURS = int(
+    os.environ.get("TELEMETRY_DEFAULT_WINDOW_HOURS", 24)
+)
+
+# Live preview sessions rendering at once (one browser context each), the next
+# ones wait for a free slot
+PREVIEW_MAX_SESSIONS = int(os.environ.get("PREVIEW_MAX_SESSIONS", 4))
+
+# Assets requested by the rendered pages (see trmnl/assets.py)
+RENDER_ASSET_CACHE = os.environ.get("RENDER_ASSET_CACHE", "true").lower() == "true"
+RENDER_ASSET_CACHE_DIR = os.environ.get(
+    "RENDER_ASSET_CACHE_DIR", Path(tempfile.gettempdir()) / "trmnl-render-cache"
+)
+RENDER_ASSET_CACHE_TTL = int(os.environ.get("RENDER_ASSET_CACHE_TTL", 24 * 3600))
+# Beyond this size, the least recently fetched remote assets are deleted from disk
+RENDER_ASSET_CACHE_MAX_SIZE_MB = int(
+    os.environ.get("RENDER_ASSET_CACHE_MAX_SIZE_MB", 256)
+)
+# Hosts whose /css, /js, /fonts, /images and /static URLs are our static files
+RENDER_STATIC_HOSTS = ["nginx", "localhost", "127.0.0.1"] + ALLOWED_HOSTS
+# Abort the requests to other hosts than the static ones and RENDER_ALLOWED_HOSTS
+RENDER_BLOCK_REQUESTS = (
+    os.environ.get("RENDER_BLOCK_REQUESTS", "false").lower() == "true"
+)
+RENDER_ALLOWED_HOSTS = [
+    host for host in os.environ.get("RENDER_ALLOWED_HOSTS", "").split(",") if host
+]
+
+# Consecutive upstream failures before a recipe stops calling it, and for how long
+CIRCUIT_BREAKER_FAILURE_THRESHOLD = int(
+    os.environ.get("CIRCUIT_BREAKER_FAILURE_THRESHOLD", 3)
+)
+CIRCUIT_BREAKER_COOLDOWN = int(os.environ.get("CIRCUIT_BREAKER_COOLDOWN", 300))
+# Recipes run in a pool of RECIPE_POOL_PROCESSES processes (0 runs them in the
+# worker), each call within RECIPE_CALL_TIMEOUT seconds and each process within
+# RECIPE_MEMORY_LIMIT_MB megabytes, see plugins/recipe_pool.py. The pool is kept
+# by `manage.py recipeworker`, the other processes run the recipes themselves
+RECIPE_POOL_PROCESSES = int(os.environ.get("RECIPE_POOL_PROCESSES", 2))
+RECIPE_CALL_TIMEOUT = int(os.environ.get("RECIPE_CALL_TIMEOUT", 60))
+RECIPE_MEMORY_LIMIT_MB = int(os.environ.get("RECIPE_MEMORY_LIMIT_MB", 512))
+# Versions of the data of each plugin kept, see plugins.models.DataSnapshot
+PLUGIN_SNAPSHOT_VERSIONS = int(os.environ.get("PLUGIN_SNAPSHOT_VERSIONS", 5))
+
 SECURE_PROXY_SSL_HEADER = ("HTTP_X_FORWARDED_PROTO", "https")
 
 CSRF_TRUSTED_ORIGINS = os.environ.get("CSRF_TRUSTED_ORIGINS", "").split(",")
@@ -150,6 +310,31 @@ SCREEN_REFRESH_SECONDS_BEFORE_EXPIRY = os.environ.get(
     "SCREEN_REFRESH_SECONDS_BEFORE_EXPIRY", 10
 )
 
+# The refresh rate sent to the devices is the time until their content changes
+# (next screen, start of a playlist), see Device.adaptive_refresh_rate, within
+# these bounds. Otherwise, it's the duration of the current screen.
+ADAPTIVE_REFRESH = os.environ.get("ADAPTIVE_REFRESH", "true").lower() == "true"
+ADAPTIVE_REFRESH_MIN_SECONDS = int(os.environ.get("ADAPTIVE_REFRESH_MIN_SECONDS", 60))
+ADAPTIVE_REFRESH_MAX_SECONDS = int(
+    os.environ.get("ADAPTIVE_REFRESH_MAX_SECONDS", 4 * 3600)
+)
+# Devices reporting a battery voltage below LOW_BATTERY_VOLTAGE (unset by
+# default) poll LOW_BATTERY_REFRESH_FACTOR times less often
+LOW_BATTERY_VOLTAGE = (
+    float(os.environ["LOW_BATTERY_VOLTAGE"])
+    if os.environ.get("LOW_BATTERY_VOLTAGE")
+    else None
+)
+LOW_BATTERY_REFRESH_FACTOR = float(os.environ.get("LOW_BATTERY_REFRESH_FACTOR", 2))
+# Devices due at the same time (e.g. set up together, or waiting for the same
+# playlist) are spread over this many seconds, each at its own phase, which
+# delays their polls and renders by up to as much
+POLL_SPREAD_SECONDS = int(os.environ.get("POLL_SPREAD_SECONDS", 60))
+
+# Per-request query count, DB time and slowest queries (header + log)
+QUERY_STATS = os.environ.get("QUERY_STATS", "false").lower() == "true"
+QUERY_STATS_SLOWEST = int(os.environ.get("QUERY_STATS_SLOWEST", 3))
+
 # Scheduler
 # SCHEDULER_QUEUES = {
 #     'default': {
@@ -176,13 +361,17 @@ SCHEDULER_CONFIG = {
     "DEFAULT_TIMEOUT": 300,  # 5 minutes
     "SCHEDULER_INTERVAL": 10,  # 10 seconds
 }
+# Plugin data is fetched on the "fetch" queue and screens are generated on the
+# "render" queue, each by its own workers (`manage.py recipeworker fetch`), so
+# that a slow upstream doesn't hold up the renders
 SCHEDULER_QUEUES = {
-    "default": {
+    queue: {
         "HOST": "redis",
         "PORT": 6379,
         "DB": 0,
         "DEFAULT_TIMEOUT": 360,
-    },
+    }
+    for queue in ("default", "fetch", "render")
 }
 
 
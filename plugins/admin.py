@@ -1,15 +1,20 @@
 from django.contrib import admin
 
-from .models import Plugin
+from .models import Plugin, generate_plugin_screen
+
 
 class PluginAdmin(admin.ModelAdmin):
-  actions = ["generate"]
+    actions = ["generate"]
+
+    def generate(self, request, queryset):
+        from trmnl.models import Device
 
-  def generate(self, request, queryset):
-    from trmnl.models import Device
-    device = Device.objects.first()
-    for obj in queryset.all():
-        obj.create_screen(device)
+        device = Device.objects.first()
+        # On the render queue: recipes and renders don't run in the web server
+        plugins = list(queryset.all())
+        for obj in plugins:
+            generate_plugin_screen.delay(str(obj.pk), device.pk)
+        self.message_user(request, f"{len(plugins)} screen(s) queued")
 
 
-admin.site.register(Plugin, PluginAdmin)
\ No newline at end of file
+admin.site.register(Plugin, PluginAdmin)
@@ -0,0 +1,89 @@
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger("plugins")
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an upstream that keeps failing."""
+
+
+class CircuitBreaker:
+    """
+    Stop calling a failing upstream for a cool-down period.
+
+    After `failure_threshold` consecutive failures the circuit opens: calls are
+    refused for `cooldown` seconds. After the cool-down, a single trial call
+    goes through (the first to take the trial lock with `cache.add`), the
+    others are still refused: its success closes the circuit and its failure
+    opens it again. A trial that never ends releases the lock after another
+    cool-down. The state lives in the Django cache, so it is shared by all the
+    workers using a shared cache backend.
+    """
+
+    def __init__(self, name, failure_threshold=None, cooldown=None):
+        self.name = name
+        self.failure_threshold = (
+            failure_threshold or settings.CIRCUIT_BREAKER_FAILURE_THRESHOLD
+        )
+        self.cooldown = cooldown or settings.CIRCUIT_BREAKER_COOLDOWN
+
+    def __str__(self):
+        return f"<CircuitBreaker {self.name}>"
+
+    @property
+    def cache_key(self):
+        return f"circuit-breaker:{self.name}"
+
+    @property
+    def failures_key(self):
+        return f"{self.cache_key}:failures"
+
+    @property
+    def trial_key(self):
+        return f"{self.cache_key}:trial"
+
+    def open_until(self):
+        """End of the cool-down (a timestamp), None when the circuit is closed"""
+        return cache.get(self.cache_key)
+
+    def is_open(self):
+        """Whether the circuit is in its cool-down"""
+        open_until = self.open_until()
+        return open_until is not None and open_until > time.time()
+
+    def check(self):
+        """
+        Raise CircuitOpenError unless the call can be made: the circuit is
+        closed, or the cool-down is over and this call is the trial.
+        """
+        open_until = self.open_until()
+        if open_until is None:
+            return
+        if open_until > time.time() or not cache.add(
+            self.trial_key, True, timeout=self.cooldown
+        ):
+            raise CircuitOpenError(f"Circuit {self.name} is open")
+
+    def record_success(self):
+        cache.delete_many([self.cache_key, self.failures_key, self.trial_key])
+
+    def record_failure(self):
+        # Counted atomically, failures of concurrent calls all count
+        cache.add(self.failures_key, 0, timeout=None)
+        try:
+            failures = cache.incr(self.failures_key)
+        except ValueError:
+            # Evicted in between
+            failures = 1
+            cache.set(self.failures_key, failures, timeout=None)
+        if failures >= self.failure_threshold:
+            cache.set(self.cache_key, time.time() + self.cooldown, timeout=None)
+            cache.delete(self.trial_key)
+            logger.warning(
+                f"Circuit {self.name} opened for {self.cooldown}s "
+                f"after {failures} failures"
+            )
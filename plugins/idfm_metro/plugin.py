@@ -1,11 +1,11 @@
 import zoneinfo
 
-import requests
 from django.template.loader import get_template
 from django.utils import timezone
 from django.utils.dateparse import parse_datetime
 
 from plugins.recipe import BaseRecipe
+from trmnl.canvas import WHITE
 
 
 class IdfmMetroRecipe(BaseRecipe):
@@ -40,13 +40,133 @@ class IdfmMetroRecipe(BaseRecipe):
     def timezone(self):
         return self.config.get("timezone", "Europe/Paris")
 
-    def generate_html(self):
+    # Next departures, refreshed every minute
+    fetch_interval = 60
+    # Rendered by the browser until the canvas (see draw) matches the browser
+    # renders of the fixtures (see CanvasFixturesTest), the
+    # "render_engine": "canvas" config draws the lines of times without it
+    render_engine = "browser"
+
+    def fetch_data(self):
+        return self.get_data()
+
+    def render_html(self, data):
+        tz = zoneinfo.ZoneInfo(self.timezone)
+        lines = self.map_arrival_times(
+            data, lambda at: timezone.localtime(at, tz).strftime("%H:%M")
+        )
         template = get_template("idfm_metro/full.html")
-        return template.render({"lines": self.get_data()})
+        return template.render({"lines": lines})
+
+    def draw(self, canvas, data):
+        """The layout of idfm_metro/full.html, see trmnl.canvas"""
+        tz = zoneinfo.ZoneInfo(self.timezone)
+        lines = self.map_arrival_times(
+            data, lambda at: timezone.localtime(at, tz).strftime("%H:%M")
+        )
+        gap, bottom = 10, canvas.height - 40
+        if not lines:
+            canvas.text(
+                gap,
+                bottom // 2 - 13,
+                "Aucun passage",
+                "BlockKie",
+                26,
+                align="center",
+                max_width=canvas.width - 2 * gap,
+            )
+        column_width = (canvas.width - 2 * gap) // max(len(lines), 1)
+        for index, line in enumerate(lines):
+            left = gap + index * column_width
+            width = column_width - gap
+            if index:
+                canvas.dotted_line(left, gap, bottom - gap, vertical=True)
+                canvas.dotted_line(left + 2, gap, bottom - gap, vertical=True)
+                left, width = left + 16, width - 16
+            self.draw_line(canvas, line, left, gap, width, bottom)
+        # Title bar
+        canvas.circle(gap + 14, bottom + 20, 14)
+        canvas.text(gap, bottom + 9, "M", "NicoBold", 16, WHITE, "center", 28)
+        canvas.text(gap + 38, bottom + 12, "Prochains passages du Métro")
+
+    @staticmethod
+    def draw_line(canvas, line, left, top, width, bottom):
+        canvas.circle(left + 20, top + 20, 20)
+        canvas.text(left, top + 7, line["code"], "BlockKie", 26, WHITE, "center", 40)
+        canvas.text(left + 50, top, line["name"], "BlockKie", 26, max_width=width - 50)
+        canvas.label(
+            left + 50,
+            top + 24,
+            f"depuis {line['stop_name']}",
+            "underline",
+            "NicoPups",
+            max_width=width - 50,
+        )
+        stops = line["next_stops"]
+        if not stops:
+            return
+        y = top + 52
+        first = stops[0]
+        canvas.text(left, y + 6, "1", "NicoPups")
+        canvas.text(left + 24, y, first["expected_arrival_time"], "BlockKie", 74)
+        y += 86
+        destination = canvas.label(
+            left + 24, y, line["destination"], "inverted", max_width=width - 24
+        )
+        status = "À l'heure" if first["status"] == "onTime" else "!! Retardé :'( !!"
+        canvas.label(
+            left + 32 + destination,
+            y,
+            status,
+            "underline",
+            max_width=max(width - 32 - destination, 0),
+        )
+        y += 30
+        canvas.dotted_line(left, y, width)
+        cell_width = width // 2
+        for number, stop in enumerate(stops[1:], start=2):
+            row, column = divmod(number - 2, 2)
+            x, cell_top = left + column * cell_width, y + 8 + row * 70
+            if cell_top + 66 > bottom:
+                break
+            canvas.text(x, cell_top + 4, str(number), "NicoPups")
+            canvas.text(x + 24, cell_top, stop["expected_arrival_time"], "BlockKie", 38)
+            canvas.label(
+                x + 24,
+                cell_top + 44,
+                line["destination"],
+                "outline",
+                max_width=cell_width - 32,
+            )
+
+    def fingerprint(self, data):
+        """The departures, to the minute as they are displayed"""
+        return self.map_arrival_times(
+            data, lambda at: at.replace(second=0, microsecond=0).isoformat()
+        )
+
+    @staticmethod
+    def map_arrival_times(data, function):
+        """A copy of the lines, with `function` applied to the arrival times"""
+        return [
+            {
+                **line,
+                "next_stops": [
+                    {
+                        **stop,
+                        "expected_arrival_time": function(
+                            parse_datetime(stop["expected_arrival_time"])
+                        ),
+                    }
+                    for stop in line["next_stops"]
+                ],
+            }
+            for line in data
+        ]
 
     def fetch_stop_monitoring(self, stop_id):
         next_stops = []
-        response = requests.get(
+        response = self.get(
             "https://prim.iledefrance-mobilites.fr/marketplace/stop-monitoring",
             params={"MonitoringRef": f"STIF:StopPoint:Q:{stop_id}:"},
             headers={"apikey": self.api_key},
@@ -71,7 +191,7 @@ class IdfmMetroRecipe(BaseRecipe):
         return next_stops
 
     def get_data(self):
-        timezone.activate(zoneinfo.ZoneInfo(self.timezone))
+        """The next departures of each line, at their upstream arrival times"""
         data = []
         for line in self.lines:
             line_data = {"name": line["name"], "code": line["code"], "next_stops": []}
@@ -84,10 +204,6 @@ class IdfmMetroRecipe(BaseRecipe):
             for stop in stop_data:
                 del stop["stop_name"]
                 del stop["destination_name"]
-                local_datetime = timezone.localtime(
-                    parse_datetime(stop["expected_arrival_time"])
-                )
-                stop["expected_arrival_time"] = local_datetime.strftime("%H:%M")
             line_data["next_stops"] = stop_data
             if "stop_name" not in line_data:
                 line_data["stop_name"] = stop_name
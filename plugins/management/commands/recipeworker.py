@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from django.db import connections
+from scheduler.tools import get_queues
+
+from plugins.recipe_worker import RecipeWorker
+
+
+class Command(BaseCommand):
+    help = (
+        "Run the jobs of the queues (fetch and render stages) with a recipe pool "
+        "kept warm from one job to the next."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "queues", nargs="*", default=["default"], help="Queues to work on"
+        )
+        parser.add_argument("--name", help="Name of the worker")
+        parser.add_argument(
+            "--burst", action="store_true", help="Stop once the queues are empty"
+        )
+
+    def handle(self, *args, **options):
+        queues = get_queues(*options["queues"])
+        worker = RecipeWorker(
+            queues, connection=queues[0].connection, name=options["name"]
+        )
+        # Not shared with the scheduler process forked by the worker
+        connections.close_all()
+        worker.work(burst=options["burst"])
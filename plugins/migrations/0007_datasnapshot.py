@@ -0,0 +1,74 @@
+# Generated by Django 5.1.15 on 2026-10-19 12:15
+
+import django.core.serializers.json
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("plugins", "0006_remove_plugin_id_alter_plugin_uuid"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DataSnapshot",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "config_hash",
+                    models.CharField(max_length=64, verbose_name="Config hash"),
+                ),
+                ("version", models.PositiveIntegerField(verbose_name="Version")),
+                (
+                    "data",
+                    models.JSONField(
+                        blank=True,
+                        encoder=django.core.serializers.json.DjangoJSONEncoder,
+                        null=True,
+                    ),
+                ),
+                (
+                    "data_hash",
+                    models.CharField(max_length=64, verbose_name="Data hash"),
+                ),
+                (
+                    "fetched_at",
+                    models.DateTimeField(
+                        help_text="Last fetch of this data, the same since the version",
+                        verbose_name="Fetched at",
+                    ),
+                ),
+                (
+                    "plugin",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="snapshots",
+                        to="plugins.plugin",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Data snapshot",
+                "verbose_name_plural": "Data snapshots",
+                "ordering": ["plugin", "config_hash", "-version"],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("plugin", "config_hash", "version"),
+                        name="snapshot_version_uniq",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -1,21 +1,44 @@
+import datetime
+import hashlib
 import importlib
 import inspect
+import json
 import logging
 import sys
 import uuid
 
-from django.db import models
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, models, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.functional import cached_property
 from django.utils.translation import gettext_lazy as _
 from scheduler import job
+from scheduler.models.task import Task, TaskArg, TaskType
+from scheduler.queues import get_queue
 
-from trmnl.models import Screen
+from trmnl.models import Device, PlaylistItem, Screen
 from utils.model_utils import TimeStampedModel
 
+from .recipe_pool import run_recipe
 from .utils import get_full_class_path
 
 logger = logging.getLogger("plugins")
 
 
+# A snapshot not refreshed for this many fetch intervals (the fetch stage is
+# late or not running) is fetched again by the render stage
+SNAPSHOT_STALE_INTERVALS = 2
+
+
+def json_hash(data):
+    return hashlib.sha256(
+        json.dumps(data, sort_keys=True, cls=DjangoJSONEncoder).encode()
+    ).hexdigest()
+
+
 plugin_choices = [
     (get_full_class_path(y), x)
     for (x, y) in inspect.getmembers(sys.modules["plugins"], inspect.isclass)
@@ -57,16 +80,353 @@ class Plugin(TimeStampedModel):
     def generate_html(self):
         return self.get_recipe().generate_html()
 
+    def run_recipe(self, method, *args):
+        """Call a method of the recipe in the recipe pool, see recipe_pool"""
+        return run_recipe(self.recipe, self.config, method, *args)
+
+    @property
+    def config_hash(self):
+        return json_hash(self.config or {})
+
+    def latest_snapshot(self):
+        return (
+            self.snapshots.filter(config_hash=self.config_hash)
+            .order_by("-version")
+            .first()
+        )
+
+    def fetch_snapshot(self, recipe=None):
+        """
+        Fetch the data of the recipe and store it as a new version of the
+        snapshot, unless its fingerprint (see BaseRecipe.fingerprint) didn't
+        change. Older versions beyond
+        PLUGIN_SNAPSHOT_VERSIONS, and those of previous configs, are deleted.
+        :return: (the latest snapshot, whether it's a new version)
+        """
+        recipe = recipe or self.get_recipe()
+        data = self.run_recipe("fetch_data")
+        config_hash, data_hash = self.config_hash, json_hash(recipe.fingerprint(data))
+        now = timezone.now()
+        latest = self.latest_snapshot()
+        if latest is not None and latest.data_hash == data_hash:
+            DataSnapshot.objects.filter(pk=latest.pk).update(fetched_at=now)
+            latest.fetched_at = now
+            return latest, False
+        try:
+            with transaction.atomic():
+                snapshot = DataSnapshot.objects.create(
+                    plugin=self,
+                    config_hash=config_hash,
+                    version=latest.version + 1 if latest else 1,
+                    data=data,
+                    data_hash=data_hash,
+                    fetched_at=now,
+                )
+        except IntegrityError:
+            # Fetched at the same time by another job
+            return self.latest_snapshot(), False
+        self.snapshots.exclude(config_hash=config_hash).delete()
+        self.snapshots.filter(
+            version__lte=snapshot.version - settings.PLUGIN_SNAPSHOT_VERSIONS
+        ).delete()
+        logger.info(f"{self}: data snapshot version {snapshot.version}")
+        return snapshot, True
+
+    def get_snapshot(self, recipe=None):
+        """
+        The latest snapshot of the plugin data, fetched here only when there is
+        none yet. When the fetch stage is late (see SNAPSHOT_STALE_INTERVALS),
+        the latest snapshot is still used, and the fetch stage is (re)started
+        on its own queue: the render stage never waits for the upstream.
+        """
+        recipe = recipe or self.get_recipe()
+        snapshot = self.latest_snapshot()
+        interval = recipe.get_fetch_interval()
+        now = timezone.now()
+        if snapshot is None:
+            snapshot, _changed = self.fetch_snapshot(recipe)
+            if interval:
+                self.schedule_fetch(now + datetime.timedelta(seconds=interval))
+        elif interval and snapshot.fetched_at <= now - datetime.timedelta(
+            seconds=interval * SNAPSHOT_STALE_INTERVALS
+        ):
+            logger.warning(f"{self}: data snapshot is stale, fetching it again")
+            self.schedule_fetch(now)
+        return snapshot
+
+    def is_displayed(self):
+        """Whether an active playlist item of an active playlist shows it."""
+        return PlaylistItem.objects.filter(
+            plugin=self, is_active=True, playlist__is_active=True
+        ).exists()
+
+    def schedule_fetch(self, eta):
+        """Schedule the next fetch of the plugin data, on the "fetch" queue."""
+        task_identifier = f"Data Fetch for Plugin {self.name} ({self.uuid})"
+        (task, created) = Task.objects.update_or_create(
+            name=task_identifier,
+            task_type=TaskType.ONCE,
+            callable="plugins.models.fetch_plugin_data",
+            defaults={
+                "enabled": True,
+                "queue": "fetch",
+                "result_ttl": 1800,
+                "scheduled_time": eta,
+            },
+        )
+        if created:
+            TaskArg.objects.create(
+                arg_type=TaskArg.ArgType.STR,
+                val=str(self.uuid),
+                object_id=task.id,
+                content_object=task,
+                content_type=ContentType.objects.get_for_model(task),
+            )
+        logger.info(f"Next data fetch of {self} at {eta}")
+
     def create_screen(self, device, **kwargs):
         """
-        Create a screen for the device using the plugin recipe.
+        Create a screen for the device from the latest data snapshot of the
+        plugin. When the device already shows the screen of the playlist item
+        with the same fingerprint, it keeps it (see unchanged_screen). A screen
+        already rendered with the same fingerprint for another device or item
+        is copied instead: neither the template nor the browser are run again.
+        If the recipe or the render fails (upstream down, deadline exceeded,
+        open circuit breaker...), the last good screen of the playlist item is
+        reused instead, when there is one.
         :param device: Device
         :param kwargs: Additional kwargs to pass to the Screen object
         :return: Screen
         """
-        plugin_instance = self.get_recipe()
-        html = plugin_instance.generate_html()
-        screen = Screen.objects.create(device=device, html=html, **kwargs)
-        screen.generate_screen()
+        screen = None
+        playlist_item = kwargs.get("playlist_item")
+        try:
+            plugin_instance = self.get_recipe()
+            snapshot = self.get_snapshot(plugin_instance)
+            current = self.unchanged_screen(device, playlist_item, snapshot.fingerprint)
+            if current is not None:
+                return current
+            rendered = (
+                Screen.objects.filter(fingerprint=snapshot.fingerprint, generated=True)
+                .with_data("html", "screen", "screen_png", "screen_rle")
+                .order_by("-created_at")
+                .first()
+            )
+            if rendered is not None:
+                return self.copy_screen(rendered, device, playlist_item)
+            if plugin_instance.get_render_engine() == "canvas":
+                # Drawn in a few milliseconds, without the browser
+                bitmap = self.run_recipe("render_bitmap", snapshot.data)
+                screen = Screen.objects.create(
+                    device=device,
+                    fingerprint=snapshot.fingerprint,
+                    **kwargs,
+                )
+                return screen.store_bitmap(bitmap)
+            html = self.run_recipe("render_html", snapshot.data)
+            screen = Screen.objects.create(
+                device=device,
+                html=html,
+                fingerprint=snapshot.fingerprint,
+                **kwargs,
+            )
+            return screen.request_render()
+        except Exception:
+            if screen is not None and screen.pk:
+                screen.delete()
+            fallback = self.reuse_last_screen(device, playlist_item)
+            if fallback is None:
+                raise
+            logger.warning(
+                f"{self} failed for device #{device.id}, "
+                f"reusing the last good screen as #{fallback.id}",
+                exc_info=True,
+            )
+            return fallback
+
+    @staticmethod
+    def unchanged_screen(device, playlist_item, fingerprint):
+        """
+        The screen the device shows, when it's the one of the playlist item
+        with this fingerprint: the device keeps it, without a download or an
+        e-ink refresh, and the render is counted as skipped.
+        """
+        current = Screen.objects.filter(
+            pk__in=Device.objects.filter(pk=device.pk).values("current_screen"),
+            playlist_item=playlist_item,
+            fingerprint=fingerprint,
+        ).first()
+        if current is not None:
+            logger.info(f"Device #{device.id} already shows screen #{current.id}")
+            Device.objects.filter(pk=device.pk).update(
+                skipped_renders=F("skipped_renders") + 1
+            )
+        return current
+
+    @staticmethod
+    def copy_screen(source, device, playlist_item):
+        """Copy a generated screen as a new screen of the device."""
+        screen = Screen.objects.create(
+            device=device,
+            html=source.html,
+            screen=source.screen,
+            screen_png=source.screen_png,
+            screen_rle=source.screen_rle,
+            fingerprint=source.fingerprint,
+            generated=True,
+            playlist_item=playlist_item,
+        )
+        screen.make_current()
         return screen
 
+    @classmethod
+    def reuse_last_screen(cls, device, playlist_item):
+        """
+        The last generated screen of a playlist item, kept as is when the
+        device already shows it, copied as a new screen of the device otherwise.
+        """
+        if playlist_item is None:
+            return None
+        last_screen = (
+            playlist_item.screens.filter(generated=True).order_by("-created_at").first()
+        )
+        if last_screen is None:
+            return None
+        if Device.objects.filter(pk=device.pk, current_screen=last_screen).exists():
+            return last_screen
+        last_screen.refresh_from_db(
+            fields=["html", "screen", "screen_png", "screen_rle"]
+        )
+        return cls.copy_screen(last_screen, device, playlist_item)
+
+
+class DataSnapshot(TimeStampedModel):
+    """
+    A version of the data fetched by the recipe of a plugin (see
+    BaseRecipe.fetch_data), shared by all the playlist items of the plugin.
+    A new version is stored only when the data changes, screens are rendered
+    from the latest version of the current config. Screens aren't linked to
+    the snapshot they were rendered from, but carry its fingerprint.
+    """
+
+    plugin = models.ForeignKey(
+        Plugin, on_delete=models.CASCADE, related_name="snapshots"
+    )
+    config_hash = models.CharField(verbose_name=_("Config hash"), max_length=64)
+    version = models.PositiveIntegerField(verbose_name=_("Version"))
+    data = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    data_hash = models.CharField(verbose_name=_("Data hash"), max_length=64)
+    fetched_at = models.DateTimeField(
+        verbose_name=_("Fetched at"),
+        help_text=_("Last fetch of this data, the same since the version"),
+    )
+
+    class Meta:
+        verbose_name = _("Data snapshot")
+        verbose_name_plural = _("Data snapshots")
+        ordering = ["plugin", "config_hash", "-version"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["plugin", "config_hash", "version"],
+                name="snapshot_version_uniq",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.plugin} - version {self.version}"
+
+    @cached_property
+    def fingerprint(self):
+        """
+        What the screens rendered from this snapshot show, see Screen: its data
+        drawn by the render engine of the recipe, which a new default of the
+        recipe changes without changing the config.
+        """
+        engine = self.plugin.get_recipe().get_render_engine()
+        return json_hash(
+            [str(self.plugin_id), self.config_hash, self.data_hash, engine]
+        )
+
+
+#################
+## Plugin Jobs ##
+#################
+
+
+@job("fetch")
+def fetch_plugin_data(plugin_id):
+    """
+    The fetch stage: store a new snapshot of the plugin data when it changed,
+    have it rendered, and schedule the next fetch, every fetch interval of
+    the recipe, as long as the plugin is in an active playlist (the render
+    stage starts it again otherwise, see get_snapshot).
+    """
+    plugin = Plugin.objects.get(pk=plugin_id)
+    recipe = plugin.get_recipe()
+    interval = recipe.get_fetch_interval()
+    try:
+        snapshot, changed = plugin.fetch_snapshot(recipe)
+        if changed:
+            render_snapshot.delay(snapshot.pk)
+    finally:
+        if interval and plugin.is_displayed():
+            plugin.schedule_fetch(timezone.now() + datetime.timedelta(seconds=interval))
+        elif interval:
+            logger.info(f"{plugin} is in no active playlist, data fetch stopped")
+
+
+@job("render")
+def generate_plugin_screen(plugin_id, device_id, playlist_item_id=None):
+    """Create a screen of the plugin for the device, see Plugin.create_screen"""
+    plugin = Plugin.objects.get(pk=plugin_id)
+    playlist_item = None
+    if playlist_item_id is not None:
+        playlist_item = PlaylistItem.objects.filter(pk=playlist_item_id).first()
+        if playlist_item is None:
+            logger.info(f"Playlist item {playlist_item_id} deleted, not rendering")
+            return
+    screen = plugin.create_screen(
+        Device.objects.get(pk=device_id), playlist_item=playlist_item
+    )
+    logger.info(f"Generated screen #{screen.id} of {plugin} for device #{device_id}")
+
+
+@job("render")
+def render_snapshot(snapshot_id):
+    """
+    The render stage of a new snapshot: have it rendered for the devices
+    showing a screen of the plugin from a playlist active now, without waiting
+    for their next screen. Each device is rendered by its own job, at its slot
+    (see Device.spread), so that the renders of a snapshot don't all start at
+    once.
+    """
+    snapshot = (
+        DataSnapshot.objects.select_related("plugin").filter(pk=snapshot_id).first()
+    )
+    if snapshot is None or snapshot != snapshot.plugin.latest_snapshot():
+        logger.info(f"Data snapshot #{snapshot_id} superseded, not rendering it")
+        return
+    shown = dict(
+        Device.objects.filter(
+            current_screen__playlist_item__plugin=snapshot.plugin,
+            current_screen__playlist_item__is_active=True,
+        )
+        .exclude(current_screen__fingerprint=snapshot.fingerprint)
+        .values_list("pk", "current_screen__playlist_item")
+    )
+    devices = Device.objects.in_bulk(shown.keys())
+    items = PlaylistItem.objects.select_related("playlist").in_bulk(shown.values())
+    queue = get_queue("render")
+    now = timezone.now()
+    for device_id, item_id in shown.items():
+        if not items[item_id].playlist.is_active_at(now):
+            continue
+        eta = devices[device_id].spread(now)
+        queue.enqueue_at(
+            eta,
+            generate_plugin_screen,
+            str(snapshot.plugin_id),
+            device_id,
+            str(item_id),
+        )
+        logger.info(f"Rendering snapshot {snapshot} for device #{device_id} at {eta}")
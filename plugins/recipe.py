@@ -1,14 +1,126 @@
+import time
+from urllib.parse import urlsplit
+
+import requests
+from django.conf import settings
+
+from trmnl.canvas import Canvas
+
+from .circuit_breaker import CircuitBreaker
+
+
 class BaseRecipe:
+    # Deadlines in seconds, can be overridden in the plugin config with the
+    # "fetch_timeout" and "render_timeout" keys.
+    # fetch_timeout is shared by all the upstream requests of a fetch, counted
+    # from the first one
+    fetch_timeout = 10
+    # render_timeout applies to each browser operation of the render
+    render_timeout = None
+    # "browser": the HTML of render_html is rendered by the browser, "canvas":
+    # `draw` paints the screen in Python (see trmnl.canvas), can be overridden
+    # in the plugin config with the "render_engine" key
+    render_engine = "browser"
+    # Seconds between two fetches of the upstream data ("fetch_interval" key),
+    # None for recipes without upstream data
+    fetch_interval = 300
+
     def __init__(self, config):
         self.config = config
+        # Set by the first upstream request, see remaining_fetch_time
+        self.fetch_deadline = None
 
-    def generate_html(self):
+    def fetch_data(self):
+        """
+        Fetch the upstream data of the recipe, stored as a snapshot (see
+        plugins.models.DataSnapshot): anything JSON serializable.
+        """
+        return None
+
+    def render_html(self, data):
+        """Render the HTML of the screen from the data of a snapshot."""
+        raise NotImplementedError
+
+    def draw(self, canvas, data):
+        """Paint the screen from the data of a snapshot, see trmnl.canvas."""
         raise NotImplementedError
 
+    def render_bitmap(self, data):
+        """The BMP drawn by `draw`, for the "canvas" render engine"""
+        canvas = Canvas()
+        self.draw(canvas, data)
+        return canvas.to_bmp()
+
+    def fingerprint(self, data):
+        """
+        What the screen shows of the data (anything JSON serializable): the
+        screen isn't rendered again as long as it's the same. The data itself
+        by default, recipes can leave out what isn't displayed.
+        """
+        return data
+
+    def generate_html(self):
+        return self.render_html(self.fetch_data())
+
+    def get_render_engine(self):
+        return self.config.get("render_engine", self.render_engine)
+
+    def get_fetch_interval(self):
+        return self.config.get("fetch_interval", self.fetch_interval)
+
+    def get_fetch_timeout(self):
+        return self.config.get("fetch_timeout", self.fetch_timeout)
+
+    def get_render_timeout(self):
+        return self.config.get(
+            "render_timeout", self.render_timeout or settings.RENDER_TIMEOUT
+        )
+
+    def remaining_fetch_time(self):
+        """
+        Seconds left before the fetch deadline, which starts with the first
+        upstream request of the recipe (a new recipe per fetch, see
+        recipe_pool.call_recipe).
+        """
+        now = time.monotonic()
+        if self.fetch_deadline is None:
+            self.fetch_deadline = now + self.get_fetch_timeout()
+        return self.fetch_deadline - now
+
+    def get(self, url, **kwargs):
+        """
+        `requests.get` within the recipe fetch deadline, behind a circuit
+        breaker per upstream host: once a host keeps failing, calls fail
+        immediately with CircuitOpenError until its cool-down is over.
+        """
+        remaining = self.remaining_fetch_time()
+        if remaining <= 0:
+            raise requests.Timeout(
+                f"Fetch deadline of {self.get_fetch_timeout()}s exceeded"
+            )
+        breaker = CircuitBreaker(urlsplit(url).netloc)
+        breaker.check()
+        kwargs["timeout"] = min(kwargs.get("timeout", remaining), remaining)
+        try:
+            response = requests.get(url, **kwargs)
+        except requests.RequestException:
+            breaker.record_failure()
+            raise
+        if response.status_code >= 500:
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+        return response
+
     def __str__(self):
         return f"<Recipe {self.__class__.__name__}>"
 
 
 class StaticHTMLRecipe(BaseRecipe):
-    def generate_html(self):
+    fetch_interval = None
+
+    def render_html(self, data):
+        return self.config["html"]
+
+    def fingerprint(self, data):
         return self.config["html"]
@@ -0,0 +1,206 @@
+"""
+Recipes run in a pool of child processes, so that CPU heavy recipes use all the
+cores and a misbehaving one can't stall or bloat the worker running the job.
+
+Each call is limited to RECIPE_CALL_TIMEOUT seconds, and each process to
+RECIPE_MEMORY_LIMIT_MB megabytes on top of what it inherits. The processes are
+forked from the worker, with Django and the recipes already imported. Recipes
+get their config and data, and return JSON data or HTML: they must not use the
+database. RECIPE_POOL_PROCESSES=0 runs them in the calling process instead.
+
+The pool is kept warm from one job to the next by a long-lived process, the
+recipe worker (`manage.py recipeworker`), between start_recipe_pool and
+stop_recipe_pool. Other processes (the web server, the job processes forked by
+`rqworker`, a shell) call the recipes themselves, with the time limit only:
+a pool started there would be lost, and its processes orphaned, when they exit.
+"""
+
+import contextlib
+import importlib
+import logging
+import multiprocessing
+import os
+import signal
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from django.utils import timezone, translation
+
+logger = logging.getLogger("plugins")
+
+# Extra time given to a process before it's killed, when the call overruns its
+# time limit where it can't be interrupted (e.g. in C code)
+KILL_GRACE_SECONDS = 5
+
+
+class RecipeTimeout(TimeoutError):
+    """Raised when a recipe call takes longer than its time limit."""
+
+
+def address_space():
+    """Size of the address space of the process in bytes, None if unknown"""
+    try:
+        with open("/proc/self/statm") as statm:
+            pages = int(statm.read().split()[0])
+    except (OSError, ValueError, IndexError):
+        return None
+    return pages * os.sysconf("SC_PAGE_SIZE")
+
+
+def limit_memory(megabytes):
+    """Limit the memory the process can allocate on top of its current size."""
+    try:
+        import resource
+    except ImportError:
+        return
+    current = address_space()
+    if not megabytes or current is None:
+        return
+    _soft, hard = resource.getrlimit(resource.RLIMIT_AS)
+    limit = current + megabytes * 1024 * 1024
+    if hard != resource.RLIM_INFINITY:
+        limit = min(limit, hard)
+    resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
+
+
+def init_process(memory_limit, recipes):
+    limit_memory(memory_limit)
+    # Already imported when forked, loaded once per process otherwise
+    for recipe in recipes:
+        importlib.import_module(recipe.rsplit(".", 1)[0])
+
+
+@contextlib.contextmanager
+def time_limit(seconds):
+    """
+    Interrupt the block after `seconds`, in the main thread only. A timer
+    already armed (e.g. the timeout of the rq job) is kept when it's due
+    first, and armed again with the time left otherwise.
+    """
+    if not seconds or threading.current_thread() is not threading.main_thread():
+        yield
+        return
+    outer_delay, outer_interval = signal.getitimer(signal.ITIMER_REAL)
+    if outer_delay and outer_delay <= seconds:
+        yield
+        return
+
+    def interrupt(signum, frame):
+        raise RecipeTimeout(f"Recipe call exceeded {seconds}s")
+
+    start = time.monotonic()
+    previous = signal.signal(signal.SIGALRM, interrupt)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+        if outer_delay:
+            # Fires right away if it's already past
+            remaining = outer_delay - (time.monotonic() - start)
+            signal.setitimer(signal.ITIMER_REAL, max(remaining, 0.001), outer_interval)
+
+
+def call_recipe(recipe_path, config, method, args, timeout):
+    """
+    Call a method of a recipe within its time limit. The time zone and the
+    language a recipe activates don't leak to the next calls.
+    """
+    module, class_name = recipe_path.rsplit(".", 1)
+    recipe = getattr(importlib.import_module(module), class_name)(config)
+    try:
+        with time_limit(timeout):
+            return getattr(recipe, method)(*args)
+    finally:
+        timezone.deactivate()
+        translation.deactivate()
+
+
+recipe_pool = None
+# The process the pool was started for, see start_recipe_pool
+recipe_pool_pid = None
+
+
+def start_recipe_pool():
+    """Run the recipe calls of this process in the pool, until stop_recipe_pool."""
+    global recipe_pool_pid
+    recipe_pool_pid = os.getpid()
+
+
+def stop_recipe_pool():
+    """Shut the pool down and wait for its processes to exit."""
+    global recipe_pool_pid
+    reset_recipe_pool(wait=True)
+    recipe_pool_pid = None
+
+
+def get_recipe_pool():
+    """
+    The pool of the process, created on first use (and after a reset), None
+    when the pool wasn't started for this process (e.g. in a forked child).
+    """
+    global recipe_pool
+    if recipe_pool_pid != os.getpid():
+        return None
+    if recipe_pool is None:
+        from .models import plugin_choices
+
+        methods = multiprocessing.get_all_start_methods()
+        recipe_pool = ProcessPoolExecutor(
+            max_workers=settings.RECIPE_POOL_PROCESSES,
+            mp_context=multiprocessing.get_context(
+                "fork" if "fork" in methods else "spawn"
+            ),
+            initializer=init_process,
+            initargs=(
+                settings.RECIPE_MEMORY_LIMIT_MB,
+                [recipe for recipe, _name in plugin_choices],
+            ),
+        )
+    return recipe_pool
+
+
+def reset_recipe_pool(kill=False, wait=False):
+    """
+    Shut the pool down, and kill its processes with `kill`: the next call
+    starts a new one.
+    """
+    global recipe_pool
+    if recipe_pool is None:
+        return
+    if kill:
+        for process in list(recipe_pool._processes.values()):
+            process.kill()
+    recipe_pool.shutdown(wait=wait, cancel_futures=True)
+    recipe_pool = None
+
+
+def run_recipe(recipe_path, config, method, *args):
+    """
+    Call `method` of the recipe with `args` in the pool, with the per-call
+    limits, and return its result (data or HTML).
+    """
+    timeout = settings.RECIPE_CALL_TIMEOUT
+    pool = get_recipe_pool() if settings.RECIPE_POOL_PROCESSES else None
+    if pool is None:
+        return call_recipe(recipe_path, config, method, args, timeout)
+    future = pool.submit(call_recipe, recipe_path, config, method, args, timeout)
+    try:
+        return future.result(timeout + KILL_GRACE_SECONDS if timeout else None)
+    except RecipeTimeout:
+        # Interrupted in the process, which is still usable
+        raise
+    except FutureTimeoutError:
+        logger.warning(f"{recipe_path}.{method} is stuck, restarting the recipe pool")
+        reset_recipe_pool(kill=True)
+        raise RecipeTimeout(f"Recipe call exceeded {timeout}s")
+    except BrokenProcessPool:
+        # A process died (e.g. killed by the system), the pool is unusable
+        logger.warning(f"{recipe_path}.{method} broke the recipe pool, restarting it")
+        reset_recipe_pool()
+        raise
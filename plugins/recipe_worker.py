@@ -0,0 +1,36 @@
+import logging
+
+from django.db import close_old_connections
+from scheduler.rq_classes import DjangoWorker
+
+from .recipe_pool import start_recipe_pool, stop_recipe_pool
+
+logger = logging.getLogger("plugins")
+
+
+class RecipeWorker(DjangoWorker):
+    """
+    Run the jobs of the queues in the worker process itself, instead of a
+    process forked for each job, so that the recipe pool (see recipe_pool)
+    stays warm from one job to the next.
+    """
+
+    def __init__(self, queues, **kwargs):
+        kwargs["fork_job_execution"] = False
+        super().__init__(queues, **kwargs)
+
+    def execute_job(self, job, queue):
+        # Not closed at the end of the job process as with forked jobs
+        close_old_connections()
+        try:
+            super().execute_job(job, queue)
+        finally:
+            close_old_connections()
+
+    def work(self, **kwargs):
+        start_recipe_pool()
+        try:
+            return super().work(**kwargs)
+        finally:
+            logger.info("Recipe worker stopped, shutting the recipe pool down")
+            stop_recipe_pool()
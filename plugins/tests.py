@@ -1,3 +1,650 @@
-from django.test import TestCase
+import datetime
+import os
+import signal
+import time
+import unittest
+from unittest import mock
 
-# Create your tests here.
+import requests
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from rq.timeouts import JobTimeoutException, UnixSignalDeathPenalty
+from scheduler.models.task import Task
+
+from plugins.circuit_breaker import CircuitBreaker, CircuitOpenError
+from plugins.idfm_metro import IdfmMetroRecipe
+from plugins.models import DataSnapshot, Plugin, fetch_plugin_data, render_snapshot
+from plugins.recipe import BaseRecipe, StaticHTMLRecipe
+from plugins.recipe_pool import (
+    RecipeTimeout,
+    get_recipe_pool,
+    run_recipe,
+    start_recipe_pool,
+    stop_recipe_pool,
+    time_limit,
+)
+from trmnl import render
+from trmnl.bitmap import Bitmap
+from trmnl.models import PlaylistItem, Screen
+from trmnl.tests.fixtures import SAMPLE_BITMAP, create_fleet
+from utils.weekday_field import Weekday
+
+# A white screen, different from the screens of the fleet
+WHITE_BITMAP = Bitmap(800, 480, [(1 << 800) - 1] * 480).to_bmp()
+# Pixels that may differ between the canvas and the browser renders of a screen
+# (antialiasing, dithering, rounding of the font metrics)
+RENDER_COMPARE_TOLERANCE = 0.08
+
+
+def idfm_line(name, code, destination, *times, status="onTime"):
+    return {
+        "name": name,
+        "code": code,
+        "stop_name": "Bastille",
+        "destination": destination,
+        "next_stops": [{"expected_arrival_time": at, "status": status} for at in times],
+    }
+
+
+# Data of the recipes drawn by the canvas, rendered by both engines
+CANVAS_FIXTURES = {
+    "idfm_metro_empty": ("plugins.idfm_metro.IdfmMetroRecipe", []),
+    "idfm_metro_one_line": (
+        "plugins.idfm_metro.IdfmMetroRecipe",
+        [
+            idfm_line(
+                "Ligne 8",
+                "8",
+                "Balard",
+                "2026-03-04T11:42:17.000Z",
+                "2026-03-04T11:46:00.000Z",
+                "2026-03-04T11:50:00.000Z",
+                status="delayed",
+            )
+        ],
+    ),
+    "idfm_metro_two_lines": (
+        "plugins.idfm_metro.IdfmMetroRecipe",
+        [
+            idfm_line(
+                "Ligne 8",
+                "8",
+                "Balard",
+                "2026-03-04T11:42:17.000Z",
+                "2026-03-04T11:46:00.000Z",
+                "2026-03-04T11:50:00.000Z",
+                "2026-03-04T11:55:00.000Z",
+                "2026-03-04T12:01:00.000Z",
+            ),
+            idfm_line(
+                "Ligne 1",
+                "1",
+                "La Défense",
+                "2026-03-04T11:43:17.000Z",
+                "2026-03-04T11:45:00.000Z",
+            ),
+        ],
+    ),
+}
+
+
+class UpstreamRecipe(BaseRecipe):
+    fetch_interval = 60
+
+    def fetch_data(self):
+        raise NotImplementedError("patched in the tests")
+
+    def render_html(self, data):
+        return f"<p>{data['departures']}</p>"
+
+
+class MisbehavingRecipe(BaseRecipe):
+    fetch_interval = None
+
+    def render_html(self, data):
+        if "timezone" in self.config:
+            timezone.activate(self.config["timezone"])
+        if "megabytes" in self.config:
+            data = bytearray(self.config["megabytes"] * 1024 * 1024)
+        if self.config.get("ignore_alarm"):
+            signal.signal(signal.SIGALRM, signal.SIG_IGN)
+        time.sleep(self.config.get("seconds", 0))
+        return f"<p>{os.getpid()} {timezone.get_current_timezone_name()}</p>"
+
+
+@override_settings(CIRCUIT_BREAKER_FAILURE_THRESHOLD=2, CIRCUIT_BREAKER_COOLDOWN=60)
+class CircuitBreakerTest(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.breaker = CircuitBreaker("upstream")
+
+    def test_opens_after_consecutive_failures(self):
+        self.breaker.record_failure()
+        self.breaker.check()
+        self.breaker.record_failure()
+        with self.assertRaises(CircuitOpenError):
+            self.breaker.check()
+
+    def test_success_resets_failures(self):
+        self.breaker.record_failure()
+        self.breaker.record_success()
+        self.breaker.record_failure()
+        self.assertFalse(self.breaker.is_open())
+
+    def test_half_open_after_cooldown(self):
+        with mock.patch("plugins.circuit_breaker.time.time", return_value=1000):
+            self.breaker.record_failure()
+            self.breaker.record_failure()
+        with mock.patch("plugins.circuit_breaker.time.time", return_value=1061):
+            self.assertFalse(self.breaker.is_open())
+            # The trial call fails: open again right away
+            self.breaker.record_failure()
+            self.assertTrue(self.breaker.is_open())
+
+    def test_single_trial_after_cooldown(self):
+        with mock.patch("plugins.circuit_breaker.time.time", return_value=1000):
+            self.breaker.record_failure()
+            self.breaker.record_failure()
+        with mock.patch("plugins.circuit_breaker.time.time", return_value=1061):
+            self.breaker.check()
+            # The trial is running, the other calls are refused
+            with self.assertRaises(CircuitOpenError):
+                CircuitBreaker("upstream").check()
+            self.breaker.record_success()
+            CircuitBreaker("upstream").check()
+
+
+@override_settings(CIRCUIT_BREAKER_FAILURE_THRESHOLD=2)
+class RecipeGetTest(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.recipe = BaseRecipe({"fetch_timeout": 3})
+
+    @mock.patch("plugins.recipe.requests.get")
+    def test_fetch_timeout(self, get):
+        get.return_value.status_code = 200
+        self.recipe.get("https://example.com/api")
+        get.assert_called_once_with("https://example.com/api", timeout=3)
+
+    @mock.patch("plugins.recipe.requests.get", side_effect=requests.Timeout)
+    def test_failing_upstream_is_not_called(self, get):
+        for _ in range(2):
+            with self.assertRaises(requests.Timeout):
+                self.recipe.get("https://example.com/api")
+        with self.assertRaises(CircuitOpenError):
+            self.recipe.get("https://example.com/other")
+        self.assertEqual(get.call_count, 2)
+
+    @mock.patch("plugins.recipe.time.monotonic", return_value=100)
+    @mock.patch("plugins.recipe.requests.get")
+    def test_fetch_deadline_is_shared_by_the_requests(self, get, monotonic):
+        get.return_value.status_code = 200
+        self.recipe.get("https://example.com/lines/1")
+        monotonic.return_value = 102
+        self.recipe.get("https://example.com/lines/2", timeout=5)
+        self.assertEqual(get.call_args.kwargs["timeout"], 1)
+        monotonic.return_value = 103
+        with self.assertRaises(requests.Timeout):
+            self.recipe.get("https://example.com/lines/3")
+        self.assertEqual(get.call_count, 2)
+
+
+class CreateScreenFallbackTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.device = create_fleet(users=1, devices_per_user=1)[0]
+        cls.plugin = Plugin.objects.get()
+        cls.item = cls.device.current_screen.playlist_item
+
+    def test_reuses_last_good_screen(self):
+        last_screen = self.item.screens.order_by("-created_at").first()
+        # The device shows a screen pushed through the API meanwhile
+        Screen.objects.create(
+            device=self.device, html="<p>Pushed</p>", generated=True
+        ).make_current()
+        with mock.patch.object(
+            Plugin, "get_recipe", side_effect=CircuitOpenError("down")
+        ):
+            screen = self.plugin.create_screen(self.device, playlist_item=self.item)
+        self.assertNotEqual(screen.pk, last_screen.pk)
+        self.assertTrue(screen.generated)
+        self.assertEqual(bytes(screen.screen), bytes(last_screen.screen))
+        self.device.refresh_from_db()
+        self.assertEqual(self.device.current_screen, screen)
+
+    def test_keeps_the_last_good_screen_shown(self):
+        with mock.patch.object(
+            Plugin, "get_recipe", side_effect=CircuitOpenError("down")
+        ):
+            screen = self.plugin.create_screen(self.device, playlist_item=self.item)
+            screens = Screen.objects.count()
+            # Still down: the device keeps the screen it shows
+            again = self.plugin.create_screen(self.device, playlist_item=self.item)
+        self.assertEqual(again.pk, screen.pk)
+        self.assertEqual(Screen.objects.count(), screens)
+        self.device.refresh_from_db()
+        self.assertEqual(self.device.current_screen, screen)
+
+    def test_failed_screen_is_deleted(self):
+        screens = Screen.objects.count()
+        with mock.patch.object(
+            Screen, "request_render", side_effect=TimeoutError("render")
+        ):
+            self.plugin.create_screen(self.device, playlist_item=self.item)
+        # The device keeps the last good screen it shows
+        self.assertEqual(Screen.objects.count(), screens)
+
+    def test_raises_without_previous_screen(self):
+        self.item.screens.all().delete()
+        with mock.patch.object(
+            Plugin, "get_recipe", side_effect=CircuitOpenError("down")
+        ):
+            with self.assertRaises(CircuitOpenError):
+                self.plugin.create_screen(self.device, playlist_item=self.item)
+
+
+@override_settings(
+    RENDER_MODE="inline", PLUGIN_SNAPSHOT_VERSIONS=2, RECIPE_POOL_PROCESSES=0
+)
+@mock.patch("scheduler.models.task.Task._schedule", return_value=False)
+@mock.patch("trmnl.render.render_html", return_value=WHITE_BITMAP)
+@mock.patch.object(UpstreamRecipe, "fetch_data", return_value={"departures": [3, 9]})
+class StagedPipelineTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.devices = create_fleet(users=1, devices_per_user=2, logs_per_device=0)
+        cls.plugin = Plugin.objects.create(
+            name="Departures",
+            description="Departures",
+            recipe="plugins.tests.UpstreamRecipe",
+        )
+        PlaylistItem.objects.update(plugin=cls.plugin)
+
+    def item_of(self, device):
+        return device.playlists.get(is_active=True).items.first()
+
+    def show_active_items(self):
+        """Have the current screens come from the active playlists"""
+        for device in self.devices:
+            Screen.objects.filter(pk=device.current_screen_id).update(
+                playlist_item=self.item_of(device)
+            )
+
+    def test_versions(self, fetch_data, render_html, _schedule):
+        snapshot, changed = self.plugin.fetch_snapshot()
+        self.assertEqual((snapshot.version, changed), (1, True))
+        snapshot, changed = self.plugin.fetch_snapshot()
+        self.assertEqual((snapshot.version, changed), (1, False))
+        for departures in ([4, 10], [5, 11]):
+            fetch_data.return_value = {"departures": departures}
+            snapshot, changed = self.plugin.fetch_snapshot()
+        self.assertEqual(snapshot.version, 3)
+        self.assertEqual(snapshot.data, {"departures": [5, 11]})
+        # PLUGIN_SNAPSHOT_VERSIONS
+        self.assertEqual(
+            list(self.plugin.snapshots.values_list("version", flat=True)), [3, 2]
+        )
+        # A new config starts over
+        self.plugin.config = {"stop": 42}
+        snapshot, changed = self.plugin.fetch_snapshot()
+        self.assertEqual((snapshot.version, changed), (1, True))
+        self.assertEqual(self.plugin.snapshots.count(), 1)
+
+    def test_snapshot_is_rendered_once(self, fetch_data, render_html, _schedule):
+        screens = [
+            self.plugin.create_screen(device, playlist_item=self.item_of(device))
+            for device in self.devices
+        ]
+        fetch_data.assert_called_once()
+        render_html.assert_called_once()
+        snapshot = DataSnapshot.objects.get()
+        for device, screen in zip(self.devices, screens):
+            self.assertEqual(screen.fingerprint, snapshot.fingerprint)
+            self.assertEqual(screen.device, device)
+            self.assertEqual(bytes(screen.screen), WHITE_BITMAP)
+            device.refresh_from_db()
+            self.assertEqual(device.current_screen, screen)
+        # The fetch stage was started
+        self.assertEqual(Task.objects.get().queue, "fetch")
+
+    def test_stale_snapshot_restarts_the_fetch(
+        self, fetch_data, render_html, _schedule
+    ):
+        device = self.devices[0]
+        self.plugin.fetch_snapshot()
+        DataSnapshot.objects.update(
+            fetched_at=timezone.now() - datetime.timedelta(seconds=121)
+        )
+        # Rendered from the stale data, fetched on the fetch queue
+        with self.assertLogs("plugins", "WARNING"):
+            screen = self.plugin.create_screen(
+                device, playlist_item=self.item_of(device)
+            )
+        fetch_data.assert_called_once()
+        self.assertEqual(screen.fingerprint, self.plugin.latest_snapshot().fingerprint)
+        task = Task.objects.get()
+        self.assertEqual(task.queue, "fetch")
+        self.assertLess(task.scheduled_time, timezone.now())
+
+    @mock.patch("plugins.models.render_snapshot.delay")
+    def test_fetch_job(self, delay, fetch_data, render_html, _schedule):
+        fetch_plugin_data(self.plugin.pk)
+        delay.assert_called_once_with(DataSnapshot.objects.get().pk)
+        task = Task.objects.get()
+        self.assertEqual(task.callable, "plugins.models.fetch_plugin_data")
+        self.assertEqual(task.queue, "fetch")
+        # Unchanged, nothing to render
+        fetch_plugin_data(self.plugin.pk)
+        delay.assert_called_once()
+        render_html.assert_not_called()
+        # In no active playlist, the fetch stops
+        Task.objects.all().delete()
+        PlaylistItem.objects.update(is_active=False)
+        fetch_plugin_data(self.plugin.pk)
+        self.assertFalse(Task.objects.exists())
+
+    def run_render_stage(self, snapshot):
+        """Run render_snapshot, then the render jobs it queued"""
+        with mock.patch("plugins.models.get_queue") as get_queue:
+            render_snapshot(snapshot.pk)
+        calls = get_queue.return_value.enqueue_at.call_args_list
+        for call in calls:
+            _eta, function, *args = call.args
+            function(*args)
+        return calls
+
+    def test_new_snapshot_updates_the_shown_screens(
+        self, fetch_data, render_html, _schedule
+    ):
+        self.show_active_items()
+        snapshot, _changed = self.plugin.fetch_snapshot()
+        calls = self.run_render_stage(snapshot)
+        render_html.assert_called_once()
+        # Each device at its own slot
+        etas = {call.args[3]: call.args[0] for call in calls}
+        self.assertEqual(set(etas), {device.pk for device in self.devices})
+        for device in self.devices:
+            self.assertEqual(device.spread(etas[device.pk]), etas[device.pk])
+        self.assertEqual(len(set(etas.values())), 2)
+        for device in self.devices:
+            device.refresh_from_db()
+            self.assertEqual(device.current_screen.fingerprint, snapshot.fingerprint)
+        # Already shown
+        self.assertEqual(self.run_render_stage(snapshot), [])
+        # Superseded
+        fetch_data.return_value = {"departures": [4]}
+        self.plugin.fetch_snapshot()
+        self.assertEqual(self.run_render_stage(snapshot), [])
+        render_html.assert_called_once()
+
+    def test_new_snapshot_skips_inactive_playlists(
+        self, fetch_data, render_html, _schedule
+    ):
+        self.show_active_items()
+        snapshot, _changed = self.plugin.fetch_snapshot()
+        # Out of its active period
+        inactive, active = self.devices
+        playlist = inactive.playlists.get(is_active=True)
+        playlist.weekdays = Weekday.NONE
+        playlist.save()
+        calls = self.run_render_stage(snapshot)
+        self.assertEqual([call.args[3] for call in calls], [active.pk])
+        inactive.refresh_from_db()
+        active.refresh_from_db()
+        self.assertNotEqual(inactive.current_screen.fingerprint, snapshot.fingerprint)
+        self.assertEqual(active.current_screen.fingerprint, snapshot.fingerprint)
+
+    def test_unchanged_screen_is_kept(self, fetch_data, render_html, _schedule):
+        device = self.devices[0]
+        item = self.item_of(device)
+        screen = item.generate_screen()
+        device.refresh_from_db()
+        filename = device.current_screen_filename
+        screens = Screen.objects.count()
+        # Same data: the device keeps its screen, nothing to download
+        self.assertEqual(item.generate_screen().pk, screen.pk)
+        device.refresh_from_db()
+        self.assertEqual(device.current_screen_id, screen.pk)
+        self.assertEqual(device.current_screen_filename, filename)
+        self.assertEqual(device.skipped_renders, 1)
+        self.assertEqual(Screen.objects.count(), screens)
+        render_html.assert_called_once()
+
+    def test_identical_render_keeps_the_fingerprint(
+        self, fetch_data, render_html, _schedule
+    ):
+        self.show_active_items()
+        device = self.devices[0]
+        item = self.item_of(device)
+        # The same pixels as the screen of the fleet the device shows
+        render_html.return_value = SAMPLE_BITMAP
+        screen = self.plugin.create_screen(device, playlist_item=item)
+        self.assertEqual(screen.pk, device.current_screen_id)
+        snapshot = self.plugin.latest_snapshot()
+        self.assertEqual(
+            Screen.objects.get(pk=screen.pk).fingerprint, snapshot.fingerprint
+        )
+        self.assertEqual(
+            self.plugin.create_screen(device, playlist_item=item).pk, screen.pk
+        )
+        render_html.assert_called_once()
+
+    def test_same_fingerprint_is_not_rendered_again(
+        self, fetch_data, render_html, _schedule
+    ):
+        device = self.devices[0]
+        item = self.item_of(device)
+        self.plugin.create_screen(device, playlist_item=item)
+        first = self.plugin.latest_snapshot()
+        fetch_data.return_value = {"departures": [4]}
+        self.plugin.fetch_snapshot()
+        render_html.return_value = Bitmap(800, 480, [0] * 480).to_bmp()
+        self.plugin.create_screen(device, playlist_item=item)
+        self.assertEqual(render_html.call_count, 2)
+        # Back to the first departures: its screen is reused, even though the
+        # first version was deleted (PLUGIN_SNAPSHOT_VERSIONS)
+        fetch_data.return_value = {"departures": [3, 9]}
+        snapshot, changed = self.plugin.fetch_snapshot()
+        self.assertEqual((snapshot.version, changed), (3, True))
+        screen = self.plugin.create_screen(device, playlist_item=item)
+        self.assertEqual(render_html.call_count, 2)
+        self.assertEqual(screen.fingerprint, first.fingerprint)
+        self.assertFalse(DataSnapshot.objects.filter(pk=first.pk).exists())
+
+
+class FingerprintTest(SimpleTestCase):
+    def departures(self, *times):
+        return [
+            {
+                "name": "Ligne 8",
+                "code": "8",
+                "stop_name": "Bastille",
+                "destination": "Balard",
+                "next_stops": [
+                    {"expected_arrival_time": at, "status": "onTime"} for at in times
+                ],
+            }
+        ]
+
+    def test_idfm_metro_to_the_minute(self):
+        recipe = IdfmMetroRecipe({"timezone": "Europe/Paris"})
+        fingerprint = recipe.fingerprint(self.departures("2026-03-04T11:42:17.000Z"))
+        self.assertEqual(
+            recipe.fingerprint(self.departures("2026-03-04T11:42:51.000Z")),
+            fingerprint,
+        )
+        self.assertNotEqual(
+            recipe.fingerprint(self.departures("2026-03-04T11:43:05.000Z")),
+            fingerprint,
+        )
+        html = recipe.render_html(self.departures("2026-03-04T11:42:51.000Z"))
+        self.assertIn("12:42", html)
+
+    def test_static_html(self):
+        recipe = StaticHTMLRecipe({"html": "<p>Hello</p>"})
+        self.assertEqual(recipe.fingerprint(None), "<p>Hello</p>")
+
+
+class TimeLimitTest(SimpleTestCase):
+    def test_interrupts_the_block(self):
+        with self.assertRaises(RecipeTimeout):
+            with time_limit(0.1):
+                time.sleep(1)
+        self.assertEqual(signal.getitimer(signal.ITIMER_REAL), (0, 0))
+
+    def test_keeps_the_job_timeout(self):
+        with self.assertRaises(JobTimeoutException):
+            with UnixSignalDeathPenalty(1, JobTimeoutException):
+                with time_limit(30):
+                    pass
+                # Armed again, for the rest of the job
+                self.assertGreater(signal.getitimer(signal.ITIMER_REAL)[0], 0.5)
+                time.sleep(2)
+
+    def test_job_timeout_due_first(self):
+        with self.assertRaises(JobTimeoutException):
+            with UnixSignalDeathPenalty(1, JobTimeoutException):
+                with time_limit(30):
+                    time.sleep(2)
+
+
+@override_settings(
+    RECIPE_POOL_PROCESSES=1, RECIPE_CALL_TIMEOUT=1, RECIPE_MEMORY_LIMIT_MB=64
+)
+class RecipePoolTest(SimpleTestCase):
+    def setUp(self):
+        start_recipe_pool()
+        self.addCleanup(stop_recipe_pool)
+
+    def render(self, **config):
+        return run_recipe(
+            "plugins.tests.MisbehavingRecipe", config, "render_html", None
+        )
+
+    def test_runs_in_a_child_process(self):
+        html = self.render()
+        self.assertNotIn(str(os.getpid()), html)
+        # The same, warm process
+        self.assertEqual(self.render(), html)
+
+    def test_runs_inline_without_a_started_pool(self):
+        stop_recipe_pool()
+        self.assertIn(str(os.getpid()), self.render())
+        self.assertIsNone(get_recipe_pool())
+        # Nor in a process forked from the worker
+        start_recipe_pool()
+        self.assertNotIn(str(os.getpid()), self.render())
+        with mock.patch("os.getpid", return_value=os.getpid() + 1):
+            self.assertIsNone(get_recipe_pool())
+
+    def test_time_limit(self):
+        with self.assertRaises(RecipeTimeout):
+            self.render(seconds=10)
+        self.render()
+
+    @mock.patch("plugins.recipe_pool.KILL_GRACE_SECONDS", 0.5)
+    def test_stuck_process_is_killed(self):
+        html = self.render()
+        with self.assertRaises(RecipeTimeout):
+            self.render(seconds=10, ignore_alarm=True)
+        self.assertNotEqual(self.render(), html)
+
+    def test_memory_limit(self):
+        with self.assertRaises(MemoryError):
+            self.render(megabytes=256)
+        self.render(megabytes=8)
+
+    def test_time_zone_does_not_leak(self):
+        default = timezone.get_current_timezone_name()
+        self.assertIn("Asia/Tokyo", self.render(timezone="Asia/Tokyo"))
+        self.assertIn(default, self.render())
+        with self.settings(RECIPE_POOL_PROCESSES=0):
+            self.assertIn("Asia/Tokyo", self.render(timezone="Asia/Tokyo"))
+            self.assertEqual(timezone.get_current_timezone_name(), default)
+
+
+@override_settings(RENDER_MODE="inline", RECIPE_POOL_PROCESSES=0)
+@mock.patch("scheduler.models.task.Task._schedule", return_value=False)
+@mock.patch("trmnl.render.render_html", return_value=WHITE_BITMAP)
+@mock.patch.object(
+    IdfmMetroRecipe,
+    "fetch_data",
+    return_value=CANVAS_FIXTURES["idfm_metro_two_lines"][1],
+)
+class CanvasEngineTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.device = create_fleet(users=1, devices_per_user=1, logs_per_device=0)[0]
+        cls.plugin = Plugin.objects.create(
+            name="Metro",
+            description="Metro",
+            recipe="plugins.idfm_metro.IdfmMetroRecipe",
+        )
+        cls.item = cls.device.playlists.get(is_active=True).items.first()
+        cls.item.plugin = cls.plugin
+        cls.item.save()
+
+    def test_drawn_without_the_browser(self, fetch_data, render_html, _schedule):
+        self.plugin.config = {"render_engine": "canvas"}
+        self.plugin.save()
+        screen = self.plugin.create_screen(self.device, playlist_item=self.item)
+        render_html.assert_not_called()
+        self.assertTrue(screen.generated)
+        self.assertFalse(screen.html)
+        bitmap = Bitmap.from_bmp(bytes(screen.screen))
+        self.assertEqual((bitmap.width, bitmap.height), (800, 480))
+        self.assertNotEqual(bytes(screen.screen), WHITE_BITMAP)
+        self.assertEqual(screen.fingerprint, self.plugin.latest_snapshot().fingerprint)
+        self.device.refresh_from_db()
+        self.assertEqual(self.device.current_screen, screen)
+
+    def test_browser_by_default(self, fetch_data, render_html, _schedule):
+        screen = self.plugin.create_screen(self.device, playlist_item=self.item)
+        render_html.assert_called_once()
+        self.assertIn("Balard", screen.html)
+
+    @mock.patch.object(IdfmMetroRecipe, "render_engine", "canvas")
+    def test_engine_in_the_fingerprint(self, fetch_data, render_html, _schedule):
+        canvas = self.plugin.create_screen(self.device, playlist_item=self.item)
+        render_html.assert_not_called()
+        # Same config and data, the screen drawn by the previous default isn't
+        # copied for the new one
+        with mock.patch.object(IdfmMetroRecipe, "render_engine", "browser"):
+            browser = self.plugin.create_screen(self.device, playlist_item=self.item)
+        render_html.assert_called_once()
+        self.assertNotEqual(browser.fingerprint, canvas.fingerprint)
+        self.assertEqual(self.plugin.snapshots.count(), 1)
+
+    def test_same_layout_as_the_template(self, fetch_data, render_html, _schedule):
+        recipe = IdfmMetroRecipe({})
+        data = fetch_data.return_value
+        self.assertTrue(recipe.render_bitmap(data).startswith(b"BM"))
+        html = recipe.render_html(data)
+        for text in ("12:42", "12:45", "La Défense", "Bastille"):
+            self.assertIn(text, html)
+
+
+@unittest.skipUnless(
+    os.environ.get("RENDER_COMPARE", "false").lower() == "true",
+    "RENDER_COMPARE=true renders the fixtures in the browser (Playwright)",
+)
+class CanvasFixturesTest(SimpleTestCase):
+    """
+    The canvas renders of the fixtures against the browser renders of the HTML
+    templates, a screen apart by more than RENDER_COMPARE_TOLERANCE needs its
+    `draw` updated.
+    """
+
+    def test_fixtures(self):
+        for name, (recipe_path, data) in CANVAS_FIXTURES.items():
+            with self.subTest(fixture=name):
+                recipe = Plugin(recipe=recipe_path).get_recipe()
+                canvas = Bitmap.from_bmp(recipe.render_bitmap(data))
+                browser = Bitmap.from_bmp(render.render_html(recipe.render_html(data)))
+                diff = canvas.diff(browser)
+                self.assertLess(
+                    diff.changed_fraction,
+                    RENDER_COMPARE_TOLERANCE,
+                    f"{name}: {diff.regions[:5]}",
+                )
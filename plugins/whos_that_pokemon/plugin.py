@@ -1,7 +1,6 @@
 import random
 from typing import Any, Dict
 
-import requests
 from django.template.loader import get_template
 
 from plugins.recipe import BaseRecipe
@@ -21,13 +20,19 @@ class PokemonRecipe(BaseRecipe):
     def lang(self):
         return self.config.get("lang", "en")
 
-    def generate_html(self):
+    # A new Pokemon every 15 minutes
+    fetch_interval = 900
+
+    def fetch_data(self):
+        return self.fetch_random_pokemon()
+
+    def render_html(self, data):
         template = get_template("whos-that-pokemon/full.html")
-        return template.render({"pokemon_data": self.fetch_random_pokemon()})
+        return template.render({"pokemon_data": data})
 
     def get_translated_pokemon_name(self, pokemon_name):
         url = f"https://pokeapi.co/api/v2/pokemon-species/{pokemon_name.lower()}"
-        response = requests.get(url)
+        response = self.get(url)
         if response.status_code == 200:
             data = response.json()
             for name in data["names"]:
@@ -38,14 +43,14 @@ class PokemonRecipe(BaseRecipe):
     def fetch_random_pokemon(self) -> Dict[str, Any]:
         """Fetch random Pokemon data from PokeAPI."""
         pokemon_id = random.randint(1, self.__MAX_POKEMON_ID)
-        response = requests.get(f"https://pokeapi.co/api/v2/pokemon/{pokemon_id}")
+        response = self.get(f"https://pokeapi.co/api/v2/pokemon/{pokemon_id}")
         pokemon_data = response.json()
 
         types = [t["type"]["name"] for t in pokemon_data["types"]]
         abilities = [a["ability"]["name"] for a in pokemon_data["abilities"]]
 
         species_url = pokemon_data["species"]["url"]
-        species_response = requests.get(species_url)
+        species_response = self.get(species_url)
         species_data = species_response.json()
 
         species_name = next(
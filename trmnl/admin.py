@@ -2,13 +2,26 @@ import json
 import logging
 
 from django.contrib import admin, messages
+from django.core.cache import cache
+from django.http import Http404, HttpResponse
+from django.urls import path, reverse
+from django.utils.cache import patch_cache_control
+from django.utils.html import format_html
 from django.utils.safestring import mark_safe
 from django.utils.translation import gettext_lazy as _
 
-from .models import APIKey, Device, DeviceLog, Playlist, PlaylistItem, Screen
+from utils.admin_pagination import EstimatedCountPaginator, LargeTableAdmin
+
+from .bitmap import Bitmap, BitmapError
+from .models import APIKey, Device, DeviceLog, Playlist, PlaylistItem, RenderJob, Screen
 
 logger = logging.getLogger("trmnl")
 
+# Screen thumbnails of the changelist, 4 times smaller than the screens
+THUMBNAIL_FACTOR = 4
+# Rendered screens never change
+SCREEN_IMAGE_MAX_AGE = 7 * 24 * 3600
+
 
 class DeviceAdmin(admin.ModelAdmin):
     list_display = (
@@ -17,14 +30,29 @@ class DeviceAdmin(admin.ModelAdmin):
         "user",
         "refresh_rate",
         "last_seen_at",
+        "battery_voltage",
+        "firmware_version",
+        "skipped_renders",
     )
     list_filter = ("user", "created_at")
     search_fields = ("friendly_id", "device_name", "mac_address")
     list_editable = ("device_name", "user", "refresh_rate")
+    list_select_related = ("user",)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
     def has_add_permission(self, request, obj=None):
         return False
 
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        formfield = super().formfield_for_foreignkey(db_field, request, **kwargs)
+        if db_field.name == "user":
+            # list_editable renders one user select per row, share its choices
+            if not hasattr(request, "_device_user_choices"):
+                request._device_user_choices = list(formfield.choices)
+            formfield.choices = request._device_user_choices
+        return formfield
+
     def get_readonly_fields(self, request, obj=None):
         # Make all fields read-only except device_name and user
         editable_fields = {"device_name", "user", "refresh_rate"}
@@ -33,10 +61,12 @@ class DeviceAdmin(admin.ModelAdmin):
         return readonly_fields
 
 
-class DeviceLogAdmin(admin.ModelAdmin):
+class DeviceLogAdmin(LargeTableAdmin):
     list_display = ("device", "created_at")
     list_filter = ("device", "created_at")
-    search_fields = ("device", "message")
+    # See get_search_results
+    search_fields = ("=device__friendly_id", "message")
+    search_help_text = _("Friendly ID of the device, words of the log message")
     readonly_fields = ("device", "created_at", "message_pretty")
     fields = ("device", "created_at", "message_pretty")
 
@@ -51,12 +81,49 @@ class DeviceLogAdmin(admin.ModelAdmin):
 
     message_pretty.short_description = "Message"
 
+    def get_search_results(self, request, queryset, search_term):
+        """
+        The words which are friendly IDs filter the devices, the other ones
+        are looked up in the full-text index of the messages, instead of a
+        LIKE over every message.
+        """
+        words = search_term.split()
+        if not words:
+            return queryset, False
+        devices = dict(
+            Device.objects.filter(
+                friendly_id__in={word.upper() for word in words}
+            ).values_list("friendly_id", "pk")
+        )
+        if devices:
+            queryset = queryset.filter(device__in=devices.values())
+        words = [word for word in words if word.upper() not in devices]
+        if words:
+            queryset = queryset.search(" ".join(words))
+        return queryset, False
+
 
-class ScreenAdmin(admin.ModelAdmin):
-    list_display = ("device", "created_at", "generated")
-    list_filter = ("device", "created_at", "generated")
-    search_fields = ("device", "html")
-    readonly_fields = ("created_at", "generated", "embed_image", "playlist_item")
+class ScreenAdmin(LargeTableAdmin):
+    list_display = (
+        "thumbnail",
+        "device",
+        "created_at",
+        "generated",
+        "changed_fraction",
+    )
+    list_display_links = ("thumbnail", "device")
+    list_filter = ("device", "created_at")
+    search_fields = ("=device__friendly_id",)
+    search_help_text = _("Friendly ID of the device")
+    readonly_fields = (
+        "created_at",
+        "generated",
+        "embed_image",
+        "playlist_item",
+        "render_job",
+        "changed_fraction",
+        "changed_regions",
+    )
     fields = (
         "device",
         "created_at",
@@ -64,31 +131,88 @@ class ScreenAdmin(admin.ModelAdmin):
         "html",
         "embed_image",
         "playlist_item",
+        "render_job",
+        "changed_fraction",
+        "changed_regions",
     )
     actions = ["generate"]
 
+    def get_urls(self):
+        image_view = self.admin_site.admin_view(self.image_view)
+        return [
+            path(
+                "<path:object_id>/image.png",
+                image_view,
+                name="trmnl_screen_image",
+            ),
+            path(
+                "<path:object_id>/thumbnail.png",
+                image_view,
+                {"thumbnail": True},
+                name="trmnl_screen_thumbnail",
+            ),
+        ] + super().get_urls()
+
+    def image_view(self, request, object_id, thumbnail=False):
+        screen = self.get_object(request, object_id)
+        if (
+            screen is None
+            or not screen.generated
+            or not self.has_view_permission(request, screen)
+        ):
+            raise Http404
+        try:
+            if thumbnail:
+                data = cache.get_or_set(
+                    f"screen-thumbnail:{screen.pk}",
+                    lambda: Bitmap.from_bmp(screen.screen)
+                    .thumbnail(THUMBNAIL_FACTOR)
+                    .to_png(),
+                    SCREEN_IMAGE_MAX_AGE,
+                )
+            else:
+                data = screen.image_data("png")
+        except BitmapError:
+            raise Http404
+        response = HttpResponse(data, content_type="image/png")
+        patch_cache_control(response, private=True, max_age=SCREEN_IMAGE_MAX_AGE)
+        return response
+
+    def thumbnail(self, obj):
+        if not obj.generated:
+            return "-"
+        return format_html(
+            '<img src="{}" alt="screen" loading="lazy">',
+            reverse("admin:trmnl_screen_thumbnail", args=[obj.pk]),
+        )
+
+    thumbnail.short_description = _("Screen")
+
     def embed_image(self, obj=None):
-        result = ""
-        if obj and obj.generated:
-            result = f'<img src="{obj.image_as_base64}" alt="screen">'
-        return mark_safe(result)
+        if not obj or not obj.generated:
+            return ""
+        return format_html(
+            '<img src="{}" alt="screen">',
+            reverse("admin:trmnl_screen_image", args=[obj.pk]),
+        )
 
     embed_image.short_description = "Generated Image"
 
     def get_readonly_fields(self, request, obj=...):
+        readonly_fields = list(self.readonly_fields)
         if obj and obj.generated:
-            return ["created_at", "generated", "html", "embed_image", "playlist_item"]
-        return ["created_at", "generated", "embed_image", "playlist_item"]
+            readonly_fields.append("html")
+        return readonly_fields
 
     def generate(self, request, queryset):
         objs = queryset.filter(generated=False)
         obj: Screen
         for obj in objs:
-            obj.generate_screen()
+            obj.request_render()
 
     def save_model(self, request, obj, form, change):
         if not obj.generated:
-            obj.generate_screen()
+            obj.request_render()
         super().save_model(request, obj, form, change)
 
 
@@ -104,7 +228,7 @@ class APIKeyAdmin(admin.ModelAdmin):
             # show message with key
             self.message_user(
                 request,
-                f"Your API Key is {obj.key}. It will not be shown again.",
+                f"Your API Key is {obj.raw_key}. It will not be shown again.",
                 level=messages.SUCCESS,
             )
         super().save_model(request, obj, form, change)
@@ -134,9 +258,28 @@ class PlaylistItemAdmin(admin.ModelAdmin):
     list_display = ("uuid", "playlist", "order", "plugin", "last_displayed_at")
 
 
+class RenderJobAdmin(admin.ModelAdmin):
+    list_display = ("id", "user", "status", "created_at", "completed_at")
+    list_filter = ("status", "created_at")
+    list_select_related = ("user",)
+    readonly_fields = (
+        "id",
+        "user",
+        "status",
+        "callback_url",
+        "error",
+        "created_at",
+        "completed_at",
+    )
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
 admin.site.register(Device, DeviceAdmin)
 admin.site.register(DeviceLog, DeviceLogAdmin)
 admin.site.register(Screen, ScreenAdmin)
 admin.site.register(APIKey, APIKeyAdmin)
 admin.site.register(Playlist, PlaylistAdmin)
 admin.site.register(PlaylistItem, PlaylistItemAdmin)
+admin.site.register(RenderJob, RenderJobAdmin)
@@ -5,3 +5,7 @@ class TrmnlConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "trmnl"
     verbose_name = "TRMNL"
+
+    def ready(self):
+        # Connect the API key cache eviction signals
+        from . import key_cache  # noqa: F401
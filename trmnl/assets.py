@@ -0,0 +1,233 @@
+"""
+Serve the assets requested by the pages being rendered, through Playwright
+request routing:
+
+- static files (the TRMNL framework CSS/JS, fonts, images) are served from
+  memory, without going through nginx,
+- remote images, fonts and stylesheets are cached on disk for
+  RENDER_ASSET_CACHE_TTL seconds, within RENDER_ASSET_CACHE_MAX_SIZE_MB,
+- with RENDER_BLOCK_REQUESTS, requests to hosts not in RENDER_ALLOWED_HOSTS
+  are aborted.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import mimetypes
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+
+logger = logging.getLogger("trmnl")
+
+CACHED_RESOURCE_TYPES = {"image", "font", "stylesheet"}
+# The disk cache is pruned at most once per interval (seconds), when storing
+PRUNE_INTERVAL = 600
+
+
+@dataclass
+class AssetStats:
+    hits: int = 0
+    misses: int = 0
+    blocked: int = 0
+    bytes_saved: int = 0
+
+    def __str__(self):
+        requests = self.hits + self.misses
+        hit_rate = self.hits / requests if requests else 0
+        return (
+            f"{self.hits} hits, {self.misses} misses ({hit_rate:.0%} hit rate), "
+            f"{self.blocked} blocked, {self.bytes_saved / 1024:.1f}KB saved"
+        )
+
+
+class AssetCache:
+    def __init__(self, cache_dir=None, ttl=None, max_size=None):
+        self.cache_dir = Path(cache_dir or settings.RENDER_ASSET_CACHE_DIR)
+        self.ttl = ttl if ttl is not None else settings.RENDER_ASSET_CACHE_TTL
+        self.max_size = (
+            max_size
+            if max_size is not None
+            else settings.RENDER_ASSET_CACHE_MAX_SIZE_MB * 1024 * 1024
+        )
+        self.pruned_at = 0
+        # path -> (body, content type) of the static files served so far: only
+        # existing files are kept, so it's bounded by the static files
+        self.static_files = {}
+
+    def get_static(self, url):
+        """A static file served at this URL, as (body, content type)"""
+        parts = urlsplit(url)
+        if parts.hostname not in settings.RENDER_STATIC_HOSTS:
+            return None
+        path = parts.path.lstrip("/")
+        if path.startswith(settings.STATIC_URL.strip("/") + "/"):
+            path = path.removeprefix(settings.STATIC_URL.strip("/") + "/")
+        if path not in self.static_files:
+            static_file = self._read_static(path)
+            if static_file is None:
+                return None
+            self.static_files[path] = static_file
+        return self.static_files[path]
+
+    @staticmethod
+    def _read_static(path):
+        filename = finders.find(path)
+        if not filename and settings.STATIC_ROOT:
+            candidate = Path(settings.STATIC_ROOT) / path
+            filename = candidate if candidate.is_file() else None
+        if not filename:
+            return None
+        content_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        return Path(filename).read_bytes(), content_type
+
+    def _cache_paths(self, url):
+        key = hashlib.sha256(url.encode()).hexdigest()
+        return self.cache_dir / key, self.cache_dir / f"{key}.json"
+
+    def get_remote(self, url):
+        """A remote asset cached on disk and still fresh, as (body, content type)"""
+        body_path, meta_path = self._cache_paths(url)
+        try:
+            meta = json.loads(meta_path.read_text())
+            if meta["fetched_at"] + self.ttl < time.time():
+                return None
+            return body_path.read_bytes(), meta["content_type"]
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def store_remote(self, url, body, content_type):
+        body_path, meta_path = self._cache_paths(url)
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            body_path.write_bytes(body)
+            meta_path.write_text(
+                json.dumps({"content_type": content_type, "fetched_at": time.time()})
+            )
+        except OSError:
+            logger.warning(f"Can't cache {url} in {self.cache_dir}", exc_info=True)
+        if self.pruned_at + PRUNE_INTERVAL < time.time():
+            self.prune()
+
+    def prune(self):
+        """
+        Delete the expired remote assets, then the least recently fetched ones
+        until the disk cache fits in max_size.
+        :return: the number of deleted assets
+        """
+        self.pruned_at = now = time.time()
+        entries = []
+        for meta_path in self.cache_dir.glob("*.json"):
+            body_path = meta_path.with_suffix("")
+            try:
+                fetched_at = json.loads(meta_path.read_text())["fetched_at"]
+                size = body_path.stat().st_size
+            except (OSError, ValueError, KeyError):
+                # Half written or unreadable: same as expired
+                fetched_at, size = 0, 0
+            entries.append((fetched_at, size, body_path, meta_path))
+        entries.sort(key=lambda entry: entry[0])
+        total_size = sum(entry[1] for entry in entries)
+        deleted = 0
+        for fetched_at, size, body_path, meta_path in entries:
+            if fetched_at + self.ttl >= now and total_size <= self.max_size:
+                break
+            meta_path.unlink(missing_ok=True)
+            body_path.unlink(missing_ok=True)
+            total_size -= size
+            deleted += 1
+        if deleted:
+            logger.info(f"Deleted {deleted} remote assets from {self.cache_dir}")
+        return deleted
+
+    def lookup(self, url):
+        return self.get_static(url) or self.get_remote(url)
+
+    @staticmethod
+    def is_blocked(url):
+        if not settings.RENDER_BLOCK_REQUESTS:
+            return False
+        parts = urlsplit(url)
+        if parts.scheme not in ("http", "https"):
+            return False
+        return parts.hostname not in (
+            settings.RENDER_ALLOWED_HOSTS + settings.RENDER_STATIC_HOSTS
+        )
+
+    @staticmethod
+    def is_cacheable(request):
+        return request.method == "GET" and request.resource_type in (
+            CACHED_RESOURCE_TYPES
+        )
+
+    @staticmethod
+    def _fulfill_kwargs(body, content_type):
+        return {
+            "status": 200,
+            "body": body,
+            "headers": {
+                "content-type": content_type,
+                "access-control-allow-origin": "*",
+            },
+        }
+
+    def handle(self, route, stats):
+        """Route handler for sync playwright pages."""
+        request = route.request
+        if cached := self.lookup(request.url):
+            stats.hits += 1
+            stats.bytes_saved += len(cached[0])
+            return route.fulfill(**self._fulfill_kwargs(*cached))
+        if self.is_blocked(request.url):
+            stats.blocked += 1
+            return route.abort("blockedbyclient")
+        stats.misses += 1
+        if not self.is_cacheable(request):
+            return route.continue_()
+        response = route.fetch()
+        if response.ok:
+            self.store_remote(
+                request.url, response.body(), response.headers.get("content-type", "")
+            )
+        return route.fulfill(response=response)
+
+    async def async_handle(self, route, stats):
+        """Same as `handle`, for async_playwright pages, disk I/O in a thread."""
+        request = route.request
+        if cached := await asyncio.to_thread(self.lookup, request.url):
+            stats.hits += 1
+            stats.bytes_saved += len(cached[0])
+            return await route.fulfill(**self._fulfill_kwargs(*cached))
+        if self.is_blocked(request.url):
+            stats.blocked += 1
+            return await route.abort("blockedbyclient")
+        stats.misses += 1
+        if not self.is_cacheable(request):
+            return await route.continue_()
+        response = await route.fetch()
+        if response.ok:
+            await asyncio.to_thread(
+                self.store_remote,
+                request.url,
+                await response.body(),
+                response.headers.get("content-type", ""),
+            )
+        return await route.fulfill(response=response)
+
+
+asset_cache = None
+
+
+def get_asset_cache():
+    """The process-wide asset cache, or None if disabled."""
+    global asset_cache
+    if not settings.RENDER_ASSET_CACHE:
+        return None
+    if asset_cache is None:
+        asset_cache = AssetCache()
+    return asset_cache
@@ -0,0 +1,295 @@
+"""
+Black & white bitmaps, decoded from the BMPs produced by the render pipeline.
+
+Pixels are kept as one integer per row, `width` bits wide, the most significant
+bit being the leftmost pixel and 1 meaning white. Comparing two screens is then
+a XOR per row.
+
+Besides BMP, bitmaps can be encoded as:
+- a 1 bit grayscale PNG,
+- "rle": the e-ink frame buffer (rows packed 8 pixels per byte, MSB first,
+  1 = white, top to bottom) compressed with PackBits, after a 4 bytes header
+  holding the width and the height (little endian, unsigned 16 bits).
+"""
+
+import struct
+import zlib
+from dataclasses import dataclass, field
+
+# Consecutive changed rows closer than this are reported as a single region
+REGION_MERGE_GAP = 8
+
+
+class BitmapError(ValueError):
+    pass
+
+
+@dataclass
+class BitmapDiff:
+    changed_pixels: int
+    total_pixels: int
+    # [{"x": ..., "y": ..., "width": ..., "height": ...}], top to bottom
+    regions: list = field(default_factory=list)
+
+    @property
+    def identical(self):
+        return self.changed_pixels == 0
+
+    @property
+    def changed_fraction(self):
+        return self.changed_pixels / self.total_pixels if self.total_pixels else 0.0
+
+
+class Bitmap:
+    def __init__(self, width, height, rows):
+        self.width = width
+        self.height = height
+        self.rows = rows
+
+    def __repr__(self):
+        return f"<Bitmap {self.width}x{self.height}>"
+
+    def __eq__(self, other):
+        return (
+            isinstance(other, Bitmap)
+            and (self.width, self.height) == (other.width, other.height)
+            and self.rows == other.rows
+        )
+
+    @classmethod
+    def from_bmp(cls, data):
+        """Decode an uncompressed 1, 4, 8, 24 or 32 bits BMP."""
+        data = bytes(data)
+        if data[:2] != b"BM" or len(data) < 54:
+            raise BitmapError("Not a BMP file")
+        (offset,) = struct.unpack_from("<I", data, 10)
+        header_size, width, height, _, bpp, compression = struct.unpack_from(
+            "<IiiHHI", data, 14
+        )
+        if compression not in (0, 3) or bpp not in (1, 4, 8, 24, 32):
+            raise BitmapError(f"Unsupported BMP: {bpp} bits, compression {compression}")
+        (colors_used,) = struct.unpack_from("<I", data, 46)
+        bottom_up = height > 0
+        height = abs(height)
+        stride = (bpp * width + 31) // 32 * 4
+
+        if bpp <= 8:
+            palette_offset = 14 + header_size
+            palette_size = min(colors_used or 2**bpp, (offset - palette_offset) // 4)
+            # 1 for the palette entries that are closer to white than to black
+            white = bytes(
+                _is_white(*reversed(data[index : index + 3]))
+                for index in range(palette_offset, palette_offset + palette_size * 4, 4)
+            )
+            to_digits = bytes.maketrans(
+                bytes(range(len(white))), bytes(b"01"[bit] for bit in white)
+            )
+
+        rows = []
+        for y in range(height):
+            start = offset + y * stride
+            row_bytes = data[start : start + stride]
+            if bpp == 1:
+                row = int.from_bytes(row_bytes, "big") >> (stride * 8 - width)
+                if white == b"\x00\x01":
+                    pass
+                elif white == b"\x01\x00":
+                    row ^= (1 << width) - 1
+                else:
+                    row = (1 << width) - 1 if white[0] else 0
+            elif bpp == 8:
+                row = int(row_bytes[:width].translate(to_digits), 2)
+            elif bpp == 4:
+                indexes = bytes(
+                    (byte >> shift) & 0x0F for byte in row_bytes for shift in (4, 0)
+                )
+                row = int(indexes[:width].translate(to_digits), 2)
+            else:
+                step = bpp // 8
+                digits = bytes(
+                    b"01"[_is_white(*reversed(row_bytes[x : x + 3]))]
+                    for x in range(0, width * step, step)
+                )
+                row = int(digits, 2)
+            rows.append(row)
+        if bottom_up:
+            rows.reverse()
+        return cls(width, height, rows)
+
+    def to_bmp(self):
+        """Encode as a 1 bit BMP, black & white palette."""
+        stride = (self.width + 31) // 32 * 4
+        padding = stride * 8 - self.width
+        pixels = b"".join(
+            (row << padding).to_bytes(stride, "big") for row in reversed(self.rows)
+        )
+        palette = b"\x00\x00\x00\x00\xff\xff\xff\x00"
+        offset = 14 + 40 + len(palette)
+        return (
+            struct.pack("<2sIHHI", b"BM", offset + len(pixels), 0, 0, offset)
+            # BITMAPINFOHEADER, 72 DPI, 2 colors
+            + struct.pack(
+                "<IiiHHIIiiII",
+                40,
+                self.width,
+                self.height,
+                1,
+                1,
+                0,
+                len(pixels),
+                2835,
+                2835,
+                2,
+                2,
+            )
+            + palette
+            + pixels
+        )
+
+    def thumbnail(self, factor):
+        """
+        Scaled down `factor` times, a pixel being black if any pixel of its
+        block is, so that thin lines and text remain visible.
+        """
+        width, height = self.width // factor, self.height // factor
+        block = (1 << factor) - 1
+        rows = []
+        for y in range(height):
+            row = (1 << self.width) - 1
+            for source in self.rows[y * factor : (y + 1) * factor]:
+                row &= source
+            thumbnail_row = 0
+            for x in range(width):
+                pixels = row >> (self.width - (x + 1) * factor)
+                thumbnail_row = thumbnail_row << 1 | (pixels & block == block)
+            rows.append(thumbnail_row)
+        return Bitmap(width, height, rows)
+
+    def packed(self):
+        """The frame buffer: each row packed 8 pixels per byte, top to bottom."""
+        row_size = (self.width + 7) // 8
+        padding = row_size * 8 - self.width
+        return b"".join((row << padding).to_bytes(row_size, "big") for row in self.rows)
+
+    def to_png(self):
+        """Encode as a 1 bit grayscale PNG."""
+        row_size = (self.width + 7) // 8
+        packed = self.packed()
+        # Filter type 0 (None) before each row
+        raw = b"".join(
+            b"\x00" + packed[index : index + row_size]
+            for index in range(0, len(packed), row_size)
+        )
+        header = struct.pack(">IIBBBBB", self.width, self.height, 1, 0, 0, 0, 0)
+        return (
+            b"\x89PNG\r\n\x1a\n"
+            + _png_chunk(b"IHDR", header)
+            + _png_chunk(b"IDAT", zlib.compress(raw, 9))
+            + _png_chunk(b"IEND", b"")
+        )
+
+    def to_rle(self):
+        """Encode as a PackBits compressed frame buffer (see module docstring)."""
+        return struct.pack("<HH", self.width, self.height) + packbits_encode(
+            self.packed()
+        )
+
+    @classmethod
+    def from_rle(cls, data):
+        width, height = struct.unpack_from("<HH", data)
+        packed = packbits_decode(data[4:])
+        row_size = (width + 7) // 8
+        padding = row_size * 8 - width
+        rows = [
+            int.from_bytes(packed[index : index + row_size], "big") >> padding
+            for index in range(0, row_size * height, row_size)
+        ]
+        return cls(width, height, rows)
+
+    def diff(self, other, merge_gap=REGION_MERGE_GAP):
+        """Changed pixels and the bounding boxes of the changed areas."""
+        total = self.width * self.height
+        if (self.width, self.height) != (other.width, other.height):
+            whole = {"x": 0, "y": 0, "width": self.width, "height": self.height}
+            return BitmapDiff(total, total, [whole])
+
+        changed = 0
+        regions = []
+        region = None
+        for y, (row, other_row) in enumerate(zip(self.rows, other.rows)):
+            xor = row ^ other_row
+            if not xor:
+                continue
+            changed += xor.bit_count()
+            left = self.width - xor.bit_length()
+            right = self.width - (xor & -xor).bit_length()
+            if region and y - region["bottom"] <= merge_gap:
+                region["left"] = min(region["left"], left)
+                region["right"] = max(region["right"], right)
+                region["bottom"] = y
+            else:
+                region = {"top": y, "bottom": y, "left": left, "right": right}
+                regions.append(region)
+        return BitmapDiff(
+            changed,
+            total,
+            [
+                {
+                    "x": region["left"],
+                    "y": region["top"],
+                    "width": region["right"] - region["left"] + 1,
+                    "height": region["bottom"] - region["top"] + 1,
+                }
+                for region in regions
+            ],
+        )
+
+
+def packbits_encode(data):
+    """PackBits (as in TIFF): runs of 2 to 128 identical bytes, literals up to 128."""
+    result = bytearray()
+    index, length = 0, len(data)
+    while index < length:
+        run = 1
+        while index + run < length and run < 128 and data[index + run] == data[index]:
+            run += 1
+        if run > 1:
+            result += bytes((257 - run, data[index]))
+            index += run
+            continue
+        # Literal bytes, until the next run of at least 3 identical bytes
+        start = index
+        while index < length and index - start < 128:
+            if index + 2 < length and data[index] == data[index + 1] == data[index + 2]:
+                break
+            index += 1
+        result.append(index - start - 1)
+        result += data[start:index]
+    return bytes(result)
+
+
+def packbits_decode(data):
+    result = bytearray()
+    index = 0
+    while index < len(data):
+        header = data[index]
+        if header < 128:
+            result += data[index + 1 : index + header + 2]
+            index += header + 2
+        elif header > 128:
+            result += bytes((data[index + 1],)) * (257 - header)
+            index += 2
+        else:
+            index += 1
+    return bytes(result)
+
+
+def _png_chunk(chunk_type, data):
+    checksum = zlib.crc32(chunk_type + data)
+    return (
+        struct.pack(">I", len(data)) + chunk_type + data + struct.pack(">I", checksum)
+    )
+
+
+def _is_white(red, green, blue):
+    return int(0.299 * red + 0.587 * green + 0.114 * blue >= 128)
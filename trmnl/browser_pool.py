@@ -0,0 +1,85 @@
+"""
+A browser shared by the live preview sessions of the process.
+
+Starting Playwright and Firefox takes seconds and hundreds of MB: instead of a
+browser per WebSocket connection, sessions lease an isolated browser context
+(its own page, cookies and storage) from a single browser, started on the first
+lease. At most `max_contexts` sessions hold a context at once, the others wait
+in line for one to be released.
+"""
+
+import asyncio
+import logging
+
+from django.conf import settings
+from playwright.async_api import async_playwright
+
+from trmnl import render
+
+logger = logging.getLogger("trmnl")
+
+
+class BrowserPool:
+    def __init__(self, max_contexts):
+        self.max_contexts = max_contexts
+        self.semaphore = asyncio.Semaphore(max_contexts)
+        self.lock = asyncio.Lock()
+        self.playwright = None
+        self.browser = None
+        self.contexts = set()
+
+    @property
+    def full(self):
+        return self.semaphore.locked()
+
+    async def get_browser(self):
+        async with self.lock:
+            if self.browser and self.browser.is_connected():
+                return self.browser
+            if self.playwright is None:
+                self.playwright = await async_playwright().start()
+            self.browser = await render.launch_browser(self.playwright)
+            logger.info("Preview browser started")
+            return self.browser
+
+    async def acquire(self):
+        """Wait for a free slot and return a new browser context."""
+        await self.semaphore.acquire()
+        try:
+            browser = await self.get_browser()
+            context = await browser.new_context(viewport=render.VIEWPORT)
+        except BaseException:
+            self.semaphore.release()
+            raise
+        self.contexts.add(context)
+        return context
+
+    async def release(self, context):
+        self.contexts.discard(context)
+        try:
+            await context.close()
+        except Exception:
+            # The browser is gone, the next lease starts a new one
+            logger.warning("Failed to close a preview context", exc_info=True)
+        finally:
+            self.semaphore.release()
+
+    async def close(self):
+        async with self.lock:
+            if self.browser:
+                await self.browser.close()
+            if self.playwright:
+                await self.playwright.stop()
+            self.browser = None
+            self.playwright = None
+
+
+browser_pool = None
+
+
+def get_browser_pool():
+    """The pool shared by all the preview sessions of the process."""
+    global browser_pool
+    if browser_pool is None:
+        browser_pool = BrowserPool(settings.PREVIEW_MAX_SESSIONS)
+    return browser_pool
@@ -0,0 +1,224 @@
+"""
+A lightweight renderer for simple layouts (text, tables, boxes, icons), drawn
+straight to a 1-bit bitmap in Python in a few milliseconds, without a browser.
+
+Recipes opt in with `render_engine = "canvas"` and implement `draw(canvas,
+data)`, see plugins.recipe.BaseRecipe. Text uses the fonts of the framework
+(see trmnl.fonts), icons are 1-bit BMPs (e.g. from trmnl/static/images).
+"""
+
+import functools
+from pathlib import Path
+
+from trmnl.bitmap import Bitmap
+from trmnl.fonts import get_font
+
+IMAGE_DIR = Path(__file__).resolve().parent / "static" / "images"
+
+BLACK = "black"
+WHITE = "white"
+
+
+@functools.cache
+def load_image(name):
+    """A BMP of trmnl/static/images, e.g. "rover.bmp", loaded once per process"""
+    return Bitmap.from_bmp((IMAGE_DIR / name).read_bytes())
+
+
+class Canvas:
+    """
+    An 800x480 (by default) black & white drawing. Coordinates are in pixels
+    from the top left corner, shapes are clipped to the canvas.
+    """
+
+    def __init__(self, width=800, height=480):
+        self.width = width
+        self.height = height
+        self.full_row = (1 << width) - 1
+        # One integer per row, the most significant bit being the leftmost
+        # pixel and 1 meaning black (the opposite of Bitmap)
+        self.rows = [0] * height
+
+    def __repr__(self):
+        return f"<Canvas {self.width}x{self.height}>"
+
+    def span(self, x, width):
+        """The bits of a row from `x`, `width` pixels wide, clipped"""
+        left, right = max(x, 0), min(x + width, self.width)
+        if right <= left:
+            return 0
+        return ((1 << (right - left)) - 1) << (self.width - right)
+
+    def paint(self, y, bits, color=BLACK):
+        if 0 <= y < self.height:
+            if color == BLACK:
+                self.rows[y] |= bits & self.full_row
+            else:
+                self.rows[y] &= ~bits
+
+    def blit(self, x, y, rows, width, color=BLACK):
+        """Paint the 1 bits of `rows` (`width` bits wide) at x, y"""
+        shift = self.width - x - width
+        for index, bits in enumerate(rows):
+            self.paint(
+                y + index, bits << shift if shift >= 0 else bits >> -shift, color
+            )
+
+    def fill(self, x, y, width, height, color=BLACK):
+        bits = self.span(x, width)
+        for row in range(max(y, 0), min(y + height, self.height)):
+            self.paint(row, bits, color)
+
+    def rect(self, x, y, width, height, border=1, color=BLACK):
+        """The outline of a rectangle, `border` pixels thick, inside the box"""
+        self.fill(x, y, width, border, color)
+        self.fill(x, y + height - border, width, border, color)
+        self.fill(x, y, border, height, color)
+        self.fill(x + width - border, y, border, height, color)
+
+    def dotted_line(self, x, y, length, vertical=False, color=BLACK):
+        """A line of one pixel out of two, as the framework borders"""
+        for offset in range(0, length, 2):
+            if vertical:
+                self.fill(x, y + offset, 1, 1, color)
+            else:
+                self.fill(x + offset, y, 1, 1, color)
+
+    def circle(self, center_x, center_y, radius, color=BLACK):
+        for row in range(-radius, radius):
+            half = int((radius**2 - (row + 0.5) ** 2) ** 0.5 + 0.5)
+            self.paint(center_y + row, self.span(center_x - half, 2 * half), color)
+
+    def image(self, x, y, bitmap, color=BLACK):
+        """Paint the black pixels of a Bitmap (e.g. an icon, see load_image)"""
+        full = (1 << bitmap.width) - 1
+        self.blit(x, y, [~row & full for row in bitmap.rows], bitmap.width, color)
+
+    def text(
+        self,
+        x,
+        y,
+        text,
+        font="NicoClean",
+        size=16,
+        color=BLACK,
+        align="left",
+        max_width=None,
+    ):
+        """
+        Draw a line of text, `y` being the top of the line. The text is cut
+        with an ellipsis to fit in `max_width`, and aligned within it (or on
+        `x`) "left", "center" or "right".
+        :return: the width of the text drawn
+        """
+        face = get_font(font)
+        width = face.measure(text, size)
+        if max_width is not None and width > max_width:
+            while text and face.measure(text + "…", size) > max_width:
+                text = text[:-1]
+            text += "…"
+            width = face.measure(text, size)
+        box = width if max_width is None else max_width
+        if align == "center":
+            x += (box - width) // 2
+        elif align == "right":
+            x += box - width
+        baseline = y + face.ascent(size)
+        for pen, glyph in face.glyphs(text, size):
+            if glyph.rows:
+                self.blit(
+                    x + pen + glyph.left,
+                    baseline + glyph.top,
+                    glyph.rows,
+                    glyph.width,
+                    color,
+                )
+        return width
+
+    def label(self, x, y, text, style=None, font="NicoClean", size=16, max_width=None):
+        """
+        A label of the framework: plain, "inverted" (white on black), "outline"
+        or "underline".
+        :return: its width
+        """
+        face = get_font(font)
+        padding = 4 if style in ("inverted", "outline") else 0
+        height = face.line_height(size) + 4
+        width = face.measure(text, size) + 2 * padding
+        if max_width is not None:
+            width = min(width, max_width)
+        if style == "inverted":
+            self.fill(x, y, width, height)
+        elif style == "outline":
+            self.rect(x, y, width, height)
+        elif style == "underline":
+            self.fill(x, y + height - 1, width, 1)
+        self.text(
+            x + padding,
+            y + 2,
+            text,
+            font,
+            size,
+            color=WHITE if style == "inverted" else BLACK,
+            max_width=width - 2 * padding,
+        )
+        return width
+
+    def text_block(
+        self, x, y, width, text, font="NicoClean", size=16, line_height=None, lines=None
+    ):
+        """
+        Draw a text wrapped on words within `width`, on up to `lines` lines.
+        :return: the height of the block
+        """
+        face = get_font(font)
+        line_height = line_height or face.line_height(size)
+        wrapped = []
+        for word in text.split():
+            if wrapped and face.measure(f"{wrapped[-1]} {word}", size) <= width:
+                wrapped[-1] = f"{wrapped[-1]} {word}"
+            else:
+                wrapped.append(word)
+        if lines is not None and len(wrapped) > lines:
+            wrapped = wrapped[: lines - 1] + [" ".join(wrapped[lines - 1 :])]
+        for index, line in enumerate(wrapped):
+            self.text(x, y + index * line_height, line, font, size, max_width=width)
+        return len(wrapped) * line_height
+
+    def table(
+        self,
+        x,
+        y,
+        rows,
+        columns,
+        font="NicoClean",
+        size=16,
+        row_height=None,
+        rules=True,
+    ):
+        """
+        Draw rows of cells, `columns` giving the (width, align) of each column,
+        with a dotted rule between the rows.
+        :return: the height of the table
+        """
+        row_height = row_height or get_font(font).line_height(size) + 4
+        table_width = sum(width for width, _align in columns)
+        for index, cells in enumerate(rows):
+            top = y + index * row_height
+            left = x
+            for cell, (width, align) in zip(cells, columns):
+                self.text(
+                    left, top + 2, str(cell), font, size, align=align, max_width=width
+                )
+                left += width
+            if rules and index < len(rows) - 1:
+                self.dotted_line(x, top + row_height - 1, table_width)
+        return len(rows) * row_height
+
+    def to_bitmap(self):
+        return Bitmap(
+            self.width, self.height, [~row & self.full_row for row in self.rows]
+        )
+
+    def to_bmp(self):
+        return self.to_bitmap().to_bmp()
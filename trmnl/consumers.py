@@ -1,93 +1,108 @@
-import base64
+import asyncio
 import json
 import logging
-import shutil
-import tempfile
 import time
 
 from channels.generic.websocket import AsyncWebsocketConsumer
-from playwright.async_api import async_playwright
-from wand.image import Image
 
-from byos_django import settings
+from trmnl import render
+from trmnl.browser_pool import get_browser_pool
 
 logger = logging.getLogger(__name__)
 
 
 class PreviewConsumer(AsyncWebsocketConsumer):
+    """
+    Render the HTML sent by the live preview.
+
+    Renders follow the latest message: a message arriving while the previous
+    one waits for its debounce delay or is being rendered supersedes it (the
+    render is cancelled), so fast typing doesn't queue up renders. Each render
+    is answered with a JSON text frame (timings) followed by the BMP as a
+    binary frame.
+
+    Each session renders in a browser context leased from the process-wide
+    browser pool (see trmnl/browser_pool.py).
+    """
+
+    # Seconds without new HTML before rendering
+    debounce = 0.15
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.pw = None
-        self.browser = None
+        self.context = None
         self.page = None
+        self.render_task = None
+        self.renders = 0
 
     async def connect(self):
         if not self.scope["user"].is_superuser:
             await self.close(reason="Unauthorized")
             return
-        pw_manager = async_playwright()
-        self.pw = await pw_manager.start()
-        if settings.PW_SERVER:
-            self.browser = await self.pw.firefox.connect(ws_endpoint=settings.PW_SERVER)
-        else:
-            self.browser = await self.pw.firefox.launch(
-                headless=True,
-                args=["--window-size=800,480", "--disable-web-security"],
-            )
         await self.accept()
+        pool = get_browser_pool()
+        if pool.full:
+            await self.send(text_data=json.dumps({"queued": True}))
+        self.context = await pool.acquire()
+        self.page = await self.context.new_page()
         logger.info(f"Connected: {self.scope['user']}")
 
     async def disconnect(self, close_code):
-        if self.page:
-            await self.page.close()
-        if self.browser:
-            await self.browser.close()
-        if self.pw:
-            await self.pw.stop()
+        await self.cancel_render()
+        if self.context:
+            await get_browser_pool().release(self.context)
+        self.context = None
         self.page = None
-        self.browser = None
-        self.pw = None
 
     async def receive(self, text_data=None, bytes_data=None) -> None:
         text_data_json = json.loads(text_data)
-        await self.send(
-            text_data=json.dumps(await self.generate(text_data_json.get("html", None)))
+        await self.cancel_render()
+        self.renders += 1
+        self.render_task = asyncio.create_task(
+            self.render_latest(self.renders, text_data_json.get("html", None))
         )
 
+    async def cancel_render(self):
+        if self.render_task and not self.render_task.done():
+            self.render_task.cancel()
+            await asyncio.gather(self.render_task, return_exceptions=True)
+        self.render_task = None
+
+    async def render_latest(self, render_id, html):
+        await asyncio.sleep(self.debounce)
+        try:
+            result, bitmap = await self.generate(html)
+        except asyncio.CancelledError:
+            logger.debug(f"Preview render #{render_id} superseded")
+            raise
+        except Exception:
+            logger.exception("Preview render failed")
+            await self.send(text_data=json.dumps({"id": render_id, "error": True}))
+            return
+        await self.send(text_data=json.dumps({"id": render_id, **result}))
+        if bitmap:
+            await self.send(bytes_data=bitmap)
+
     async def generate(self, html):
-        if not self.page:
-            self.page = await self.browser.new_page()
-            await self.page.set_viewport_size({"width": 800, "height": 480})
+        """Render `html`, as (timings, BMP bytes or None for empty HTML)."""
         start_time = time.time()
         if not html:
-            return {"content": ""}
-
-        # get random file name
-        folder = tempfile.mkdtemp()
+            return {"empty": True}, None
 
-        await self.page.set_content(html)
-        await self.page.evaluate(
-            'document.getElementsByTagName("html")[0].style.overflow = "hidden";'
-            'document.getElementsByTagName("body")[0].style.overflow = "hidden";'
+        timings = {}
+        png = await render.async_screenshot(self.page, html, timings=timings)
+        dither_start = time.time()
+        # In a thread: the consumer keeps receiving (and cancelling) meanwhile
+        bitmap = await asyncio.get_running_loop().run_in_executor(
+            None, render.dither, png
         )
-        await self.page.screenshot(path=f"/{folder}/screen.png")
-
-        with Image(filename=f"/{folder}/screen.png") as img:
-            img.transform_colorspace("gray")
-            img.quantize(2, colorspace_type="gray", dither=True)
-            img.type = "grayscale"
-            img.save(filename=f"bmp3:/{folder}/screen.bmp")
-
-        with open(f"/{folder}/screen.bmp", "rb") as f:
-            # base64
-            screen = f"data:image/bmp;base64,{base64.b64encode(f.read()).decode()}"
-
-        # clean up
-        shutil.rmtree(folder, ignore_errors=True)
+        timings["dither"] = time.time() - dither_start
 
         return (
             {
-                "content": screen,
+                "content_type": "image/bmp",
                 "render_time": time.time() - start_time,
+                "timings": timings,
             },
+            bitmap,
         )
@@ -0,0 +1,372 @@
+"""
+The TrueType fonts of trmnl/static/fonts, rasterized to 1-bit glyphs for the
+canvas renderer (see trmnl.canvas), without a browser nor a font library.
+
+Only what these fonts use is supported: TrueType outlines (simple and composite
+glyphs), the Unicode cmap (formats 4 and 12) and the horizontal metrics.
+Glyphs are filled with the non-zero winding rule, a pixel being inked when its
+center is inside the outline: no anti-aliasing, which suits the pixel fonts of
+the framework and the e-ink screens.
+"""
+
+import functools
+import math
+import struct
+from dataclasses import dataclass
+from pathlib import Path
+
+FONT_DIR = Path(__file__).resolve().parent / "static" / "fonts"
+# The families of the framework CSS, see trmnl/static/css/plugins.css
+FONT_FILES = {
+    "BlockKie": "BlockKie.ttf",
+    "NicoBold": "NicoBold-Regular.ttf",
+    "NicoClean": "NicoClean-Regular.ttf",
+    "NicoPups": "NicoPups-Regular.ttf",
+    "Dogicapixel": "dogicapixel.ttf",
+    "DogicapixelBold": "dogicapixelbold.ttf",
+}
+# Line segments per quadratic curve of the outlines
+CURVE_STEPS = 6
+
+# Composite glyph flags
+ARG_1_AND_2_ARE_WORDS = 0x0001
+ARGS_ARE_XY_VALUES = 0x0002
+WE_HAVE_A_SCALE = 0x0008
+MORE_COMPONENTS = 0x0020
+WE_HAVE_AN_X_AND_Y_SCALE = 0x0040
+WE_HAVE_A_TWO_BY_TWO = 0x0080
+
+
+class FontError(ValueError):
+    pass
+
+
+@dataclass
+class Glyph:
+    # Offsets (in pixels) of the top left corner of `rows` from the pen
+    # position on the baseline
+    left: int
+    top: int
+    width: int
+    # One integer per row, `width` bits wide, the most significant bit being
+    # the leftmost pixel and 1 meaning ink
+    rows: list
+    advance: float
+
+
+class Font:
+    def __init__(self, data, name=""):
+        self.name = name
+        self.data = data
+        try:
+            self.tables = self._read_tables()
+            (self.units_per_em,) = struct.unpack_from(
+                ">H", data, self.tables["head"] + 18
+            )
+            (self.long_offsets,) = struct.unpack_from(
+                ">h", data, self.tables["head"] + 50
+            )
+            self.ascender, self.descender, self.line_gap = struct.unpack_from(
+                ">hhh", data, self.tables["hhea"] + 4
+            )
+            (self.metrics_count,) = struct.unpack_from(
+                ">H", data, self.tables["hhea"] + 34
+            )
+            (self.glyph_count,) = struct.unpack_from(
+                ">H", data, self.tables["maxp"] + 4
+            )
+            self.char_map = self._read_cmap()
+        except (KeyError, struct.error) as e:
+            raise FontError(f"Unsupported font {name}: {e}") from e
+
+    def __repr__(self):
+        return f"<Font {self.name}>"
+
+    @classmethod
+    def from_file(cls, path):
+        path = Path(path)
+        return cls(path.read_bytes(), path.stem)
+
+    def _read_tables(self):
+        (count,) = struct.unpack_from(">H", self.data, 4)
+        tables = {}
+        for index in range(count):
+            tag, _checksum, offset, _length = struct.unpack_from(
+                ">4sIII", self.data, 12 + 16 * index
+            )
+            tables[tag.decode("latin-1")] = offset
+        return tables
+
+    def _read_cmap(self):
+        """{code point: glyph index} of the best Unicode subtable"""
+        base = self.tables["cmap"]
+        (count,) = struct.unpack_from(">H", self.data, base + 2)
+        subtables = {}
+        for index in range(count):
+            platform, encoding, offset = struct.unpack_from(
+                ">HHI", self.data, base + 4 + 8 * index
+            )
+            (table_format,) = struct.unpack_from(">H", self.data, base + offset)
+            subtables[(platform, encoding, table_format)] = base + offset
+        for key in ((3, 10, 12), (0, 4, 12), (3, 1, 4), (0, 3, 4), (0, 1, 4)):
+            if key in subtables:
+                read = self._read_cmap_12 if key[2] == 12 else self._read_cmap_4
+                return read(subtables[key])
+        raise FontError("No Unicode cmap")
+
+    def _read_cmap_4(self, offset):
+        (segments,) = struct.unpack_from(">H", self.data, offset + 6)
+        segments //= 2
+        ends = offset + 14
+        starts = ends + 2 * segments + 2
+        deltas = starts + 2 * segments
+        range_offsets = deltas + 2 * segments
+        char_map = {}
+        for index in range(segments):
+            (end,) = struct.unpack_from(">H", self.data, ends + 2 * index)
+            (start,) = struct.unpack_from(">H", self.data, starts + 2 * index)
+            (delta,) = struct.unpack_from(">h", self.data, deltas + 2 * index)
+            position = range_offsets + 2 * index
+            (range_offset,) = struct.unpack_from(">H", self.data, position)
+            for code in range(start, min(end, 0xFFFE) + 1):
+                if range_offset:
+                    (glyph,) = struct.unpack_from(
+                        ">H", self.data, position + range_offset + 2 * (code - start)
+                    )
+                    if glyph:
+                        glyph = (glyph + delta) & 0xFFFF
+                else:
+                    glyph = (code + delta) & 0xFFFF
+                if glyph:
+                    char_map[code] = glyph
+        return char_map
+
+    def _read_cmap_12(self, offset):
+        (groups,) = struct.unpack_from(">I", self.data, offset + 12)
+        char_map = {}
+        for index in range(groups):
+            start, end, glyph = struct.unpack_from(
+                ">III", self.data, offset + 16 + 12 * index
+            )
+            for code in range(start, end + 1):
+                char_map[code] = glyph + code - start
+        return char_map
+
+    def glyph_index(self, char):
+        return self.char_map.get(ord(char), 0)
+
+    def advance_width(self, glyph):
+        """Advance of a glyph, in font units"""
+        index = min(glyph, self.metrics_count - 1)
+        (advance,) = struct.unpack_from(
+            ">H", self.data, self.tables["hmtx"] + 4 * index
+        )
+        return advance
+
+    def _glyph_offset(self, glyph):
+        loca = self.tables["loca"]
+        if self.long_offsets:
+            start, end = struct.unpack_from(">II", self.data, loca + 4 * glyph)
+        else:
+            start, end = struct.unpack_from(">HH", self.data, loca + 2 * glyph)
+            start, end = start * 2, end * 2
+        return self.tables["glyf"] + start, end - start
+
+    def contours(self, glyph, depth=0):
+        """The outline of a glyph: [[(x, y, on curve), ...], ...] in font units"""
+        if glyph >= self.glyph_count or depth > 8:
+            return []
+        offset, length = self._glyph_offset(glyph)
+        if not length:
+            return []
+        (contour_count,) = struct.unpack_from(">h", self.data, offset)
+        if contour_count < 0:
+            return self._composite_contours(offset + 10, depth)
+        ends = struct.unpack_from(f">{contour_count}H", self.data, offset + 10)
+        position = offset + 10 + 2 * contour_count
+        (instructions,) = struct.unpack_from(">H", self.data, position)
+        position += 2 + instructions
+        point_count = ends[-1] + 1 if ends else 0
+        flags = []
+        while len(flags) < point_count:
+            flag = self.data[position]
+            position += 1
+            flags.append(flag)
+            if flag & 0x08:
+                flags.extend([flag] * self.data[position])
+                position += 1
+        xs, position = self._coordinates(flags, position, 0x02, 0x10)
+        ys, position = self._coordinates(flags, position, 0x04, 0x20)
+        contours, start = [], 0
+        for end in ends:
+            contours.append(
+                [(xs[i], ys[i], bool(flags[i] & 0x01)) for i in range(start, end + 1)]
+            )
+            start = end + 1
+        return contours
+
+    def _coordinates(self, flags, position, short_flag, same_flag):
+        values, value = [], 0
+        for flag in flags:
+            if flag & short_flag:
+                delta = self.data[position]
+                position += 1
+                value += delta if flag & same_flag else -delta
+            elif not flag & same_flag:
+                (delta,) = struct.unpack_from(">h", self.data, position)
+                position += 2
+                value += delta
+            values.append(value)
+        return values, position
+
+    def _composite_contours(self, position, depth):
+        contours = []
+        while True:
+            flags, component = struct.unpack_from(">HH", self.data, position)
+            position += 4
+            if flags & ARG_1_AND_2_ARE_WORDS:
+                dx, dy = struct.unpack_from(">hh", self.data, position)
+                position += 4
+            else:
+                dx, dy = struct.unpack_from(">bb", self.data, position)
+                position += 2
+            if not flags & ARGS_ARE_XY_VALUES:
+                # Point matching, not used by these fonts
+                dx = dy = 0
+            a, b, c, d = 1.0, 0.0, 0.0, 1.0
+            if flags & WE_HAVE_A_SCALE:
+                (a,) = struct.unpack_from(">h", self.data, position)
+                a = d = a / 16384
+                position += 2
+            elif flags & WE_HAVE_AN_X_AND_Y_SCALE:
+                a, d = (
+                    value / 16384
+                    for value in struct.unpack_from(">hh", self.data, position)
+                )
+                position += 4
+            elif flags & WE_HAVE_A_TWO_BY_TWO:
+                a, b, c, d = (
+                    value / 16384
+                    for value in struct.unpack_from(">hhhh", self.data, position)
+                )
+                position += 8
+            for contour in self.contours(component, depth + 1):
+                contours.append(
+                    [
+                        (a * x + c * y + dx, b * x + d * y + dy, on)
+                        for x, y, on in contour
+                    ]
+                )
+            if not flags & MORE_COMPONENTS:
+                return contours
+
+    @functools.lru_cache(maxsize=4096)
+    def glyph(self, glyph, size):
+        """Rasterize a glyph at `size` pixels per em, see Glyph"""
+        scale = size / self.units_per_em
+        edges = []
+        for contour in self.contours(glyph):
+            points = [(x * scale, -y * scale) for x, y in flatten(contour)]
+            edges += zip(points, points[1:] + points[:1])
+        advance = self.advance_width(glyph) * scale
+        if not edges:
+            return Glyph(0, 0, 0, [], advance)
+        xs = [x for edge in edges for x, _y in edge]
+        ys = [y for edge in edges for _x, y in edge]
+        left, right = math.floor(min(xs)), math.ceil(max(xs))
+        top, bottom = math.floor(min(ys)), math.ceil(max(ys))
+        width = right - left
+        rows = []
+        for row in range(top, bottom):
+            center = row + 0.5
+            crossings = []
+            for (x0, y0), (x1, y1) in edges:
+                if y0 <= center < y1 or y1 <= center < y0:
+                    x = x0 + (center - y0) * (x1 - x0) / (y1 - y0)
+                    crossings.append((x, 1 if y1 > y0 else -1))
+            crossings.sort()
+            bits, winding = 0, 0
+            for (x, direction), (next_x, _next) in zip(crossings, crossings[1:]):
+                winding += direction
+                if not winding:
+                    continue
+                # The pixels whose center is between the two crossings
+                first = math.ceil(x - left - 0.5)
+                last = math.ceil(next_x - left - 0.5)
+                if last > first:
+                    bits |= ((1 << (last - first)) - 1) << (width - last)
+            rows.append(bits)
+        return Glyph(left, top, width, rows, advance)
+
+    def glyphs(self, text, size):
+        """The glyphs of a text and their pen positions (in pixels)"""
+        pen = 0.0
+        for char in text:
+            glyph = self.glyph(self.glyph_index(char), size)
+            yield round(pen), glyph
+            pen += glyph.advance
+
+    def measure(self, text, size):
+        """Width of a text in pixels"""
+        return round(sum(glyph.advance for _pen, glyph in self.glyphs(text, size)))
+
+    def ascent(self, size):
+        return round(self.ascender * size / self.units_per_em)
+
+    def line_height(self, size):
+        return round(
+            (self.ascender - self.descender + self.line_gap) * size / self.units_per_em
+        )
+
+
+def flatten(contour):
+    """The points of a contour, its quadratic curves split into segments"""
+    if not contour:
+        return []
+    # Start on a point of the curve
+    start = next((i for i, (_x, _y, on) in enumerate(contour) if on), None)
+    if start is None:
+        x0, y0, _on = contour[-1]
+        x1, y1, _on = contour[0]
+        contour = [((x0 + x1) / 2, (y0 + y1) / 2, True)] + contour
+    else:
+        contour = contour[start:] + contour[:start]
+    points = [contour[0][:2]]
+    control = None
+    for x, y, on in contour[1:] + contour[:1]:
+        if on:
+            if control:
+                points += curve(points[-1], control, (x, y))
+            else:
+                points.append((x, y))
+            control = None
+        elif control:
+            middle = ((control[0] + x) / 2, (control[1] + y) / 2)
+            points += curve(points[-1], control, middle)
+            control = (x, y)
+        else:
+            control = (x, y)
+    return points[:-1]
+
+
+def curve(start, control, end):
+    points = []
+    for step in range(1, CURVE_STEPS + 1):
+        t = step / CURVE_STEPS
+        points.append(
+            (
+                (1 - t) ** 2 * start[0] + 2 * (1 - t) * t * control[0] + t**2 * end[0],
+                (1 - t) ** 2 * start[1] + 2 * (1 - t) * t * control[1] + t**2 * end[1],
+            )
+        )
+    return points
+
+
+@functools.cache
+def get_font(name):
+    """A font of FONT_FILES, loaded once per process"""
+    try:
+        filename = FONT_FILES[name]
+    except KeyError:
+        raise FontError(f"Unknown font {name}") from None
+    return Font.from_file(FONT_DIR / filename)
@@ -0,0 +1,132 @@
+"""
+Cache of verified API keys, so authenticated requests don't hit the database.
+
+Entries are keyed by the SHA-256 of the key, in a small in-process LRU backed
+by the Django cache. Saving or deleting an API key, or deleting a device, evicts
+its entry from the Django cache and from the LRU of the process doing it. The
+LRU of the other processes can't be reached: they keep accepting a deleted key
+for up to API_KEY_CACHE_TTL seconds, the TTL of their entries.
+"""
+
+import hashlib
+import time
+from collections import OrderedDict
+from threading import Lock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import APIKey, Device
+
+
+def hash_key(key):
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+class LRUCache:
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (value, time.monotonic() + self.ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+class VerifiedKeyCache:
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self.local = LRUCache(settings.API_KEY_CACHE_SIZE, settings.API_KEY_CACHE_TTL)
+
+    def cache_key(self, key_hash):
+        return f"{self.prefix}:{key_hash}"
+
+    def get(self, key_hash):
+        value = self.local.get(key_hash)
+        if value is None:
+            value = cache.get(self.cache_key(key_hash))
+            if value is not None:
+                self.local.set(key_hash, value)
+        return value
+
+    def set(self, key_hash, value):
+        self.local.set(key_hash, value)
+        cache.set(self.cache_key(key_hash), value, settings.API_KEY_CACHE_TTL)
+
+    def delete(self, key_hash):
+        self.local.delete(key_hash)
+        cache.delete(self.cache_key(key_hash))
+
+
+# APIKey (with its user) by key hash
+api_keys = VerifiedKeyCache("api-key")
+# (device id, MAC address) by device key hash
+device_keys = VerifiedKeyCache("device-id")
+
+
+def get_api_key(key):
+    """The APIKey matching a plain key, or None."""
+    key_hash = hash_key(key)
+    api_key = api_keys.get(key_hash)
+    if api_key is None:
+        api_key = APIKey.objects.select_related("user").filter(key=key_hash).first()
+        if api_key is None:
+            return None
+        api_keys.set(key_hash, api_key)
+    return api_key
+
+
+def get_device_id(key, mac_address=None):
+    """The id of the device with this key (and MAC address if given), or None."""
+    key_hash = hash_key(key)
+    entry = device_keys.get(key_hash)
+    if entry is None:
+        entry = (
+            Device.objects.filter(api_key=key).values_list("id", "mac_address").first()
+        )
+        if entry is None:
+            return None
+        device_keys.set(key_hash, entry)
+    device_id, device_mac_address = entry
+    if mac_address is not None and mac_address != device_mac_address:
+        return None
+    return device_id
+
+
+@receiver([post_save, post_delete], sender=APIKey)
+def evict_api_key(sender, instance, **kwargs):
+    api_keys.delete(instance.key)
+
+
+# Device keys and MAC addresses never change: no eviction on save, which happens
+# on every /api/display call
+@receiver(post_delete, sender=Device)
+def evict_device_key(sender, instance, **kwargs):
+    device_keys.delete(hash_key(instance.api_key))
@@ -0,0 +1,125 @@
+import datetime
+from collections import Counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from trmnl.models import Device
+
+
+def has_content_at(device, when):
+    """Whether the device has a playlist item to render (see schedule_next_screen)"""
+    return any(
+        playlist.is_active_at(when)
+        and any(item.is_active for item in playlist.items.all())
+        for playlist in device.playlists.all()
+    )
+
+
+def simulate(devices, start, end, window, together):
+    """
+    Replay the polls of the devices from `start` to `end`, as scheduled by the
+    display API with polls spread over `window` seconds.
+    :return: the number of polls and of renders per second (UTC timestamp),
+        after the first poll of each device, which is the starting point
+    """
+    polls, renders = Counter(), Counter()
+    for device in devices:
+        last_seen_at = device.last_seen_at
+        now = start if together or not device.last_seen_at else device.last_seen_at
+        first = True
+        while now < end:
+            if not first:
+                polls[int(now.timestamp())] += 1
+            first = False
+            device.last_seen_at = now
+            next_screen_at = None
+            if has_content_at(device, now):
+                next_screen_at = device.next_screen_time(now, window)
+                renders[int(next_screen_at.timestamp())] += 1
+            refresh_rate = device.adaptive_refresh_rate(next_screen_at, now, window)
+            now += datetime.timedelta(seconds=refresh_rate)
+        device.last_seen_at = last_seen_at
+    return polls, renders
+
+
+def peak(counter, seconds=1):
+    """The highest count over `seconds` seconds"""
+    totals = Counter()
+    for second, count in counter.items():
+        totals[second // seconds] += count
+    return max(totals.values(), default=0)
+
+
+class Command(BaseCommand):
+    help = (
+        "Simulate the polls and renders of the paired devices and report the "
+        "busiest seconds and minutes, with and without spreading the polls."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--hours", type=float, default=24, help="Simulated period, from now"
+        )
+        parser.add_argument(
+            "--window",
+            type=int,
+            default=settings.POLL_SPREAD_SECONDS,
+            help="Seconds the polls are spread over (POLL_SPREAD_SECONDS)",
+        )
+        parser.add_argument(
+            "--from-last-poll",
+            action="store_true",
+            help="Start each device from its last poll, instead of all at once "
+            "(e.g. after a power or network outage)",
+        )
+
+    def handle(self, *args, **options):
+        devices = list(
+            Device.objects.filter(user__isnull=False).prefetch_related(
+                "playlists__items"
+            )
+        )
+        start = timezone.now().replace(microsecond=0)
+        end = start + datetime.timedelta(hours=options["hours"])
+        together = not options["from_last_poll"]
+        window = options["window"]
+        self.stdout.write(
+            f"{len(devices)} devices, {options['hours']:g} hours from {start}, "
+            + ("all polling at once" if together else "from their last poll")
+        )
+        rows = [("", "lockstep", f"spread over {window} s")]
+        results = [
+            simulate(devices, start, end, 0, together),
+            simulate(devices, start, end, window, together),
+        ]
+        for label, index, seconds in (
+            ("polls", 0, None),
+            ("peak polls / s", 0, 1),
+            ("peak polls / min", 0, 60),
+            ("renders", 1, None),
+            ("peak renders / s", 1, 1),
+            ("peak renders / min", 1, 60),
+        ):
+            rows.append(
+                (
+                    label,
+                    *(
+                        str(
+                            sum(result[index].values())
+                            if seconds is None
+                            else peak(result[index], seconds)
+                        )
+                        for result in results
+                    ),
+                )
+            )
+        widths = [max(len(row[column]) for row in rows) for column in range(3)]
+        for row in rows:
+            self.stdout.write(
+                "  ".join(
+                    cell.ljust(width) if column == 0 else cell.rjust(width)
+                    for column, (cell, width) in enumerate(zip(row, widths))
+                )
+            )
@@ -0,0 +1,29 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from trmnl.render_worker import RenderWorker
+
+
+class Command(BaseCommand):
+    help = "Render the screens queued when RENDER_MODE is 'worker'."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--pages",
+            type=int,
+            default=settings.RENDER_WORKER_PAGES,
+            help="Browser pages rendering concurrently",
+        )
+        parser.add_argument(
+            "--processes",
+            type=int,
+            default=settings.RENDER_WORKER_PROCESSES,
+            help="Processes dithering screenshots (defaults to the number of CPUs)",
+        )
+
+    def handle(self, *args, **options):
+        RenderWorker(
+            pages=options["pages"],
+            processes=options["processes"],
+            poll_interval=settings.RENDER_WORKER_POLL_INTERVAL,
+        ).run()
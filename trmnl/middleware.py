@@ -1,9 +1,16 @@
+import logging
 from asyncio import iscoroutinefunction
 from functools import wraps
 
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
 from django.http import JsonResponse
 
-from .models import APIKey
+from utils.query_stats import QueryStats
+
+from .key_cache import get_api_key
+
+logger = logging.getLogger("trmnl")
 
 
 class ApiKeyAuthMiddleware:
@@ -26,7 +33,7 @@ class ApiKeyAuthMiddleware:
             api_key = api_key.split("Bearer ")[1]
 
         # Check if the API key is valid
-        api_key = APIKey.objects.filter(key=api_key).first()
+        api_key = get_api_key(api_key)
         if not api_key:
             return self.reject
 
@@ -39,6 +46,28 @@ class ApiKeyAuthMiddleware:
         return JsonResponse({"status": 403, "message": "Invalid API Key"}, status=403)
 
 
+class QueryStatsMiddleware:
+    """
+    Record the number of queries, the total database time and the slowest
+    queries of each request. Enabled with the QUERY_STATS setting.
+    """
+
+    def __init__(self, get_response):
+        if not settings.QUERY_STATS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with QueryStats(keep_slowest=settings.QUERY_STATS_SLOWEST) as stats:
+            response = self.get_response(request)
+        response["X-DB-Queries"] = str(stats.count)
+        response["X-DB-Time"] = f"{stats.total_time_ms:.1f}ms"
+        logger.info(f"{request.method} {request.path} - {stats.summary()}")
+        for duration, sql in stats.slowest:
+            logger.debug(f"  {duration * 1000:.1f}ms: {sql}")
+        return response
+
+
 def require_api_key(view_func):
     """Mark a view function as requiring an API key."""
 
@@ -0,0 +1,27 @@
+# Generated by Django 5.1.15 on 2026-10-19 11:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("trmnl", "0009_playlist_name"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="screen",
+            name="claimed_at",
+            field=models.DateTimeField(
+                blank=True, null=True, verbose_name="Claimed by the render worker at"
+            ),
+        ),
+        migrations.AddField(
+            model_name="screen",
+            name="queued_at",
+            field=models.DateTimeField(
+                blank=True, null=True, verbose_name="Queued for rendering at"
+            ),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.1.15 on 2026-10-19 11:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("trmnl", "0010_screen_render_queue"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="device",
+            name="skipped_renders",
+            field=models.PositiveIntegerField(
+                default=0,
+                help_text="Renders identical to the screen already displayed",
+                verbose_name="Skipped renders",
+            ),
+        ),
+        migrations.AddField(
+            model_name="screen",
+            name="changed_fraction",
+            field=models.FloatField(
+                blank=True,
+                help_text="Fraction of the pixels changed since the previous screen",
+                null=True,
+                verbose_name="Changed pixels",
+            ),
+        ),
+        migrations.AddField(
+            model_name="screen",
+            name="changed_regions",
+            field=models.JSONField(
+                blank=True,
+                help_text="Bounding boxes of the areas changed since the previous screen",
+                null=True,
+                verbose_name="Changed regions",
+            ),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.15 on 2026-10-19 11:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("trmnl", "0011_screen_changes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="screen",
+            name="screen_png",
+            field=models.BinaryField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="screen",
+            name="screen_rle",
+            field=models.BinaryField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,27 @@
+import hashlib
+
+from django.db import migrations, models
+
+
+def hash_keys(apps, schema_editor):
+    APIKey = apps.get_model("trmnl", "APIKey")
+    for api_key in APIKey.objects.all():
+        api_key.key = hashlib.sha256(api_key.key.encode()).hexdigest()
+        api_key.save(update_fields=["key"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("trmnl", "0013_render_jobs"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="apikey",
+            name="key",
+            field=models.CharField(max_length=64, unique=True),
+        ),
+        # Hashes can't be reverted: unapplying keeps them, existing keys stop working
+        migrations.RunPython(hash_keys, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.1.15 on 2026-10-19 11:38
+
+from django.db import migrations, models
+
+# The PNG and RLE encodings don't compress: store them out of line without
+# trying to (Postgres only)
+COMPRESSED_COLUMNS = ["screen_png", "screen_rle"]
+
+
+def set_storage(storage):
+    def operation(apps, schema_editor):
+        if schema_editor.connection.vendor != "postgresql":
+            return
+        for column in COMPRESSED_COLUMNS:
+            schema_editor.execute(
+                f"ALTER TABLE trmnl_screen ALTER COLUMN {column} SET STORAGE {storage}"
+            )
+
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("plugins", "0006_remove_plugin_id_alter_plugin_uuid"),
+        ("trmnl", "0014_hash_api_keys"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="playlist",
+            index=models.Index(
+                condition=models.Q(("is_active", True)),
+                fields=["device", "uuid"],
+                name="playlist_active_device_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="playlistitem",
+            index=models.Index(
+                condition=models.Q(("is_active", True)),
+                fields=["playlist", "order"],
+                name="playlistitem_active_order_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="screen",
+            index=models.Index(
+                condition=models.Q(("generated", False), ("queued_at__isnull", False)),
+                fields=["queued_at"],
+                name="screen_pending_render_idx",
+            ),
+        ),
+        migrations.RunPython(set_storage("EXTERNAL"), set_storage("EXTENDED")),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.1.15 on 2026-10-19 11:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("trmnl", "0015_partial_indexes_screen_storage"),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name="devicelog",
+            options={
+                "ordering": ["-created_at", "device_id"],
+                "verbose_name": "Device Log",
+                "verbose_name_plural": "Device Logs",
+            },
+        ),
+        migrations.AddIndex(
+            model_name="devicelog",
+            index=models.Index(
+                fields=["device", "-created_at"], name="devicelog_device_latest_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="playlistitem",
+            index=models.Index(
+                condition=models.Q(("is_active", True)),
+                fields=["playlist", "-last_displayed_at"],
+                name="playlistitem_active_shown_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="screen",
+            index=models.Index(
+                fields=["device", "-created_at"], name="screen_device_latest_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="screen",
+            index=models.Index(
+                fields=["playlist_item", "-created_at"], name="screen_item_latest_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,76 @@
+# Generated by Django 5.1.15 on 2026-10-19 11:46
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def set_current_screens(apps, schema_editor):
+    Device = apps.get_model("trmnl", "Device")
+    Screen = apps.get_model("trmnl", "Screen")
+    for device in Device.objects.all():
+        screen = (
+            Screen.objects.filter(device=device, generated=True)
+            .select_related("playlist_item")
+            .order_by("-created_at")
+            .first()
+        )
+        if screen is None:
+            continue
+        device.current_screen = screen
+        device.current_screen_filename = f"{device.friendly_id}-{screen.id}"
+        device.current_screen_duration = (
+            screen.playlist_item.duration if screen.playlist_item else None
+        )
+        device.save(
+            update_fields=[
+                "current_screen",
+                "current_screen_filename",
+                "current_screen_duration",
+            ]
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("trmnl", "0016_hot_query_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="device",
+            name="current_screen",
+            field=models.ForeignKey(
+                blank=True,
+                editable=False,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="+",
+                to="trmnl.screen",
+                verbose_name="Current screen",
+            ),
+        ),
+        migrations.AddField(
+            model_name="device",
+            name="current_screen_duration",
+            field=models.PositiveIntegerField(
+                blank=True,
+                editable=False,
+                help_text="In seconds, the refresh rate of the device if empty",
+                null=True,
+                verbose_name="Current screen duration",
+            ),
+        ),
+        migrations.AddField(
+            model_name="device",
+            name="current_screen_filename",
+            field=models.CharField(
+                blank=True,
+                editable=False,
+                help_text="Without extension, which depends on the image format",
+                max_length=50,
+                verbose_name="Current screen filename",
+            ),
+        ),
+        migrations.RunPython(set_current_screens, migrations.RunPython.noop),
+    ]
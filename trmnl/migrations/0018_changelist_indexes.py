@@ -0,0 +1,21 @@
+# Generated by Django 5.1.15 on 2026-10-19 11:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("trmnl", "0017_device_current_screen"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="devicelog",
+            index=models.Index(fields=["created_at"], name="devicelog_created_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="screen",
+            index=models.Index(fields=["created_at"], name="screen_created_idx"),
+        ),
+    ]
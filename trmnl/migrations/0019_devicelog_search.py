@@ -0,0 +1,71 @@
+# Generated by Django 5.1.15 on 2026-10-19 12:05
+
+from django.db import migrations
+
+# Full-text index of the log messages: the strings and numbers of the JSON
+# message, see DeviceLogQuerySet.search
+
+# SQLite: an FTS5 table without a copy of the text (content=''), the triggers
+# index the logs however they are inserted (bulk inserts included). Removing
+# a row from a contentless table needs the text it was indexed with, which is
+# computed again from the old message.
+SQLITE_TEXT = (
+    "(SELECT group_concat(atom, ' ') FROM json_tree({message}) "
+    "WHERE type IN ('text', 'integer', 'real'))"
+)
+SQLITE_INSERT = (
+    "INSERT INTO trmnl_devicelog_fts (rowid, text) "
+    f"VALUES (new.id, {SQLITE_TEXT.format(message='new.message')});"
+)
+SQLITE_DELETE = (
+    "INSERT INTO trmnl_devicelog_fts (trmnl_devicelog_fts, rowid, text) "
+    f"VALUES ('delete', old.id, {SQLITE_TEXT.format(message='old.message')});"
+)
+SQLITE_FORWARD = [
+    "CREATE VIRTUAL TABLE trmnl_devicelog_fts USING fts5(text, content='')",
+    "INSERT INTO trmnl_devicelog_fts (rowid, text) "
+    f"SELECT id, {SQLITE_TEXT.format(message='message')} FROM trmnl_devicelog",
+    "CREATE TRIGGER trmnl_devicelog_fts_insert AFTER INSERT ON trmnl_devicelog "
+    f"BEGIN {SQLITE_INSERT} END",
+    "CREATE TRIGGER trmnl_devicelog_fts_delete AFTER DELETE ON trmnl_devicelog "
+    f"BEGIN {SQLITE_DELETE} END",
+    "CREATE TRIGGER trmnl_devicelog_fts_update AFTER UPDATE OF message "
+    f"ON trmnl_devicelog BEGIN {SQLITE_DELETE} {SQLITE_INSERT} END",
+]
+SQLITE_BACKWARD = [
+    "DROP TRIGGER trmnl_devicelog_fts_update",
+    "DROP TRIGGER trmnl_devicelog_fts_delete",
+    "DROP TRIGGER trmnl_devicelog_fts_insert",
+    "DROP TABLE trmnl_devicelog_fts",
+]
+
+# PostgreSQL: a GIN index on the text search vector of the message, which
+# must be the expression of DEVICELOG_TSVECTOR
+POSTGRES_FORWARD = [
+    "CREATE INDEX devicelog_message_search_idx ON trmnl_devicelog USING GIN "
+    "(jsonb_to_tsvector('simple', message, '[\"string\", \"numeric\"]'))",
+]
+POSTGRES_BACKWARD = ["DROP INDEX devicelog_message_search_idx"]
+
+
+def run(sqlite, postgres):
+    def operation(apps, schema_editor):
+        statements = {"sqlite": sqlite, "postgresql": postgres}
+        for statement in statements.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement)
+
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("trmnl", "0018_changelist_indexes"),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run(SQLITE_FORWARD, POSTGRES_FORWARD),
+            run(SQLITE_BACKWARD, POSTGRES_BACKWARD),
+        ),
+    ]
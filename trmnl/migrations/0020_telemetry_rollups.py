@@ -0,0 +1,97 @@
+# Generated by Django 5.1.15 on 2026-10-19 12:03
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("trmnl", "0019_devicelog_search"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="device",
+            name="battery_voltage",
+            field=models.FloatField(
+                blank=True, editable=False, null=True, verbose_name="Battery voltage"
+            ),
+        ),
+        migrations.AddField(
+            model_name="device",
+            name="firmware_version",
+            field=models.CharField(
+                blank=True,
+                editable=False,
+                max_length=20,
+                verbose_name="Firmware version",
+            ),
+        ),
+        migrations.AddField(
+            model_name="device",
+            name="rssi",
+            field=models.SmallIntegerField(
+                blank=True,
+                editable=False,
+                null=True,
+                verbose_name="Wi-Fi signal (RSSI)",
+            ),
+        ),
+        migrations.CreateModel(
+            name="TelemetryRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "resolution",
+                    models.PositiveIntegerField(
+                        choices=[(60, "Minute"), (3600, "Hour"), (86400, "Day")],
+                        verbose_name="Resolution",
+                    ),
+                ),
+                ("bucket", models.DateTimeField(verbose_name="Start of the bucket")),
+                ("samples", models.PositiveIntegerField(default=0)),
+                ("battery_count", models.PositiveIntegerField(default=0)),
+                ("battery_sum", models.FloatField(default=0)),
+                ("battery_min", models.FloatField(blank=True, null=True)),
+                ("battery_max", models.FloatField(blank=True, null=True)),
+                ("rssi_count", models.PositiveIntegerField(default=0)),
+                ("rssi_sum", models.IntegerField(default=0)),
+                ("rssi_min", models.SmallIntegerField(blank=True, null=True)),
+                ("rssi_max", models.SmallIntegerField(blank=True, null=True)),
+                ("firmware_version", models.CharField(blank=True, max_length=20)),
+                (
+                    "device",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="telemetry",
+                        to="trmnl.device",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Telemetry rollup",
+                "verbose_name_plural": "Telemetry rollups",
+                "ordering": ["device_id", "resolution", "bucket"],
+                "indexes": [
+                    models.Index(
+                        fields=["resolution", "bucket"], name="telemetry_bucket_idx"
+                    )
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("device", "resolution", "bucket"),
+                        name="telemetry_device_bucket_uniq",
+                    )
+                ],
+            },
+        ),
+    ]
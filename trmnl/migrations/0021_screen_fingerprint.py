@@ -0,0 +1,32 @@
+# Generated by Django 5.1.15 on 2026-10-19 12:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("trmnl", "0020_telemetry_rollups"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="screen",
+            name="fingerprint",
+            field=models.CharField(
+                blank=True,
+                help_text="Hash of the plugin data it was rendered from",
+                max_length=64,
+                null=True,
+                verbose_name="Fingerprint",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="screen",
+            index=models.Index(
+                condition=models.Q(("fingerprint__isnull", False), ("generated", True)),
+                fields=["fingerprint", "-created_at"],
+                name="screen_fingerprint_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.1.15 on 2026-10-19 14:02
+
+from django.db import migrations
+
+import utils.weekday_field
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("trmnl", "0021_screen_fingerprint"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="playlist",
+            name="weekdays",
+            field=utils.weekday_field.WeekdaysField(default=["0"]),
+        ),
+    ]
@@ -1,3 +1,5 @@
 from .device import APIKey, Device, DeviceLog
 from .playlist import Playlist, PlaylistItem
+from .render_job import RenderJob
 from .screen import Screen
+from .telemetry import TelemetryRollup
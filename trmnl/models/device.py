@@ -1,14 +1,19 @@
 import datetime
+import hashlib
 import logging
 import random
 import re
+import secrets
 import string
 
 from django.conf import settings
 from django.contrib.contenttypes.models import ContentType
 from django.core.exceptions import ValidationError
-from django.db import models
+from django.db import connections, models
+from django.db.models import BooleanField
+from django.db.models.expressions import RawSQL
 from django.utils import timezone
+from django.utils.functional import cached_property
 from django.utils.translation import gettext_lazy as _
 from scheduler import job
 from scheduler.models.task import Task, TaskArg, TaskType
@@ -18,6 +23,10 @@ from utils.model_utils import TimeStampedModel
 logger = logging.getLogger("trmnl")
 
 
+# Device fields holding the latest telemetry sample
+TELEMETRY_FIELDS = ("battery_voltage", "rssi", "firmware_version")
+
+
 class Device(TimeStampedModel):
     friendly_id = models.CharField(max_length=6, unique=True, null=False, blank=False)
     device_name = models.CharField(max_length=50)
@@ -31,6 +40,50 @@ class Device(TimeStampedModel):
     last_seen_at = models.DateTimeField(auto_now_add=True, null=True, blank=True)
     refreshes = models.IntegerField(default=0)
     refresh_rate = models.IntegerField(default=900)
+    skipped_renders = models.PositiveIntegerField(
+        verbose_name=_("Skipped renders"),
+        default=0,
+        help_text=_("Renders identical to the screen already displayed"),
+    )
+    # The screen served to the device, kept up to date by Screen.make_current
+    # so that polling reads the device row only
+    current_screen = models.ForeignKey(
+        "trmnl.Screen",
+        verbose_name=_("Current screen"),
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        editable=False,
+        related_name="+",
+    )
+    current_screen_filename = models.CharField(
+        verbose_name=_("Current screen filename"),
+        max_length=50,
+        blank=True,
+        editable=False,
+        help_text=_("Without extension, which depends on the image format"),
+    )
+    current_screen_duration = models.PositiveIntegerField(
+        verbose_name=_("Current screen duration"),
+        null=True,
+        blank=True,
+        editable=False,
+        help_text=_("In seconds, the refresh rate of the device if empty"),
+    )
+    # Latest telemetry, from the display polls (see trmnl.telemetry), the
+    # history is in the telemetry rollups
+    battery_voltage = models.FloatField(
+        verbose_name=_("Battery voltage"), null=True, blank=True, editable=False
+    )
+    rssi = models.SmallIntegerField(
+        verbose_name=_("Wi-Fi signal (RSSI)"), null=True, blank=True, editable=False
+    )
+    firmware_version = models.CharField(
+        verbose_name=_("Firmware version"),
+        max_length=20,
+        blank=True,
+        editable=False,
+    )
 
     class Meta:
         verbose_name = _("Device")
@@ -44,8 +97,18 @@ class Device(TimeStampedModel):
         return f"<Device: {self.device_name} ({self.friendly_id})>"
 
     @property
-    def current_screen(self):
-        return self.screen_set.order_by("-created_at").first()
+    def display_duration(self):
+        """How long (in seconds) the current screen should be displayed for"""
+        if self.current_screen_id is None or self.current_screen_duration is None:
+            return self.refresh_rate
+        return self.current_screen_duration
+
+    def current_image_filename(self, image_format="bmp"):
+        return f"{self.current_screen_filename}.{image_format}"
+
+    def current_image_url(self, image_format="bmp"):
+        filename = self.current_image_filename(image_format)
+        return f"/api/v1/media/{filename}?api_key={self.api_key}"
 
     def clean(self):
         # Validate MAC Address format
@@ -70,40 +133,97 @@ class Device(TimeStampedModel):
 
         super().save(*args, **kwargs)
 
+    @cached_property
+    def active_playlists(self):
+        """
+        The active playlists of the device by UUID, from the prefetched
+        playlists if any, loaded once for both the next screen and the refresh
+        rate of a poll.
+        """
+        if "playlists" in getattr(self, "_prefetched_objects_cache", {}):
+            return sorted(
+                (playlist for playlist in self.playlists.all() if playlist.is_active),
+                key=lambda playlist: playlist.uuid,
+            )
+        return list(self.playlists.filter(is_active=True).order_by("uuid"))
+
+    def refresh_from_db(self, *args, **kwargs):
+        super().refresh_from_db(*args, **kwargs)
+        # Like the prefetched playlists
+        self.__dict__.pop("active_playlists", None)
+
     def get_next_playlist_item(self):
         """Get the next item to display in the playlist."""
-        playlists = self.playlists.filter(is_active=True)
-        for playlist in playlists:
+        for playlist in self.active_playlists:
             if next_item := playlist.get_next_item():
                 # get_next_item also checks if the playlist is active now
                 return next_item
         return None
 
-    def schedule_next_screen(self):
-        """Schedule the next screen generation for this device."""
-        next_playlist_item = self.get_next_playlist_item()
-        if not next_playlist_item:
-            logger.info(f"No active playlist found for device  #{self.id}")
-            return
-        current_screen = self.current_screen
-        default_eta = timezone.now() + datetime.timedelta(seconds=5)
-        eta = default_eta
-        if current_screen:
-            # Schedule the next screen generation n seconds before the current screen expires
-            eta = (
+    @property
+    def poll_phase(self):
+        """
+        Offset of the slots of the device in each POLL_SPREAD_SECONDS window,
+        as a fraction of the window (from 0 to 1), from its friendly ID: the
+        same on every poll, different from one device to the other.
+        """
+        digest = hashlib.sha256(self.friendly_id.encode()).digest()
+        return int.from_bytes(digest[:4], "big") / 2**32
+
+    def spread(self, when, window=None):
+        """
+        Move a time to the next slot of the device. Slots are `window` (by
+        default POLL_SPREAD_SECONDS) seconds apart, at the phase of the device,
+        so that devices due at the same time (set up together, or waiting for
+        the same playlist) are spread over the window instead of coming all at
+        once. A slot passed by less than SCREEN_REFRESH_SECONDS_BEFORE_EXPIRY
+        is kept, which absorbs the delay of the request of the previous poll.
+        """
+        window = settings.POLL_SPREAD_SECONDS if window is None else window
+        if not window:
+            return when
+        delay = (self.poll_phase * window - when.timestamp()) % window
+        grace = int(settings.SCREEN_REFRESH_SECONDS_BEFORE_EXPIRY)
+        if grace < window and delay > window - grace:
+            delay -= window
+        return when + datetime.timedelta(seconds=delay)
+
+    def next_screen_time(self, now=None, window=None):
+        """
+        When to generate the next screen: n seconds before the current one
+        expires, or right away, at a slot of the device (see `spread`).
+        """
+        now = now or timezone.now()
+        eta = now + datetime.timedelta(seconds=5)
+        if self.current_screen_id:
+            # n seconds before the current screen expires
+            expires_at = (
                 self.last_seen_at
-                + datetime.timedelta(seconds=current_screen.display_duration)
+                + datetime.timedelta(seconds=self.display_duration)
                 - datetime.timedelta(
-                    seconds=settings.SCREEN_REFRESH_SECONDS_BEFORE_EXPIRY
+                    seconds=int(settings.SCREEN_REFRESH_SECONDS_BEFORE_EXPIRY)
                 )
             )
-            if eta < timezone.now():
+            if expires_at < now:
                 logger.info(
                     f"Screen already expired for device #{self.id}, scheduling now"
                 )
-                eta = default_eta
+            else:
+                eta = expires_at
         else:
             logger.info(f"No screen found for device #{self.id}")
+        return self.spread(eta, window)
+
+    def schedule_next_screen(self):
+        """
+        Schedule the next screen generation for this device.
+        :return: when the screen will be generated, None without active playlist
+        """
+        next_playlist_item = self.get_next_playlist_item()
+        if not next_playlist_item:
+            logger.info(f"No active playlist found for device  #{self.id}")
+            return None
+        eta = self.next_screen_time()
         # Create or update task (django-tasks-scheduler)
         task_identifier = (
             f"Screen Generation for Device {self.friendly_id} (#{self.id})"
@@ -114,7 +234,7 @@ class Device(TimeStampedModel):
             callable="trmnl.models.device.generate_next_screen",
             defaults={
                 "enabled": True,
-                "queue": "default",
+                "queue": "render",
                 "result_ttl": 1800,
                 "scheduled_time": eta,
             },
@@ -131,28 +251,157 @@ class Device(TimeStampedModel):
             )
         else:
             logger.info(f"Task updated for device #{self.id} : {task}")
+        return eta
+
+    def adaptive_refresh_rate(self, next_screen_at, now=None, window=None):
+        """
+        How long (in seconds) the device can sleep until its content changes:
+        - until the next screen is generated (see schedule_next_screen), or
+          one of its playlists starts or stops being active if that's sooner,
+          plus SCREEN_REFRESH_SECONDS_BEFORE_EXPIRY to let the render complete,
+        - outside of the active periods of all its playlists, until the next
+          one starts,
+        - `display_duration` for devices without playlists (their screens
+          are pushed through the API, at any time),
+        multiplied by LOW_BATTERY_REFRESH_FACTOR when the battery is below
+        LOW_BATTERY_VOLTAGE, kept within ADAPTIVE_REFRESH_MIN_SECONDS and
+        ADAPTIVE_REFRESH_MAX_SECONDS, then moved to a slot of the device (see
+        `spread`), which can take it out of these bounds by less than the
+        spread window.
+        """
+        now = now or timezone.now()
+        display_until = now + datetime.timedelta(seconds=self.display_duration)
+        if not settings.ADAPTIVE_REFRESH:
+            wake_at = self.spread(display_until, window)
+            return round((wake_at - now).total_seconds())
+        margin = datetime.timedelta(
+            seconds=int(settings.SCREEN_REFRESH_SECONDS_BEFORE_EXPIRY)
+        )
+        no_margin = datetime.timedelta(0)
+        playlists = self.active_playlists
+        transitions = [
+            transition
+            for playlist in playlists
+            if (transition := playlist.next_transition(now))
+        ]
+        if next_screen_at is not None:
+            # The next screen is at a slot (see next_screen_time), kept by the
+            # spread below
+            due_at = min([next_screen_at, *transitions])
+        elif not playlists:
+            due_at, margin = display_until, no_margin
+        elif transitions:
+            due_at = min(transitions)
+        else:
+            due_at = now + datetime.timedelta(
+                seconds=settings.ADAPTIVE_REFRESH_MAX_SECONDS
+            )
+            margin = no_margin
+        seconds = (due_at + margin - now).total_seconds()
+        if (
+            settings.LOW_BATTERY_VOLTAGE is not None
+            and self.battery_voltage is not None
+            and self.battery_voltage < settings.LOW_BATTERY_VOLTAGE
+        ):
+            seconds *= settings.LOW_BATTERY_REFRESH_FACTOR
+        seconds = min(
+            max(seconds, settings.ADAPTIVE_REFRESH_MIN_SECONDS),
+            settings.ADAPTIVE_REFRESH_MAX_SECONDS,
+        )
+        # Last, so that the poll stays at the slot of the device
+        due_at = now + datetime.timedelta(seconds=seconds) - margin
+        wake_at = self.spread(due_at, window) + margin
+        return round((wake_at - now).total_seconds())
 
     def get_screen(self, update_last_seen=False):
         if update_last_seen:
-            self.last_seen_at = timezone.now()
-            self.refreshes += 1
-            self.save()
+            self.mark_seen()
         return self.current_screen
 
+    def mark_seen(self, telemetry=None):
+        """Record a poll, with the telemetry sample sent along if any"""
+        self.last_seen_at = timezone.now()
+        self.refreshes += 1
+        update_fields = ["last_seen_at", "refreshes", "updated_at"]
+        for field in TELEMETRY_FIELDS:
+            value = getattr(telemetry, field, None)
+            if value is not None and value != "":
+                setattr(self, field, value)
+                update_fields.append(field)
+        # Not a full save, which could point back to a screen replaced meanwhile
+        self.save(update_fields=update_fields)
+
+
+# Full-text index of the log messages (strings and numbers of the JSON), see
+# migration 0019: an FTS5 table kept up to date by triggers on SQLite, a GIN
+# index on this expression on PostgreSQL
+DEVICELOG_FTS_TABLE = "trmnl_devicelog_fts"
+DEVICELOG_TSVECTOR = (
+    'jsonb_to_tsvector(\'simple\', "trmnl_devicelog"."message", '
+    '\'["string", "numeric"]\')'
+)
+
+
+class DeviceLogQuerySet(models.QuerySet):
+    def search(self, query):
+        """
+        Logs whose message contains all the words of the query, from the
+        full-text index. Words are matched whole and case-insensitively.
+        """
+        words = query.split()
+        if not words:
+            return self.none()
+        vendor = connections[self.db].vendor
+        if vendor == "sqlite":
+            # Each word quoted, FTS5 operators and punctuation are plain text
+            match = " ".join('"{}"'.format(word.replace('"', '""')) for word in words)
+            return self.filter(
+                pk__in=RawSQL(
+                    f"SELECT rowid FROM {DEVICELOG_FTS_TABLE} "
+                    f"WHERE {DEVICELOG_FTS_TABLE} MATCH %s",
+                    [match],
+                )
+            )
+        if vendor == "postgresql":
+            return self.filter(
+                RawSQL(
+                    f"{DEVICELOG_TSVECTOR} @@ plainto_tsquery('simple', %s)",
+                    [" ".join(words)],
+                    output_field=BooleanField(),
+                )
+            )
+        # Not indexed
+        queryset = self
+        for word in words:
+            queryset = queryset.filter(message__icontains=word)
+        return queryset
+
 
 class DeviceLog(TimeStampedModel):
     device = models.ForeignKey(Device, on_delete=models.CASCADE)
     message = models.JSONField()
 
+    objects = DeviceLogQuerySet.as_manager()
+
     class Meta:
         verbose_name = _("Device Log")
         verbose_name_plural = _("Device Logs")
-        ordering = ["-created_at", "device"]
+        # By the column rather than by the device's own ordering, which would
+        # join the devices and sort every log
+        ordering = ["-created_at", "device_id"]
+        indexes = [
+            models.Index(
+                fields=["device", "-created_at"], name="devicelog_device_latest_idx"
+            ),
+            # All the logs, newest first (admin)
+            models.Index(fields=["created_at"], name="devicelog_created_idx"),
+        ]
 
 
 class APIKey(TimeStampedModel):
     name = models.CharField(max_length=50, null=False, blank=False)
-    key = models.CharField(max_length=32, unique=True, null=False, blank=False)
+    # SHA-256 of the key, which is only known when the APIKey is created
+    key = models.CharField(max_length=64, unique=True, null=False, blank=False)
     user = models.ForeignKey(
         "auth.User", on_delete=models.CASCADE, null=False, blank=False
     )
@@ -169,9 +418,12 @@ class APIKey(TimeStampedModel):
         return f"<API Key: {self.name} (Owner: {self.user.username})>"
 
     def save(self, *args, **kwargs):
-        # Generate a random API key on first create
+        # Generate a random API key on first create, only its hash is stored
         if not self.key:
-            self.key = "".join(random.choices(string.ascii_letters, k=32))
+            self.raw_key = "".join(
+                secrets.choice(string.ascii_letters) for _ in range(32)
+            )
+            self.key = hashlib.sha256(self.raw_key.encode()).hexdigest()
         super().save(*args, **kwargs)
 
 
@@ -180,7 +432,7 @@ class APIKey(TimeStampedModel):
 ################
 
 
-@job
+@job("render")
 def generate_next_screen(device_id: int):
     logger.info(f"Generating next screen for device #{device_id}")
     device = Device.objects.get(pk=device_id)
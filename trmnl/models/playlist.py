@@ -1,14 +1,18 @@
+import datetime
 import logging
 import uuid
 from typing import Optional
 
 from django.db import models
+from django.db.models import Q
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
 from utils.model_utils import TimeStampedModel
 from utils.weekday_field import Weekday, WeekdaysField
 
+from .device import Device
+
 logger = logging.getLogger("trmnl")
 
 
@@ -40,6 +44,13 @@ class Playlist(TimeStampedModel):
         verbose_name = _("Playlist")
         verbose_name_plural = _("Playlists")
         ordering = ["device", "uuid"]
+        indexes = [
+            models.Index(
+                fields=["device", "uuid"],
+                condition=Q(is_active=True),
+                name="playlist_active_device_idx",
+            ),
+        ]
 
     def __str__(self):
         return f"{self.device} - {self.name or self.uuid}"
@@ -47,16 +58,74 @@ class Playlist(TimeStampedModel):
     def __repr__(self):
         return f"<Playlist: {self.device} - {self.uuid}>"
 
+    @property
+    def has_time_window(self) -> bool:
+        return self.active_from is not None and self.active_to is not None
+
     def is_active_now(self) -> bool:
+        return self.is_active_at(timezone.now())
+
+    def is_active_at(self, when: datetime.datetime) -> bool:
+        """Whether the playlist is active at a time, in the current time zone"""
         if not self.is_active:
             return False
-        current_weekday = Weekday(timezone.now().isoweekday())
-        if current_weekday not in self.weekdays:
+        when = timezone.localtime(when)
+        if not self.weekdays & Weekday(1 << when.weekday()):
             return False
-        if self.active_from is None or self.active_to is None:
+        if not self.has_time_window:
             return True
-        current_time = timezone.now().time()
-        return self.active_from <= current_time <= self.active_to
+        return self.active_from <= when.time() <= self.active_to
+
+    def next_activation(self, after: datetime.datetime) -> Optional[datetime.datetime]:
+        """
+        The next start of an active period of the playlist after a time: the
+        start of its time window (or midnight) on one of its weekdays.
+        :return: None if the playlist is never active
+        """
+        if not self.is_active:
+            return None
+        if self.has_time_window and self.active_from > self.active_to:
+            return None
+        start_time = self.active_from if self.has_time_window else datetime.time.min
+        local_date = timezone.localtime(after).date()
+        for days in range(8):
+            day = local_date + datetime.timedelta(days=days)
+            if not self.weekdays & Weekday(1 << day.weekday()):
+                continue
+            start = timezone.make_aware(datetime.datetime.combine(day, start_time))
+            if start > after:
+                return start
+        return None
+
+    def active_until(self, when: datetime.datetime) -> Optional[datetime.datetime]:
+        """
+        The end of the active period the playlist is in at a time: the end of
+        its time window, or the midnight after its last weekday in a row.
+        :return: None if the playlist isn't active then, or never stops
+        """
+        if not self.is_active_at(when):
+            return None
+        local_date = timezone.localtime(when).date()
+        if self.has_time_window:
+            return timezone.make_aware(
+                datetime.datetime.combine(local_date, self.active_to)
+            )
+        for days in range(1, 8):
+            day = local_date + datetime.timedelta(days=days)
+            if not self.weekdays & Weekday(1 << day.weekday()):
+                return timezone.make_aware(
+                    datetime.datetime.combine(day, datetime.time.min)
+                )
+        return None
+
+    def next_transition(self, after: datetime.datetime) -> Optional[datetime.datetime]:
+        """
+        When the playlist next starts or stops being active after a time, see
+        next_activation and active_until.
+        """
+        if self.is_active_at(after):
+            return self.active_until(after)
+        return self.next_activation(after)
 
     def get_next_item(self) -> Optional["PlaylistItem"]:
         """
@@ -125,6 +194,19 @@ class PlaylistItem(TimeStampedModel):
         verbose_name = _("Playlist item")
         verbose_name_plural = _("Playlist items")
         ordering = ["playlist", "order", "uuid"]
+        indexes = [
+            models.Index(
+                fields=["playlist", "order"],
+                condition=Q(is_active=True),
+                name="playlistitem_active_order_idx",
+            ),
+            # The last displayed item, see get_next_item
+            models.Index(
+                fields=["playlist", "-last_displayed_at"],
+                condition=Q(is_active=True),
+                name="playlistitem_active_shown_idx",
+            ),
+        ]
 
     def __str__(self):
         return f"{self.playlist} - {self.plugin.name} ({self.uuid})"
@@ -132,10 +214,20 @@ class PlaylistItem(TimeStampedModel):
     def __repr__(self):
         return f"<PlaylistItem: {self.playlist} - {self.uuid}>"
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is None or "duration" in update_fields:
+            # Copied on the devices showing a screen of the item, see
+            # Screen.make_current
+            Device.objects.filter(current_screen__playlist_item=self).exclude(
+                current_screen_duration=self.duration
+            ).update(current_screen_duration=self.duration)
+
     def generate_screen(self, update_last_displayed_at: bool = True):
         """Generate a screen for this playlist item."""
         screen = self.plugin.create_screen(self.playlist.device, playlist_item=self)
         if update_last_displayed_at:
             self.last_displayed_at = timezone.now()
-            self.save()
+            self.save(update_fields=["last_displayed_at", "updated_at"])
         return screen
@@ -0,0 +1,161 @@
+import logging
+import uuid
+from urllib.parse import urlsplit
+
+import requests
+from django.conf import settings
+from django.db import models
+from django.http.request import validate_host
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from scheduler import job
+
+from trmnl import render
+from utils.model_utils import TimeStampedModel
+
+logger = logging.getLogger("trmnl")
+
+
+def is_allowed_callback(url):
+    """Whether a callback URL is HTTP(S) on a host of RENDER_JOB_CALLBACK_HOSTS"""
+    parts = urlsplit(url)
+    return (
+        parts.scheme in ("http", "https")
+        and bool(parts.hostname)
+        and validate_host(parts.hostname, settings.RENDER_JOB_CALLBACK_HOSTS)
+    )
+
+
+class RenderJob(TimeStampedModel):
+    """
+    Screens pushed through the API in async or batch mode, rendered outside of
+    the web request: by the render worker in RENDER_MODE "worker", by a
+    scheduler job otherwise.
+    """
+
+    class Status(models.TextChoices):
+        PENDING = "pending", _("Pending")
+        DONE = "done", _("Done")
+        FAILED = "failed", _("Failed")
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey("auth.User", on_delete=models.CASCADE)
+    status = models.CharField(
+        max_length=10, choices=Status.choices, default=Status.PENDING
+    )
+    callback_url = models.URLField(
+        verbose_name=_("Callback URL"),
+        blank=True,
+        help_text=_("Notified with the job status once it is done or failed"),
+    )
+    error = models.TextField(blank=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = _("Render job")
+        verbose_name_plural = _("Render jobs")
+        ordering = ["-created_at"]
+
+    def __str__(self):
+        return f"Render job {self.id} ({self.status})"
+
+    def enqueue(self):
+        if settings.RENDER_MODE == "worker":
+            self.screens.update(queued_at=timezone.now())
+        else:
+            run_render_job.delay(str(self.id))
+
+    def as_json(self):
+        return {
+            "job": str(self.id),
+            "state": self.status,
+            "error": self.error or None,
+            "screens": [
+                {
+                    "id": screen.id,
+                    "device": screen.device.friendly_id,
+                    "generated": screen.generated,
+                    "image_url": (
+                        screen.image_url_for_device() if screen.generated else None
+                    ),
+                }
+                for screen in self.screens.select_related("device").order_by("id")
+            ],
+        }
+
+    def screen_rendered(self):
+        """Mark the job as done once all its screens are rendered."""
+        if self.status != self.Status.PENDING:
+            return
+        if not self.screens.filter(generated=False).exists():
+            self.complete(self.Status.DONE)
+
+    def screen_failed(self, error):
+        if self.status == self.Status.PENDING:
+            self.complete(self.Status.FAILED, error)
+
+    def complete(self, status, error=""):
+        updated = RenderJob.objects.filter(
+            pk=self.pk, status=self.Status.PENDING
+        ).update(status=status, error=error, completed_at=timezone.now())
+        self.status, self.error = status, error
+        if updated and self.callback_url:
+            notify_render_job.delay(str(self.id))
+
+
+#####################
+## Render Job Jobs ##
+#####################
+
+
+@job
+def run_render_job(job_id):
+    """
+    Render the screens of a job, each distinct HTML once. A failed HTML leaves
+    its screens not generated and the others are still rendered, the job then
+    fails with the errors.
+    """
+    render_job = RenderJob.objects.get(pk=job_id)
+    screens_by_html = {}
+    screens = render_job.screens.filter(generated=False).with_data("html")
+    for screen in screens.select_related("device"):
+        screens_by_html.setdefault(screen.html, []).append(screen)
+    errors = []
+    for html, screens in screens_by_html.items():
+        try:
+            bitmap = render.render_html(html, timeout=settings.RENDER_TIMEOUT)
+        except Exception as e:
+            logger.exception(
+                f"Render job {job_id}: screens {[screen.id for screen in screens]} "
+                "failed"
+            )
+            errors.append(str(e))
+            continue
+        for screen in screens:
+            screen.store_bitmap(bitmap)
+    logger.info(
+        f"Render job {job_id}: rendered {len(screens_by_html) - len(errors)} of "
+        f"{len(screens_by_html)} distinct screens"
+    )
+    if errors:
+        render_job.screen_failed("; ".join(dict.fromkeys(errors)))
+    else:
+        render_job.screen_rendered()
+
+
+@job
+def notify_render_job(job_id):
+    render_job = RenderJob.objects.get(pk=job_id)
+    if not is_allowed_callback(render_job.callback_url):
+        logger.warning(f"Callback of render job {job_id} to a host not allowed")
+        return
+    try:
+        # Not following redirects, which could lead to any host
+        requests.post(
+            render_job.callback_url,
+            json=render_job.as_json(),
+            timeout=settings.RENDER_JOB_CALLBACK_TIMEOUT,
+            allow_redirects=False,
+        ).raise_for_status()
+    except requests.RequestException:
+        logger.warning(f"Callback of render job {job_id} failed", exc_info=True)
@@ -1,23 +1,109 @@
 import base64
 import datetime
 import logging
-import shutil
-import tempfile
 
 from django.conf import settings
-from django.db import models
-from django.template.loader import get_template
+from django.db import connections, models, transaction
+from django.db.models import F, Q
 from django.utils import timezone
-from django.utils.safestring import mark_safe
 from django.utils.translation import gettext_lazy as _
-from playwright.sync_api import sync_playwright
 from scheduler import job
-from wand.image import Image
 
+from trmnl import render
+from trmnl.bitmap import Bitmap, BitmapError
 from utils.model_utils import TimeStampedModel
 
+from .device import Device
+from .render_job import RenderJob
+
 logger = logging.getLogger("trmnl")
 
+IMAGE_FORMATS = {
+    "bmp": "image/bmp",
+    "png": "image/png",
+    "rle": "application/x-trmnl-rle",
+}
+IMAGE_COLUMNS = {"bmp": "screen", "png": "screen_png", "rle": "screen_rle"}
+# Not loaded by Screen querysets unless asked for, see ScreenQuerySet.with_data
+LARGE_FIELDS = ("html", "screen", "screen_png", "screen_rle")
+
+
+class ScreenQuerySet(models.QuerySet):
+    def with_data(self, *fields):
+        """Load the given large fields (all of them by default) with the rows."""
+        if not fields:
+            return self.defer(None)
+        return self.defer(None).defer(*(f for f in LARGE_FIELDS if f not in fields))
+
+    def pending_render(self):
+        """Screens queued for the render worker and not claimed by a live one."""
+        stale = timezone.now() - datetime.timedelta(
+            seconds=settings.RENDER_WORKER_CLAIM_TIMEOUT
+        )
+        return self.filter(generated=False, queued_at__isnull=False).filter(
+            Q(claimed_at__isnull=True) | Q(claimed_at__lt=stale)
+        )
+
+    def claim_pending(self, limit):
+        """
+        Claim up to `limit` screens for rendering, oldest first, plus the
+        pending screens with the same HTML (rendered once by the worker).
+        Concurrent workers never render the same screen twice: claims lock the
+        rows with SELECT ... FOR UPDATE SKIP LOCKED where supported (Postgres),
+        each claim is a conditional UPDATE otherwise.
+        """
+        if connections[self.db].features.has_select_for_update_skip_locked:
+            claimed = self._claim_skip_locked(limit)
+        else:
+            claimed = self._claim_conditional(limit)
+        if not claimed:
+            return []
+        return list(
+            self.filter(pk__in=claimed)
+            .with_data("html")
+            .select_related("device", "playlist_item__plugin", "render_job")
+            .order_by("created_at")
+        )
+
+    def _claim_skip_locked(self, limit):
+        with transaction.atomic(using=self.db):
+            pending = self.pending_render().select_for_update(skip_locked=True)
+            claimed = list(
+                pending.order_by("queued_at").values_list("pk", flat=True)[:limit]
+            )
+            if claimed:
+                claimed += (
+                    pending.filter(html__in=self.filter(pk__in=claimed).values("html"))
+                    .exclude(pk__in=claimed)
+                    .values_list("pk", flat=True)
+                )
+                self.filter(pk__in=claimed).update(claimed_at=timezone.now())
+        return claimed
+
+    def _claim_conditional(self, limit):
+        claimed = []
+        candidates = self.pending_render().order_by("queued_at")
+        for pk in candidates.values_list("pk", flat=True)[:limit]:
+            now = timezone.now()
+            if self.pending_render().filter(pk=pk).update(claimed_at=now):
+                claimed.append(pk)
+        if not claimed:
+            return []
+        duplicates = self.pending_render().filter(
+            html__in=self.filter(pk__in=claimed).values("html")
+        )
+        for pk in duplicates.values_list("pk", flat=True):
+            now = timezone.now()
+            if self.pending_render().filter(pk=pk).update(claimed_at=now):
+                claimed.append(pk)
+        return claimed
+
+
+class ScreenManager(models.Manager.from_queryset(ScreenQuerySet)):
+    def get_queryset(self):
+        # Bitmaps and HTML are only loaded when used, see with_data
+        return super().get_queryset().defer(*LARGE_FIELDS)
+
 
 class Screen(TimeStampedModel):
     device = models.ForeignKey("trmnl.Device", on_delete=models.CASCADE)
@@ -32,11 +118,73 @@ class Screen(TimeStampedModel):
         blank=True,
         related_name="screens",
     )
+    render_job = models.ForeignKey(
+        "trmnl.RenderJob",
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="screens",
+    )
+    fingerprint = models.CharField(
+        verbose_name=_("Fingerprint"),
+        max_length=64,
+        null=True,
+        blank=True,
+        help_text=_("Hash of the plugin data it was rendered from"),
+    )
+    queued_at = models.DateTimeField(
+        verbose_name=_("Queued for rendering at"), null=True, blank=True
+    )
+    claimed_at = models.DateTimeField(
+        verbose_name=_("Claimed by the render worker at"), null=True, blank=True
+    )
+    # Compact encodings of `screen`, see trmnl.bitmap
+    screen_png = models.BinaryField(null=True, blank=True)
+    screen_rle = models.BinaryField(null=True, blank=True)
+    changed_fraction = models.FloatField(
+        verbose_name=_("Changed pixels"),
+        null=True,
+        blank=True,
+        help_text=_("Fraction of the pixels changed since the previous screen"),
+    )
+    changed_regions = models.JSONField(
+        verbose_name=_("Changed regions"),
+        null=True,
+        blank=True,
+        help_text=_("Bounding boxes of the areas changed since the previous screen"),
+    )
+
+    objects = ScreenManager()
 
     class Meta:
         verbose_name = _("Screen")
         verbose_name_plural = _("Screens")
         ordering = ["-created_at", "device"]
+        indexes = [
+            # The render queue, polled by the render workers
+            models.Index(
+                fields=["queued_at"],
+                condition=Q(generated=False, queued_at__isnull=False),
+                name="screen_pending_render_idx",
+            ),
+            # The latest screens of a device and of a playlist item
+            models.Index(
+                fields=["device", "-created_at"], name="screen_device_latest_idx"
+            ),
+            models.Index(
+                fields=["playlist_item", "-created_at"],
+                name="screen_item_latest_idx",
+            ),
+            # The screens already rendered from the same data, see
+            # Plugin.create_screen
+            models.Index(
+                fields=["fingerprint", "-created_at"],
+                condition=Q(generated=True, fingerprint__isnull=False),
+                name="screen_fingerprint_idx",
+            ),
+            # All the screens, newest first (admin), and the old ones
+            models.Index(fields=["created_at"], name="screen_created_idx"),
+        ]
 
     def __str__(self):
         return f"Screen (# {self.id}) for {self.device}"
@@ -51,58 +199,141 @@ class Screen(TimeStampedModel):
             return self.device.refresh_rate
         return self.playlist_item.duration
 
+    @property
+    def render_timeout(self):
+        """Browser deadline (in seconds), from the recipe of the playlist item"""
+        if not self.playlist_item:
+            return settings.RENDER_TIMEOUT
+        return self.playlist_item.plugin.get_recipe().get_render_timeout()
+
     def generate_screen(self):
-        # get random file name
-        folder = tempfile.mkdtemp()
+        return self.store_bitmap(
+            render.render_html(self.html, timeout=self.render_timeout)
+        )
 
-        with sync_playwright() as p:
-            if settings.PW_SERVER:
-                browser = p.firefox.connect(ws_endpoint=settings.PW_SERVER)
-            else:
-                browser = p.firefox.launch(
-                    headless=True,
-                    args=["--window-size=800,480", "--disable-web-security"],
-                )
-            page = browser.new_page()
-            page.set_viewport_size({"width": 800, "height": 480})
-
-            # Render template with Django template engine
-            template = get_template("screen.html")
-            html = template.render({"content": mark_safe(self.html)})
-            page.set_content(html)
-            page.evaluate(
-                'document.getElementsByTagName("html")[0].style.overflow = "hidden";'
-                'document.getElementsByTagName("body")[0].style.overflow = "hidden";'
+    def store_bitmap(self, bitmap):
+        """
+        Store the rendered bitmap, with what changed since the screen the device
+        currently shows. A playlist screen identical to that one is not kept:
+        the device keeps its screen, without a download or an e-ink refresh,
+        and the kept screen takes the fingerprint of this one.
+        :return: the screen to display, self or the identical previous screen
+        """
+        try:
+            decoded = Bitmap.from_bmp(bitmap)
+        except BitmapError:
+            logger.warning(f"Can't decode the bitmap of screen #{self.id}")
+            decoded = None
+        previous = (
+            Screen.objects.filter(
+                pk__in=Device.objects.filter(pk=self.device_id).values("current_screen")
             )
-            page.screenshot(path=f"/{folder}/screen.png")
-            browser.close()
-
-        with Image(filename=f"/{folder}/screen.png") as img:
-            img.transform_colorspace("gray")
-            img.quantize(2, colorspace_type="gray", dither=True)
-            img.type = "grayscale"
-            img.save(filename=f"bmp3:/{folder}/screen.bmp")
-
-        with open(f"/{folder}/screen.bmp", "rb") as f:
-            self.screen = f.read()
-            self.generated = True
+            .exclude(pk=self.pk)
+            .with_data("screen")
+            .order_by("pk")
+            .first()
+        )
+        if decoded and previous:
+            try:
+                diff = decoded.diff(Bitmap.from_bmp(previous.screen))
+            except BitmapError:
+                logger.warning(f"Can't compare screen #{self.id} to #{previous.id}")
+            else:
+                if diff.identical and self.playlist_item_id:
+                    logger.info(
+                        f"Screen #{self.id} is identical to screen #{previous.id}, "
+                        f"skipping it"
+                    )
+                    Device.objects.filter(pk=self.device_id).update(
+                        skipped_renders=F("skipped_renders") + 1
+                    )
+                    if self.fingerprint and previous.fingerprint != self.fingerprint:
+                        # Found by the next renders of the same data, see
+                        # Plugin.create_screen
+                        Screen.objects.filter(pk=previous.pk).update(
+                            fingerprint=self.fingerprint
+                        )
+                        previous.fingerprint = self.fingerprint
+                    if self.pk:
+                        self.delete()
+                    return previous
+                self.changed_fraction = diff.changed_fraction
+                self.changed_regions = diff.regions
+        self.screen = bitmap
+        if decoded:
+            self.screen_png = decoded.to_png()
+            self.screen_rle = decoded.to_rle()
+        self.generated = True
+        self.save()
+        self.make_current()
+        return self
+
+    def make_current(self):
+        """
+        Point the device to this screen, in a single UPDATE, unless it already
+        shows a more recent one (renders can complete out of order).
+        """
+        Device.objects.filter(pk=self.device_id).filter(
+            Q(current_screen__isnull=True)
+            | Q(current_screen__created_at__lte=self.created_at)
+        ).update(
+            current_screen=self,
+            current_screen_filename=self.image_name_for_device,
+            current_screen_duration=(
+                self.playlist_item.duration if self.playlist_item_id else None
+            ),
+        )
+
+    def request_render(self):
+        """
+        Render the screen now, or queue it for the render worker when
+        RENDER_MODE is "worker".
+        :return: the screen to display (see `store_bitmap`)
+        """
+        if settings.RENDER_MODE == "worker":
+            self.queued_at = timezone.now()
             self.save()
+            return self
+        return self.generate_screen()
 
-        # clean up
-        shutil.rmtree(folder, ignore_errors=True)
+    def image_data(self, image_format="bmp"):
+        """The bitmap in one of IMAGE_FORMATS"""
+        if image_format == "bmp":
+            return bytes(self.screen)
+        data = getattr(self, f"screen_{image_format}")
+        if data is None:
+            # rendered before the compact encodings were stored
+            bitmap = Bitmap.from_bmp(self.screen)
+            data = getattr(bitmap, f"to_{image_format}")()
+        return bytes(data)
+
+    def image_as_data_uri(self, image_format="bmp"):
+        data = base64.b64encode(self.image_data(image_format)).decode()
+        return f"data:{IMAGE_FORMATS[image_format]};base64,{data}"
 
     @property
     def image_as_base64(self):
-        return f"data:image/bmp;base64,{base64.b64encode(self.screen).decode()}"
+        return self.image_as_data_uri()
+
+    @property
+    def image_name_for_device(self):
+        """The image filename, without extension"""
+        return f"{self.device.friendly_id}-{self.id}"
+
+    def image_filename_for_device(self, image_format="bmp"):
+        return f"{self.image_name_for_device}.{image_format}"
+
+    def image_url_for_device(self, image_format="bmp"):
+        filename = self.image_filename_for_device(image_format)
+        return f"/api/v1/media/{filename}?api_key={self.device.api_key}"
 
     @property
     def image_as_url_for_device(self):
-        device_api_key = self.device.api_key
-        return f"/api/v1/media/{self.device.friendly_id}-{self.id}.bmp?api_key={device_api_key}"
+        return self.image_url_for_device()
 
     @property
     def image_as_url_for_device_filename(self):
-        return f"{self.device.friendly_id}-{self.id}.bmp"
+        return self.image_filename_for_device()
 
 
 ################
@@ -112,8 +343,13 @@ class Screen(TimeStampedModel):
 
 @job
 def delete_old_screens():
-    """Delete screens older than 1 day"""
+    """Delete screens older than 1 day, except the ones devices currently show"""
     now = timezone.now()
     cutoff = now - datetime.timedelta(days=1)
-    Screen.objects.filter(created_at__lt=cutoff).delete()
+    Screen.objects.filter(created_at__lt=cutoff).exclude(
+        pk__in=Device.objects.filter(current_screen__isnull=False).values(
+            "current_screen"
+        )
+    ).delete()
+    RenderJob.objects.filter(created_at__lt=cutoff).delete()
     logger.info(f"Deleted screens older than {cutoff}")
@@ -0,0 +1,235 @@
+import datetime
+import logging
+
+from django.conf import settings
+from django.db import connections, models
+from django.db.models import Max, Min, Sum
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from scheduler import job
+
+from .device import DeviceLog
+
+logger = logging.getLogger("trmnl")
+
+# The counters and sums add up, the minimums and maximums are compared, the
+# latest firmware version wins. A single statement for all the buckets of all
+# the samples, however many rows are already there.
+UPSERT_SQL = """
+INSERT INTO {table} (
+    device_id, resolution, bucket, samples,
+    battery_count, battery_sum, battery_min, battery_max,
+    rssi_count, rssi_sum, rssi_min, rssi_max,
+    firmware_version
+) VALUES (%s, %s, %s, 1, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+ON CONFLICT (device_id, resolution, bucket) DO UPDATE SET
+    samples = {table}.samples + 1,
+    battery_count = {table}.battery_count + excluded.battery_count,
+    battery_sum = {table}.battery_sum + excluded.battery_sum,
+    battery_min = CASE WHEN {table}.battery_min IS NULL
+        OR excluded.battery_min < {table}.battery_min
+        THEN excluded.battery_min ELSE {table}.battery_min END,
+    battery_max = CASE WHEN {table}.battery_max IS NULL
+        OR excluded.battery_max > {table}.battery_max
+        THEN excluded.battery_max ELSE {table}.battery_max END,
+    rssi_count = {table}.rssi_count + excluded.rssi_count,
+    rssi_sum = {table}.rssi_sum + excluded.rssi_sum,
+    rssi_min = CASE WHEN {table}.rssi_min IS NULL
+        OR excluded.rssi_min < {table}.rssi_min
+        THEN excluded.rssi_min ELSE {table}.rssi_min END,
+    rssi_max = CASE WHEN {table}.rssi_max IS NULL
+        OR excluded.rssi_max > {table}.rssi_max
+        THEN excluded.rssi_max ELSE {table}.rssi_max END,
+    firmware_version = CASE WHEN excluded.firmware_version = ''
+        THEN {table}.firmware_version ELSE excluded.firmware_version END
+"""
+
+
+def metric_json(count, total, minimum, maximum, digits=3):
+    if not count:
+        return None
+    return {
+        "min": minimum,
+        "max": maximum,
+        "avg": round(total / count, digits),
+    }
+
+
+class TelemetryRollupQuerySet(models.QuerySet):
+    def window(self, resolution, since, until=None):
+        """The buckets of a resolution starting in [since, until)"""
+        rollups = self.filter(resolution=resolution, bucket__gte=since)
+        if until:
+            rollups = rollups.filter(bucket__lt=until)
+        return rollups
+
+    def summary_by_device(self):
+        """
+        The telemetry of each device over the buckets, as {device id: dict},
+        in a single grouped query.
+        """
+        rows = (
+            self.order_by()
+            .values("device_id")
+            .annotate(
+                total_samples=Sum("samples"),
+                total_battery_count=Sum("battery_count"),
+                total_battery_sum=Sum("battery_sum"),
+                lowest_battery=Min("battery_min"),
+                highest_battery=Max("battery_max"),
+                total_rssi_count=Sum("rssi_count"),
+                total_rssi_sum=Sum("rssi_sum"),
+                lowest_rssi=Min("rssi_min"),
+                highest_rssi=Max("rssi_max"),
+            )
+        )
+        return {
+            row["device_id"]: {
+                "samples": row["total_samples"],
+                "battery_voltage": metric_json(
+                    row["total_battery_count"],
+                    row["total_battery_sum"],
+                    row["lowest_battery"],
+                    row["highest_battery"],
+                ),
+                "rssi": metric_json(
+                    row["total_rssi_count"],
+                    row["total_rssi_sum"],
+                    row["lowest_rssi"],
+                    row["highest_rssi"],
+                    digits=1,
+                ),
+            }
+            for row in rows
+        }
+
+
+class TelemetryRollup(models.Model):
+    """
+    The telemetry of a device aggregated over a minute, an hour or a day (UTC),
+    updated as samples come in (see `record`), so that charts and fleet views
+    never read the raw logs. Only the aggregates are stored: counts, sums (for
+    averages), minimums and maximums, and the latest firmware version.
+    """
+
+    class Resolution(models.IntegerChoices):
+        MINUTE = 60, _("Minute")
+        HOUR = 3600, _("Hour")
+        DAY = 86400, _("Day")
+
+    device = models.ForeignKey(
+        "trmnl.Device", on_delete=models.CASCADE, related_name="telemetry"
+    )
+    resolution = models.PositiveIntegerField(
+        verbose_name=_("Resolution"), choices=Resolution.choices
+    )
+    bucket = models.DateTimeField(verbose_name=_("Start of the bucket"))
+    samples = models.PositiveIntegerField(default=0)
+    battery_count = models.PositiveIntegerField(default=0)
+    battery_sum = models.FloatField(default=0)
+    battery_min = models.FloatField(null=True, blank=True)
+    battery_max = models.FloatField(null=True, blank=True)
+    rssi_count = models.PositiveIntegerField(default=0)
+    rssi_sum = models.IntegerField(default=0)
+    rssi_min = models.SmallIntegerField(null=True, blank=True)
+    rssi_max = models.SmallIntegerField(null=True, blank=True)
+    firmware_version = models.CharField(max_length=20, blank=True)
+
+    objects = TelemetryRollupQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = _("Telemetry rollup")
+        verbose_name_plural = _("Telemetry rollups")
+        # The order of the unique index, which the series are read from
+        ordering = ["device_id", "resolution", "bucket"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["device", "resolution", "bucket"],
+                name="telemetry_device_bucket_uniq",
+            ),
+        ]
+        indexes = [
+            # Fleet views (all the devices over a time window) and retention
+            models.Index(fields=["resolution", "bucket"], name="telemetry_bucket_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.device_id} - {self.get_resolution_display()} {self.bucket}"
+
+    @staticmethod
+    def bucket_start(at, resolution):
+        timestamp = int(at.timestamp())
+        return datetime.datetime.fromtimestamp(
+            timestamp - timestamp % resolution, datetime.timezone.utc
+        )
+
+    @classmethod
+    def record(cls, device_id, samples, using="default"):
+        """Add telemetry samples (see trmnl.telemetry) to the device rollups."""
+        samples = [sample for sample in samples if not sample.is_empty]
+        if not samples:
+            return
+        connection = connections[using]
+        rows = []
+        for sample in samples:
+            for resolution in cls.Resolution.values:
+                bucket = cls.bucket_start(sample.at, resolution)
+                battery, rssi = sample.battery_voltage, sample.rssi
+                rows.append(
+                    (
+                        device_id,
+                        resolution,
+                        connection.ops.adapt_datetimefield_value(bucket),
+                        int(battery is not None),
+                        battery or 0,
+                        battery,
+                        battery,
+                        int(rssi is not None),
+                        rssi or 0,
+                        rssi,
+                        rssi,
+                        sample.firmware_version,
+                    )
+                )
+        table = connection.ops.quote_name(cls._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.executemany(UPSERT_SQL.format(table=table), rows)
+
+    def as_json(self):
+        return {
+            "at": self.bucket.isoformat(),
+            "samples": self.samples,
+            "battery_voltage": metric_json(
+                self.battery_count, self.battery_sum, self.battery_min, self.battery_max
+            ),
+            "rssi": metric_json(
+                self.rssi_count, self.rssi_sum, self.rssi_min, self.rssi_max, digits=1
+            ),
+            "firmware_version": self.firmware_version or None,
+        }
+
+
+###################
+## Telemetry Job ##
+###################
+
+
+@job
+def delete_old_telemetry():
+    """
+    Delete the rollups and the raw device logs older than their retention:
+    TELEMETRY_RETENTION_DAYS for each resolution, DEVICE_LOG_RETENTION_DAYS
+    for the logs, whose telemetry is kept in the rollups.
+    """
+    now = timezone.now()
+    for name, days in settings.TELEMETRY_RETENTION_DAYS.items():
+        resolution = TelemetryRollup.Resolution[name.upper()]
+        cutoff = now - datetime.timedelta(days=days)
+        TelemetryRollup.objects.filter(
+            resolution=resolution, bucket__lt=cutoff
+        ).delete()
+        logger.info(f"Deleted {name} telemetry rollups older than {cutoff}")
+    if settings.DEVICE_LOG_RETENTION_DAYS:
+        cutoff = now - datetime.timedelta(days=settings.DEVICE_LOG_RETENTION_DAYS)
+        DeviceLog.objects.filter(created_at__lt=cutoff).delete()
+        logger.info(f"Deleted device logs older than {cutoff}")
@@ -0,0 +1,186 @@
+"""
+Rendering helpers shared by the screen generation, the render worker and the
+live preview: HTML -> browser screenshot (PNG) -> dithered 1-bit BMP.
+"""
+
+import logging
+import time
+
+from django.conf import settings
+from django.template.loader import get_template
+from django.utils.safestring import mark_safe
+from playwright.sync_api import sync_playwright
+from wand.image import Image
+
+from trmnl.assets import AssetStats, get_asset_cache
+
+logger = logging.getLogger("trmnl")
+
+VIEWPORT = {"width": 800, "height": 480}
+BROWSER_ARGS = ["--window-size=800,480", "--disable-web-security"]
+HIDE_OVERFLOW_JS = (
+    'document.getElementsByTagName("html")[0].style.overflow = "hidden";'
+    'document.getElementsByTagName("body")[0].style.overflow = "hidden";'
+)
+# Screenshots show the final state of animated content
+NO_ANIMATIONS_CSS = """
+*, *::before, *::after {
+  animation-duration: 0s !important;
+  animation-delay: 0s !important;
+  transition-duration: 0s !important;
+  transition-delay: 0s !important;
+  caret-color: transparent !important;
+}
+"""
+# Resolves once the page can be captured, or after `deadline` milliseconds
+# (resolving to false then): stylesheets, web fonts and the images in the
+# viewport are loaded, and `window.trmnlReady` is settled. A template that draws
+# asynchronously (charts, fetched data) sets `window.trmnlReady` to a promise.
+READY_JS = """
+async (deadline) => {
+  const loaded = (element) => new Promise((resolve) => {
+    element.addEventListener("load", resolve, { once: true });
+    element.addEventListener("error", resolve, { once: true });
+  });
+  const inViewport = (element) => {
+    const rect = element.getBoundingClientRect();
+    return rect.bottom > 0 && rect.right > 0
+      && rect.top < window.innerHeight && rect.left < window.innerWidth;
+  };
+  const stylesheets = [...document.querySelectorAll('link[rel="stylesheet"]')]
+    .filter((link) => !link.sheet);
+  const images = [...document.images]
+    .filter((image) => !image.complete && inViewport(image));
+  const ready = Promise.all([
+    ...stylesheets.map(loaded),
+    ...images.map(loaded),
+    document.fonts.ready,
+    Promise.resolve(window.trmnlReady).catch(() => null),
+  ]).then(() => true);
+  const timeout = new Promise((resolve) => setTimeout(() => resolve(false), deadline));
+  return Promise.race([ready, timeout]);
+}
+"""
+
+
+def wrap_html(html):
+    """Wrap a screen content in the TRMNL page (framework CSS, JS and fonts)."""
+    template = get_template("screen.html")
+    return template.render({"content": mark_safe(html)})
+
+
+def dither(png):
+    """
+    Convert a PNG screenshot to a dithered black & white BMP3.
+    CPU bound, this is what the render worker runs in its process pool.
+    """
+    with Image(blob=png) as img:
+        img.transform_colorspace("gray")
+        img.quantize(2, colorspace_type="gray", dither=True)
+        img.type = "grayscale"
+        return img.make_blob("bmp3")
+
+
+def launch_browser(playwright):
+    """
+    Connect to the Playwright server if configured, or launch a local Firefox.
+    Works with both playwright APIs: await the result with async_playwright.
+    """
+    if settings.PW_SERVER:
+        return playwright.firefox.connect(ws_endpoint=settings.PW_SERVER)
+    return playwright.firefox.launch(headless=True, args=BROWSER_ARGS)
+
+
+def screenshot(page, html, timeout=None, timings=None):
+    """
+    Load a full HTML document in a (sync) page and return a PNG screenshot,
+    once the page is ready (see READY_JS).
+    `timeout` (seconds) bounds each browser operation. The duration of each
+    stage (load, ready, screenshot) is stored in the `timings` dict if given.
+    """
+    if timeout:
+        page.set_default_timeout(timeout * 1000)
+    timings = {} if timings is None else timings
+    assets, stats = get_asset_cache(), AssetStats()
+    if assets:
+        page.route("**/*", lambda route: assets.handle(route, stats))
+    try:
+        start_time = time.monotonic()
+        page.set_content(html, wait_until="domcontentloaded")
+        page.add_style_tag(content=NO_ANIMATIONS_CSS)
+        page.evaluate(HIDE_OVERFLOW_JS)
+        timings["load"] = time.monotonic() - start_time
+
+        start_time = time.monotonic()
+        ready = page.evaluate(READY_JS, settings.RENDER_READY_TIMEOUT * 1000)
+        timings["ready"] = time.monotonic() - start_time
+        if not ready:
+            logger.warning(
+                f"Page not ready after {settings.RENDER_READY_TIMEOUT}s, "
+                "capturing it anyway"
+            )
+
+        start_time = time.monotonic()
+        png = page.screenshot(animations="disabled")
+        timings["screenshot"] = time.monotonic() - start_time
+        return png
+    finally:
+        if assets:
+            page.unroute("**/*")
+            logger.info(f"Render assets: {stats}")
+
+
+async def async_screenshot(page, html, timeout=None, timings=None):
+    """Same as `screenshot`, for an async_playwright page."""
+    if timeout:
+        page.set_default_timeout(timeout * 1000)
+    timings = {} if timings is None else timings
+    assets, stats = get_asset_cache(), AssetStats()
+    if assets:
+        await page.route("**/*", lambda route: assets.async_handle(route, stats))
+    try:
+        start_time = time.monotonic()
+        await page.set_content(html, wait_until="domcontentloaded")
+        await page.add_style_tag(content=NO_ANIMATIONS_CSS)
+        await page.evaluate(HIDE_OVERFLOW_JS)
+        timings["load"] = time.monotonic() - start_time
+
+        start_time = time.monotonic()
+        ready = await page.evaluate(READY_JS, settings.RENDER_READY_TIMEOUT * 1000)
+        timings["ready"] = time.monotonic() - start_time
+        if not ready:
+            logger.warning(
+                f"Page not ready after {settings.RENDER_READY_TIMEOUT}s, "
+                "capturing it anyway"
+            )
+
+        start_time = time.monotonic()
+        png = await page.screenshot(animations="disabled")
+        timings["screenshot"] = time.monotonic() - start_time
+        return png
+    finally:
+        if assets:
+            await page.unroute("**/*")
+            logger.info(f"Render assets: {stats}")
+
+
+def format_timings(timings):
+    """e.g. "load 0.12s, ready 0.40s, screenshot 0.08s" """
+    return ", ".join(f"{stage} {duration:.2f}s" for stage, duration in timings.items())
+
+
+def render_html(html, timeout=None):
+    """Render a screen content to a BMP, in a browser of its own."""
+    timings = {}
+    with sync_playwright() as p:
+        browser = launch_browser(p)
+        try:
+            page = browser.new_page(viewport=VIEWPORT)
+            png = screenshot(page, wrap_html(html), timeout=timeout, timings=timings)
+        finally:
+            browser.close()
+    start_time = time.monotonic()
+    bitmap = dither(png)
+    timings["dither"] = time.monotonic() - start_time
+    logger.info(f"Rendered in {format_timings(timings)}")
+    return bitmap
@@ -0,0 +1,135 @@
+import asyncio
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from asgiref.sync import sync_to_async
+from playwright.async_api import async_playwright
+
+from trmnl import render
+from trmnl.models import Screen
+
+logger = logging.getLogger("trmnl")
+
+
+class RenderWorker:
+    """
+    Render the screens queued in RENDER_MODE "worker".
+
+    A single event loop drives up to `pages` browser pages concurrently, so the
+    worker keeps the browser busy while other renders wait on I/O, and the CPU
+    heavy dithering runs in a pool of `processes` processes.
+    """
+
+    def __init__(self, pages, processes=None, poll_interval=1.0):
+        self.pages = pages
+        self.processes = processes
+        self.poll_interval = poll_interval
+        self.tasks = set()
+
+    def run(self):
+        asyncio.run(self.main())
+
+    async def main(self):
+        with ProcessPoolExecutor(max_workers=self.processes) as pool:
+            async with async_playwright() as p:
+                while True:
+                    browser = await render.launch_browser(p)
+                    logger.info(
+                        f"Render worker started: {self.pages} pages, "
+                        f"{self.processes or os.cpu_count()} dithering processes"
+                    )
+                    try:
+                        await self.serve(browser, pool)
+                    finally:
+                        if self.tasks:
+                            await asyncio.gather(*self.tasks, return_exceptions=True)
+                        if browser.is_connected():
+                            await browser.close()
+                    logger.warning("Browser disconnected, reconnecting")
+
+    async def serve(self, browser, pool):
+        """Claim and render screens until the browser disconnects."""
+        while browser.is_connected():
+            free_pages = self.pages - len(self.tasks)
+            screens = []
+            if free_pages:
+                screens = await sync_to_async(Screen.objects.claim_pending)(free_pages)
+            # Screens with the same HTML (e.g. a batch pushed to several devices)
+            # are rendered once
+            by_html = {}
+            for screen in screens:
+                by_html.setdefault(screen.html, []).append(screen)
+            for group in by_html.values():
+                task = asyncio.create_task(self.render(browser, pool, group))
+                self.tasks.add(task)
+                task.add_done_callback(self.tasks.discard)
+            if screens:
+                continue
+            if free_pages:
+                await asyncio.sleep(self.poll_interval)
+            else:
+                await asyncio.wait(self.tasks, return_when=asyncio.FIRST_COMPLETED)
+
+    @staticmethod
+    def fallback(screen, error):
+        """Replace a failed playlist screen by its last good one, if any."""
+        if screen.render_job:
+            screen.render_job.screen_failed(str(error))
+        if screen.playlist_item:
+            reused = screen.playlist_item.plugin.reuse_last_screen(
+                screen.device, screen.playlist_item
+            )
+            if reused:
+                logger.warning(f"Reusing the last good screen as #{reused.id}")
+                screen.delete()
+                return
+        # Don't retry it forever
+        Screen.objects.filter(pk=screen.pk).update(queued_at=None)
+
+    @staticmethod
+    def store(screen, bitmap):
+        screen.store_bitmap(bitmap)
+        if screen.render_job:
+            screen.render_job.screen_rendered()
+
+    async def render(self, browser, pool, screens):
+        """Render screens sharing the same HTML."""
+        screen = screens[0]
+        start_time = time.monotonic()
+        timings = {}
+        try:
+            page = await browser.new_page(viewport=render.VIEWPORT)
+            try:
+                png = await render.async_screenshot(
+                    page,
+                    render.wrap_html(screen.html),
+                    timeout=screen.render_timeout,
+                    timings=timings,
+                )
+            finally:
+                await page.close()
+            dither_start = time.monotonic()
+            bitmap = await asyncio.get_running_loop().run_in_executor(
+                pool, render.dither, png
+            )
+            timings["dither"] = time.monotonic() - dither_start
+            for rendered in screens:
+                await sync_to_async(self.store)(rendered, bitmap)
+        except Exception as e:
+            logger.exception(f"Failed to render screen #{screen.id}")
+            for failed in screens:
+                # Skip the ones stored (or found identical and deleted) already
+                if failed.pk and not failed.generated:
+                    await sync_to_async(self.fallback)(failed, e)
+            return
+        logger.info(
+            f"Rendered screen #{screen.id} for device #{screen.device_id} "
+            f"in {time.monotonic() - start_time:.2f}s ({render.format_timings(timings)})"
+            + (
+                f", reused for {len(screens) - 1} more screens"
+                if len(screens) > 1
+                else ""
+            )
+        )
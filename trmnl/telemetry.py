@@ -0,0 +1,89 @@
+"""
+Device telemetry (battery voltage, Wi-Fi signal, firmware version), read from
+the headers of the display polls and from the status stamps of the device logs.
+Samples are aggregated into rollups as they come in, see TelemetryRollup.
+"""
+
+import datetime
+import math
+from dataclasses import dataclass
+from typing import Optional
+
+from django.utils import timezone
+
+# Log timestamps further in the past (buffered by an offline device) or in the
+# future (device clock not set) than this are replaced by the reception time
+MAX_LOG_CLOCK_SKEW = datetime.timedelta(days=7)
+
+
+@dataclass
+class Sample:
+    at: datetime.datetime
+    battery_voltage: Optional[float] = None
+    rssi: Optional[int] = None
+    firmware_version: str = ""
+
+    @property
+    def is_empty(self):
+        return (
+            self.battery_voltage is None
+            and self.rssi is None
+            and not self.firmware_version
+        )
+
+
+def parse_number(value, cast=float):
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return cast(number) if math.isfinite(number) else None
+
+
+def from_headers(headers, at=None):
+    """The sample sent with a display poll, see the TRMNL firmware headers"""
+    return Sample(
+        at=at or timezone.now(),
+        battery_voltage=parse_number(headers.get("Battery-Voltage")),
+        rssi=parse_number(headers.get("RSSI"), int),
+        firmware_version=(headers.get("FW-Version") or "")[:20],
+    )
+
+
+def log_time(timestamp, received_at):
+    at = parse_number(timestamp)
+    if at is None:
+        return received_at
+    try:
+        at = datetime.datetime.fromtimestamp(at, datetime.timezone.utc)
+    except (ValueError, OverflowError, OSError):
+        return received_at
+    if abs(at - received_at) > MAX_LOG_CLOCK_SKEW:
+        return received_at
+    return at
+
+
+def from_log(message, received_at=None):
+    """
+    The samples of a device log: the `device_status_stamp` of each entry of
+    `log.logs_array`, at its `creation_timestamp`.
+    """
+    received_at = received_at or timezone.now()
+    entries = message.get("log") if isinstance(message, dict) else None
+    entries = entries.get("logs_array") if isinstance(entries, dict) else None
+    if not isinstance(entries, list):
+        return []
+    samples = []
+    for entry in entries:
+        stamp = entry.get("device_status_stamp") if isinstance(entry, dict) else None
+        if not isinstance(stamp, dict):
+            continue
+        sample = Sample(
+            at=log_time(entry.get("creation_timestamp"), received_at),
+            battery_voltage=parse_number(stamp.get("battery_voltage")),
+            rssi=parse_number(stamp.get("wifi_rssi_level"), int),
+            firmware_version=str(stamp.get("current_fw_version") or "")[:20],
+        )
+        if not sample.is_empty:
+            samples.append(sample)
+    return samples
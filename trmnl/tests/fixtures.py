@@ -0,0 +1,82 @@
+import datetime
+
+from django.contrib.auth.models import User
+from django.utils import timezone
+
+from plugins.models import Plugin
+from trmnl.bitmap import Bitmap
+from trmnl.models import APIKey, Device, DeviceLog, Playlist, PlaylistItem, Screen
+from utils.weekday_field import Weekday
+
+ALL_WEEK = Weekday.from_int_list([day.value for day in Weekday])
+
+# A white screen with a black line
+SAMPLE_BITMAP = Bitmap(
+    800, 480, [(1 << 800) - 1] * 240 + [0] + [(1 << 800) - 1] * 239
+).to_bmp()
+
+
+def create_fleet(
+    users=3,
+    devices_per_user=4,
+    playlists_per_device=2,
+    items_per_playlist=3,
+    screens_per_device=5,
+    logs_per_device=10,
+):
+    """
+    Create a realistic fleet: paired devices with playlists, a screen history
+    and device logs. Returns the list of created devices.
+    """
+    plugin = Plugin.objects.create(
+        name="Static HTML",
+        description="Static HTML",
+        recipe="plugins.recipe.StaticHTMLRecipe",
+        config={"html": "<p>Hello</p>"},
+    )
+    devices = []
+    for user_index in range(users):
+        user = User.objects.create_user(f"user{user_index}", password="password")
+        APIKey.objects.create(name=f"Key {user_index}", user=user)
+        for device_index in range(devices_per_user):
+            number = user_index * devices_per_user + device_index
+            device = Device.objects.create(
+                device_name=f"Device {number}",
+                mac_address=f"AA:BB:CC:DD:{number // 256:02X}:{number % 256:02X}",
+                user=user,
+            )
+            items = []
+            for playlist_index in range(playlists_per_device):
+                playlist = Playlist.objects.create(
+                    name=f"Playlist {playlist_index}",
+                    device=device,
+                    weekdays=ALL_WEEK,
+                    is_active=playlist_index == 0,
+                )
+                items += [
+                    PlaylistItem.objects.create(
+                        playlist=playlist, order=order, plugin=plugin
+                    )
+                    for order in range(items_per_playlist)
+                ]
+            screens = Screen.objects.bulk_create(
+                Screen(
+                    device=device,
+                    html="<p>Hello</p>",
+                    screen=SAMPLE_BITMAP,
+                    generated=True,
+                    playlist_item=items[index % len(items)],
+                )
+                for index in range(screens_per_device)
+            )
+            DeviceLog.objects.bulk_create(
+                DeviceLog(device=device, message={"log": f"entry {index}"})
+                for index in range(logs_per_device)
+            )
+            device.last_seen_at = timezone.now() - datetime.timedelta(minutes=1)
+            device.save()
+            if screens:
+                screens[-1].make_current()
+                device.refresh_from_db()
+            devices.append(device)
+    return devices
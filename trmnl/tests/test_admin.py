@@ -0,0 +1,141 @@
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.urls import reverse
+
+from trmnl.models import DeviceLog, Screen
+from utils import admin_pagination
+
+from .fixtures import create_fleet
+
+
+class ScreenImageAdminTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.device = create_fleet(users=1, devices_per_user=1)[0]
+        cls.admin = User.objects.create_superuser("admin", password="password")
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.admin)
+
+    def test_changelist_links_thumbnails(self):
+        response = self.client.get(reverse("admin:trmnl_screen_changelist"))
+        url = reverse(
+            "admin:trmnl_screen_thumbnail", args=[self.device.current_screen_id]
+        )
+        self.assertContains(response, f'src="{url}"')
+        self.assertNotContains(response, "base64")
+
+    def test_thumbnail_is_cached(self):
+        url = reverse(
+            "admin:trmnl_screen_thumbnail", args=[self.device.current_screen_id]
+        )
+        response = self.client.get(url)
+        self.assertEqual(response["Content-Type"], "image/png")
+        self.assertIn("max-age", response["Cache-Control"])
+        with mock.patch("trmnl.admin.Bitmap.from_bmp") as from_bmp:
+            self.assertEqual(self.client.get(url).content, response.content)
+        from_bmp.assert_not_called()
+
+    def test_detail_page_links_the_image(self):
+        screen_id = self.device.current_screen_id
+        response = self.client.get(
+            reverse("admin:trmnl_screen_change", args=[screen_id])
+        )
+        self.assertContains(
+            response, reverse("admin:trmnl_screen_image", args=[screen_id])
+        )
+        self.assertNotContains(response, "data:image")
+
+    def test_screen_not_rendered(self):
+        screen = Screen.objects.create(device=self.device, html="<p>Later</p>")
+        response = self.client.get(
+            reverse("admin:trmnl_screen_image", args=[screen.pk])
+        )
+        self.assertEqual(response.status_code, 404)
+
+
+class LargeTableAdminTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.devices = create_fleet(users=1, devices_per_user=2, logs_per_device=0)
+        logs = DeviceLog.objects.bulk_create(
+            DeviceLog(device=cls.devices[index % 2], message={"log": index})
+            for index in range(250)
+        )
+        cls.logs = sorted(logs, key=lambda log: (log.created_at, log.pk), reverse=True)
+        cls.admin = User.objects.create_superuser("admin", password="password")
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def get(self, url=None, **params):
+        url = url or reverse("admin:trmnl_devicelog_changelist")
+        return self.client.get(url, params)
+
+    def test_pages_follow_the_cursor(self):
+        seen = []
+        response = self.get()
+        while True:
+            changelist = response.context["cl"]
+            seen += [log.pk for log in changelist.result_list]
+            if not changelist.next_cursor_url:
+                break
+            self.assertIn("cursor=", changelist.next_cursor_url)
+            response = self.get(
+                reverse("admin:trmnl_devicelog_changelist") + changelist.next_cursor_url
+            )
+        self.assertEqual(seen, [log.pk for log in self.logs])
+        self.assertContains(response, "Newest")
+
+    def test_cursor_with_filters(self):
+        device = self.devices[0]
+        first = self.get(device__id__exact=device.pk).context["cl"]
+        self.assertIn(f"device__id__exact={device.pk}", first.next_cursor_url)
+        response = self.get(
+            reverse("admin:trmnl_devicelog_changelist") + first.next_cursor_url
+        )
+        logs = response.context["cl"].result_list
+        self.assertTrue(all(log.device_id == device.pk for log in logs))
+
+    def test_sorting_falls_back_to_page_numbers(self):
+        changelist = self.get(o="1").context["cl"]
+        self.assertFalse(changelist.keyset)
+        self.assertEqual(changelist.paginator.num_pages, 3)
+
+    def test_invalid_cursor_shows_the_first_page(self):
+        changelist = self.get(cursor="nope").context["cl"]
+        self.assertEqual(changelist.result_list[0].pk, self.logs[0].pk)
+
+    def test_search_by_friendly_id(self):
+        device = self.devices[1]
+        changelist = self.get(q=device.friendly_id).context["cl"]
+        self.assertEqual(changelist.result_count, 125)
+
+    @mock.patch.object(admin_pagination, "ESTIMATED_COUNT_THRESHOLD", 100)
+    def test_estimated_count(self):
+        if connection.vendor == "postgresql":
+            with connection.cursor() as cursor:
+                cursor.execute("ANALYZE trmnl_devicelog")
+        # Not seen by the estimate
+        DeviceLog.objects.filter(pk=self.logs[100].pk).delete()
+        response = self.get()
+        changelist = response.context["cl"]
+        self.assertTrue(changelist.paginator.estimated)
+        self.assertEqual(changelist.result_count, 250)
+        self.assertContains(response, "About 250")
+        # The cursor of the next pages isn't a filter
+        response = self.get(
+            reverse("admin:trmnl_devicelog_changelist") + changelist.next_cursor_url
+        )
+        changelist = response.context["cl"]
+        self.assertTrue(changelist.paginator.estimated)
+        self.assertEqual(changelist.result_count, 250)
+        self.assertIsNotNone(changelist.next_cursor_url)
+        # Filtered lists are counted exactly
+        changelist = self.get(device__id__exact=self.devices[0].pk).context["cl"]
+        self.assertFalse(changelist.paginator.estimated)
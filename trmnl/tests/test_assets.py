@@ -0,0 +1,152 @@
+import asyncio
+import tempfile
+from types import SimpleNamespace
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+
+from trmnl.assets import AssetCache, AssetStats
+
+
+class FakeRoute:
+    def __init__(self, url, resource_type="image", body=b"remote", ok=True):
+        self.request = SimpleNamespace(
+            url=url, method="GET", resource_type=resource_type
+        )
+        self.response = SimpleNamespace(
+            ok=ok, headers={"content-type": "image/png"}, body=lambda: body
+        )
+        self.result = None
+
+    def fulfill(self, response=None, **kwargs):
+        self.result = ("fulfill", response.body() if response else kwargs["body"])
+
+    def abort(self, error_code=None):
+        self.result = ("abort", None)
+
+    def continue_(self):
+        self.result = ("continue", None)
+
+    def fetch(self):
+        return self.response
+
+
+class AsyncFakeRoute(FakeRoute):
+    async def fulfill(self, response=None, **kwargs):
+        self.result = ("fulfill", kwargs["body"] if response is None else b"fetched")
+
+    async def continue_(self):
+        self.result = ("continue", None)
+
+    async def fetch(self):
+        body = self.response.body()
+
+        async def read_body():
+            return body
+
+        return SimpleNamespace(
+            ok=self.response.ok, headers=self.response.headers, body=read_body
+        )
+
+
+@override_settings(
+    RENDER_STATIC_HOSTS=["nginx"],
+    RENDER_BLOCK_REQUESTS=False,
+    RENDER_ALLOWED_HOSTS=[],
+)
+class AssetCacheTest(SimpleTestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.cache_dir.cleanup)
+        self.assets = AssetCache(self.cache_dir.name, ttl=60)
+        self.stats = AssetStats()
+
+    def test_static_files_are_served_from_memory(self):
+        for url in (
+            "http://nginx/css/plugins.css",
+            "http://nginx/static/css/plugins.css",
+        ):
+            route = FakeRoute(url, resource_type="stylesheet")
+            self.assets.handle(route, self.stats)
+            self.assertEqual(route.result[0], "fulfill")
+        self.assertEqual(self.stats.hits, 2)
+        self.assertGreater(self.stats.bytes_saved, 0)
+
+    def test_unknown_static_path_goes_to_network(self):
+        route = FakeRoute("http://nginx/api/display", resource_type="fetch")
+        self.assets.handle(route, self.stats)
+        self.assertEqual(route.result, ("continue", None))
+        self.assertEqual(self.stats.misses, 1)
+        # Not remembered, the requested paths are unbounded
+        self.assertEqual(self.assets.static_files, {})
+
+    def test_remote_images_are_cached_on_disk(self):
+        url = "https://example.com/pokemon.png"
+        self.assets.handle(FakeRoute(url), self.stats)
+        route = FakeRoute(url, body=b"changed")
+        self.assets.handle(route, self.stats)
+        self.assertEqual(route.result, ("fulfill", b"remote"))
+        self.assertEqual((self.stats.hits, self.stats.misses), (1, 1))
+
+        # A new process finds the cached file
+        self.assertEqual(
+            AssetCache(self.cache_dir.name, ttl=60).lookup(url),
+            (b"remote", "image/png"),
+        )
+
+    def test_expired_entries_are_fetched_again(self):
+        url = "https://example.com/pokemon.png"
+        with mock.patch("trmnl.assets.time.time", return_value=1000):
+            self.assets.handle(FakeRoute(url), self.stats)
+        with mock.patch("trmnl.assets.time.time", return_value=1061):
+            route = FakeRoute(url, body=b"changed")
+            self.assets.handle(route, self.stats)
+        self.assertEqual(route.result, ("fulfill", b"changed"))
+        self.assertEqual(self.stats.misses, 2)
+
+    def test_failed_responses_are_not_cached(self):
+        url = "https://example.com/missing.png"
+        self.assets.handle(FakeRoute(url, ok=False), self.stats)
+        self.assertIsNone(self.assets.lookup(url))
+
+    @override_settings(RENDER_BLOCK_REQUESTS=True, RENDER_ALLOWED_HOSTS=["api.test"])
+    def test_blocks_requests_to_other_hosts(self):
+        route = FakeRoute("https://tracker.example.com/pixel.gif")
+        self.assets.handle(route, self.stats)
+        self.assertEqual(route.result, ("abort", None))
+        self.assertEqual(self.stats.blocked, 1)
+        self.assertFalse(self.assets.is_blocked("https://api.test/data"))
+        self.assertFalse(self.assets.is_blocked("http://nginx/css/plugins.css"))
+        self.assertFalse(self.assets.is_blocked("data:image/png;base64,"))
+
+    def test_prunes_expired_then_oldest_entries(self):
+        assets = AssetCache(self.cache_dir.name, ttl=60, max_size=10)
+        for fetched_at, name in ((1000, "expired"), (1100, "old"), (1110, "new")):
+            with mock.patch("trmnl.assets.time.time", return_value=fetched_at):
+                assets.store_remote(f"https://example.com/{name}", b"x" * 6, "")
+        with mock.patch("trmnl.assets.time.time", return_value=1120):
+            self.assertEqual(assets.prune(), 2)
+            self.assertIsNone(assets.get_remote("https://example.com/old"))
+            self.assertIsNotNone(assets.get_remote("https://example.com/new"))
+
+    def test_stores_prune_once_per_interval(self):
+        with mock.patch.object(self.assets, "prune", wraps=self.assets.prune) as prune:
+            for now, name in ((1000, "a"), (1500, "b"), (1601, "c")):
+                with mock.patch("trmnl.assets.time.time", return_value=now):
+                    self.assets.store_remote(f"https://example.com/{name}", b"", "")
+        self.assertEqual(prune.call_count, 2)
+
+    def test_async_disk_io_runs_in_a_thread(self):
+        url = "https://example.com/pokemon.png"
+        with mock.patch(
+            "trmnl.assets.asyncio.to_thread", wraps=asyncio.to_thread
+        ) as to_thread:
+            asyncio.run(self.assets.async_handle(AsyncFakeRoute(url), self.stats))
+            route = AsyncFakeRoute(url)
+            asyncio.run(self.assets.async_handle(route, self.stats))
+        self.assertEqual(route.result, ("fulfill", b"remote"))
+        self.assertEqual((self.stats.hits, self.stats.misses), (1, 1))
+        self.assertEqual(
+            [call.args[0] for call in to_thread.call_args_list],
+            [self.assets.lookup, self.assets.store_remote, self.assets.lookup],
+        )
@@ -0,0 +1,129 @@
+import struct
+
+from django.test import SimpleTestCase, TestCase
+
+from trmnl.bitmap import Bitmap, BitmapError
+from trmnl.models import Device, Screen
+
+from .fixtures import create_fleet
+
+WHITE_ROW = (1 << 800) - 1
+
+
+def blank(width=800, height=480):
+    return Bitmap(width, height, [(1 << width) - 1] * height)
+
+
+def bmp_8bit(pixels, palette):
+    """An 8 bits BMP, top-down, from rows of palette indexes."""
+    width, height = len(pixels[0]), len(pixels)
+    stride = (width + 3) // 4 * 4
+    data = b"".join(bytes(row).ljust(stride, b"\x00") for row in pixels)
+    palette = b"".join(bytes((b, g, r, 0)) for r, g, b in palette)
+    offset = 54 + len(palette)
+    return (
+        struct.pack("<2sIHHI", b"BM", offset + len(data), 0, 0, offset)
+        + struct.pack(
+            "<IiiHHIIiiII", 40, width, -height, 1, 8, 0, len(data), 0, 0, 0, 0
+        )
+        + palette
+        + data
+    )
+
+
+class BitmapTest(SimpleTestCase):
+    def test_bmp_round_trip(self):
+        bitmap = blank(10, 3)
+        bitmap.rows[1] = 0b1011111110
+        self.assertEqual(Bitmap.from_bmp(bitmap.to_bmp()), bitmap)
+
+    def test_8bit_palette(self):
+        data = bmp_8bit(
+            [[0, 1, 2], [2, 1, 0]], [(255, 255, 255), (0, 0, 0), (200, 200, 200)]
+        )
+        bitmap = Bitmap.from_bmp(data)
+        self.assertEqual((bitmap.width, bitmap.height), (3, 2))
+        self.assertEqual(bitmap.rows, [0b101, 0b101])
+
+    def test_not_a_bmp(self):
+        with self.assertRaises(BitmapError):
+            Bitmap.from_bmp(b"\x89PNG" + bytes(100))
+
+    def test_identical(self):
+        diff = blank().diff(blank())
+        self.assertTrue(diff.identical)
+        self.assertEqual(diff.changed_fraction, 0)
+        self.assertEqual(diff.regions, [])
+
+    def test_changed_regions(self):
+        before, after = blank(), blank()
+        # A 10x2 block at (100, 20) and a pixel at (799, 400)
+        for y in (20, 21):
+            after.rows[y] ^= ((1 << 10) - 1) << (800 - 110)
+        after.rows[400] ^= 1
+        diff = after.diff(before)
+        self.assertEqual(diff.changed_pixels, 21)
+        self.assertAlmostEqual(diff.changed_fraction, 21 / (800 * 480))
+        self.assertEqual(
+            diff.regions,
+            [
+                {"x": 100, "y": 20, "width": 10, "height": 2},
+                {"x": 799, "y": 400, "width": 1, "height": 1},
+            ],
+        )
+
+    def test_close_changes_are_merged(self):
+        after = blank()
+        after.rows[10] ^= 1 << 700
+        after.rows[15] ^= 1 << 10
+        self.assertEqual(
+            after.diff(blank()).regions,
+            [{"x": 99, "y": 10, "width": 691, "height": 6}],
+        )
+
+    def test_size_change(self):
+        diff = blank().diff(blank(400, 240))
+        self.assertEqual(diff.changed_fraction, 1)
+
+    def test_thumbnail_keeps_thin_lines(self):
+        bitmap = blank()
+        bitmap.rows[241] = 0
+        thumbnail = bitmap.thumbnail(4)
+        self.assertEqual((thumbnail.width, thumbnail.height), (200, 120))
+        self.assertEqual(thumbnail.rows[60], 0)
+        self.assertEqual(thumbnail.rows[59], (1 << 200) - 1)
+
+
+class StoreBitmapTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.device = create_fleet(users=1, devices_per_user=1)[0]
+        cls.current = cls.device.current_screen
+        Screen.objects.filter(pk=cls.current.pk).update(screen=blank().to_bmp())
+
+    def test_identical_playlist_screen_is_skipped(self):
+        screen = Screen.objects.create(
+            device=self.device, html="", playlist_item=self.current.playlist_item
+        )
+        self.assertEqual(screen.store_bitmap(blank().to_bmp()), self.current)
+        self.assertFalse(Screen.objects.filter(pk=screen.pk).exists())
+        self.assertEqual(Device.objects.get(pk=self.device.pk).skipped_renders, 1)
+
+    def test_identical_screen_without_playlist_is_kept(self):
+        screen = Screen.objects.create(device=self.device, html="")
+        self.assertEqual(screen.store_bitmap(blank().to_bmp()), screen)
+        self.assertEqual(screen.changed_fraction, 0)
+
+    def test_changes_are_recorded(self):
+        bitmap = blank()
+        bitmap.rows[0] = 0
+        screen = Screen.objects.create(
+            device=self.device, html="", playlist_item=self.current.playlist_item
+        )
+        screen.store_bitmap(bitmap.to_bmp())
+        screen.refresh_from_db()
+        self.assertTrue(screen.generated)
+        self.assertEqual(screen.changed_fraction, 1 / 480)
+        self.assertEqual(
+            screen.changed_regions, [{"x": 0, "y": 0, "width": 800, "height": 1}]
+        )
@@ -0,0 +1,133 @@
+import time
+
+from django.test import SimpleTestCase
+
+from trmnl.bitmap import Bitmap
+from trmnl.canvas import WHITE, Canvas, load_image
+from trmnl.fonts import FONT_FILES, FontError, get_font
+
+
+def ink(canvas, x, y, width, height):
+    """Number of black pixels of a box of the canvas"""
+    mask = canvas.span(x, width)
+    return sum(bin(row & mask).count("1") for row in canvas.rows[y : y + height])
+
+
+class FontTest(SimpleTestCase):
+    def test_fonts_of_the_framework(self):
+        for name in FONT_FILES:
+            with self.subTest(font=name):
+                font = get_font(name)
+                for char in "Aé…'":
+                    self.assertTrue(font.glyph_index(char), char)
+                self.assertGreater(font.measure("Métro", 16), 0)
+
+    def test_unknown_font(self):
+        with self.assertRaises(FontError):
+            get_font("Comic Sans")
+
+    def test_glyph(self):
+        font = get_font("NicoClean")
+        glyph = font.glyph(font.glyph_index("l"), 16)
+        self.assertTrue(any(glyph.rows))
+        # Above the baseline, within its advance
+        self.assertLessEqual(glyph.top + len(glyph.rows), 1)
+        self.assertLessEqual(glyph.left + glyph.width, round(glyph.advance) + 1)
+        space = font.glyph(font.glyph_index(" "), 16)
+        self.assertEqual(space.rows, [])
+        self.assertGreater(space.advance, 0)
+
+    def test_measure(self):
+        font = get_font("BlockKie")
+        self.assertEqual(font.measure("", 26), 0)
+        self.assertLess(font.measure("12:42", 26), font.measure("12:42", 74))
+        self.assertEqual(
+            font.measure("12:42", 26), round(font.measure("12:42", 52) / 2)
+        )
+
+
+class CanvasTest(SimpleTestCase):
+    def test_shapes(self):
+        canvas = Canvas(20, 10)
+        canvas.fill(-5, 2, 10, 3)
+        self.assertEqual(ink(canvas, 0, 0, 20, 10), 15)
+        canvas.fill(0, 2, 2, 3, WHITE)
+        self.assertEqual(ink(canvas, 0, 0, 20, 10), 9)
+        canvas = Canvas(20, 10)
+        canvas.rect(0, 0, 20, 10)
+        self.assertEqual(ink(canvas, 0, 0, 20, 10), 2 * 20 + 2 * 8)
+        self.assertEqual(ink(canvas, 1, 1, 18, 8), 0)
+        canvas = Canvas(20, 10)
+        canvas.dotted_line(0, 5, 20)
+        self.assertEqual(ink(canvas, 0, 5, 20, 1), 10)
+
+    def test_text(self):
+        canvas = Canvas()
+        width = canvas.text(100, 100, "Bastille", "NicoClean", 16)
+        self.assertEqual(width, get_font("NicoClean").measure("Bastille", 16))
+        self.assertGreater(ink(canvas, 100, 100, width, 20), 0)
+        self.assertEqual(ink(canvas, 0, 0, 800, 480), ink(canvas, 100, 100, width, 20))
+
+    def test_text_alignment_and_ellipsis(self):
+        canvas = Canvas()
+        text = "Porte de la Chapelle"
+        width = canvas.text(0, 0, text, max_width=60)
+        self.assertLessEqual(width, 60)
+        self.assertEqual(ink(canvas, 60, 0, 740, 20), 0)
+        canvas = Canvas()
+        width = canvas.text(0, 0, "8", align="right", max_width=800)
+        self.assertEqual(ink(canvas, 0, 0, 800 - width - 1, 20), 0)
+        self.assertGreater(ink(canvas, 800 - width, 0, width, 20), 0)
+
+    def test_labels(self):
+        canvas = Canvas()
+        width = canvas.label(10, 10, "Balard", "inverted")
+        height = get_font("NicoClean").line_height(16) + 4
+        # Mostly black, with white text
+        black = ink(canvas, 10, 10, width, height)
+        self.assertGreater(black, width * height / 2)
+        self.assertLess(black, width * height)
+        canvas = Canvas()
+        width = canvas.label(10, 10, "Balard", "outline")
+        self.assertEqual(ink(canvas, 10, 10, width, 1), width)
+
+    def test_table_and_text_block(self):
+        canvas = Canvas()
+        height = canvas.table(
+            0,
+            0,
+            [("Ligne 8", "12:42"), ("Ligne 1", "12:43")],
+            [(200, "left"), (100, "right")],
+        )
+        self.assertEqual(height, 2 * (get_font("NicoClean").line_height(16) + 4))
+        self.assertGreater(ink(canvas, 200, 0, 100, height), 0)
+        self.assertEqual(ink(canvas, 300, 0, 500, 480), 0)
+        canvas = Canvas()
+        height = canvas.text_block(0, 0, 100, "Prochains passages du Métro", lines=2)
+        self.assertEqual(height, 2 * get_font("NicoClean").line_height(16))
+        self.assertEqual(ink(canvas, 100, 0, 700, 480), 0)
+
+    def test_image(self):
+        icon = Bitmap(4, 2, [0b0110, 0b1111])
+        canvas = Canvas(10, 10)
+        canvas.image(3, 3, icon)
+        self.assertEqual(ink(canvas, 0, 0, 10, 10), 2)
+        self.assertEqual(ink(canvas, 3, 3, 1, 1), 1)
+        self.assertIsInstance(load_image("rover.bmp"), Bitmap)
+
+    def test_to_bitmap(self):
+        canvas = Canvas()
+        canvas.fill(0, 0, 1, 1)
+        bitmap = Bitmap.from_bmp(canvas.to_bmp())
+        self.assertEqual((bitmap.width, bitmap.height), (800, 480))
+        # 1 is white in a Bitmap
+        self.assertEqual(bitmap.rows[0], (1 << 799) - 1)
+        self.assertEqual(bitmap.rows[1], (1 << 800) - 1)
+
+    def test_fast(self):
+        start = time.perf_counter()
+        canvas = Canvas()
+        for row in range(10):
+            canvas.text(10, row * 40, "Prochains passages du Métro", "BlockKie", 26)
+        canvas.to_bmp()
+        self.assertLess(time.perf_counter() - start, 1)
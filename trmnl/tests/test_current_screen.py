@@ -0,0 +1,76 @@
+import datetime
+from unittest import mock
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from trmnl.models import Device, Screen
+from trmnl.models.screen import delete_old_screens
+
+from .fixtures import SAMPLE_BITMAP, create_fleet
+from .test_query_budget import device_headers
+
+
+class CurrentScreenTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.device = create_fleet(users=1, devices_per_user=1)[0]
+
+    def test_render_makes_the_screen_current(self):
+        item = self.device.current_screen.playlist_item
+        item.duration = 300
+        item.save()
+        screen = Screen.objects.create(
+            device=self.device, html="<p>New</p>", playlist_item=item
+        )
+        screen.store_bitmap(SAMPLE_BITMAP[:-1] + b"\x00")
+        self.device.refresh_from_db()
+        self.assertEqual(self.device.current_screen, screen)
+        self.assertEqual(
+            self.device.current_image_filename("png"),
+            f"{self.device.friendly_id}-{screen.id}.png",
+        )
+        self.assertEqual(self.device.display_duration, 300)
+
+    def test_duration_follows_the_playlist_item(self):
+        item = self.device.current_screen.playlist_item
+        item.duration = 120
+        item.save()
+        self.device.refresh_from_db()
+        self.assertEqual(self.device.display_duration, 120)
+
+    def test_older_screen_does_not_replace_a_newer_one(self):
+        current = self.device.current_screen
+        older = Screen.objects.create(device=self.device, html="<p>Old</p>")
+        Screen.objects.filter(pk=older.pk).update(
+            created_at=current.created_at - datetime.timedelta(minutes=1)
+        )
+        older.refresh_from_db()
+        older.make_current()
+        self.device.refresh_from_db()
+        self.assertEqual(self.device.current_screen, current)
+
+    @mock.patch("scheduler.models.task.Task._schedule", return_value=False)
+    def test_display_reads_no_screen(self, _schedule):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(
+                reverse("display"), **device_headers(self.device)
+            )
+        self.assertEqual(
+            response.json()["filename"], self.device.current_image_filename()
+        )
+        self.assertFalse(
+            any('"trmnl_screen"' in query["sql"] for query in context.captured_queries)
+        )
+
+    def test_old_current_screen_is_kept(self):
+        Screen.objects.update(created_at=timezone.now() - datetime.timedelta(days=2))
+        delete_old_screens()
+        self.assertEqual(
+            list(Screen.objects.values_list("pk", flat=True)),
+            [self.device.current_screen_id],
+        )
+        self.assertTrue(Device.objects.filter(current_screen__isnull=False).exists())
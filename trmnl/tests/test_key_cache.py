@@ -0,0 +1,61 @@
+import hashlib
+import json
+
+from django.test import TestCase
+from django.urls import reverse
+
+from trmnl.key_cache import get_api_key, get_device_id
+from trmnl.models import APIKey
+
+from .fixtures import create_fleet
+from .utils import QueryBudgetMixin, clear_key_caches
+
+
+class KeyCacheTest(QueryBudgetMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.device = create_fleet(users=1, devices_per_user=1)[0]
+        cls.api_key = APIKey.objects.create(name="Test", user=cls.device.user)
+        cls.token = cls.api_key.raw_key
+
+    def setUp(self):
+        clear_key_caches()
+
+    def test_keys_are_stored_hashed(self):
+        stored = APIKey.objects.get(pk=self.api_key.pk).key
+        self.assertNotEqual(stored, self.token)
+        self.assertEqual(stored, hashlib.sha256(self.token.encode()).hexdigest())
+
+    def test_verified_keys_are_cached(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(get_api_key(self.token), self.api_key)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_api_key(self.token).user, self.device.user)
+        self.assertIsNone(get_api_key("wrong"))
+
+    def test_deleted_keys_are_evicted(self):
+        get_api_key(self.token)
+        APIKey.objects.get(pk=self.api_key.pk).delete()
+        self.assertIsNone(get_api_key(self.token))
+
+    def test_device_keys(self):
+        api_key, mac = self.device.api_key, self.device.mac_address
+        self.assertEqual(get_device_id(api_key, mac), self.device.id)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_device_id(api_key), self.device.id)
+            self.assertIsNone(get_device_id(api_key, "00:00:00:00:00:00"))
+
+    def test_device_log_in_steady_state(self):
+        headers = {
+            "HTTP_ACCESS_TOKEN": self.device.api_key,
+            "HTTP_ID": self.device.mac_address,
+        }
+        for budget in (2, 1):
+            with self.assertQueryBudget(budget):
+                response = self.client.post(
+                    reverse("log"),
+                    data=json.dumps({"log": "battery low"}),
+                    content_type="application/json",
+                    **headers,
+                )
+            self.assertEqual(response.status_code, 200)
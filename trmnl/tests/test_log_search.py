@@ -0,0 +1,172 @@
+import datetime
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from trmnl.models import APIKey, DeviceLog
+
+from .fixtures import create_fleet
+
+
+def firmware_log(message, source="src/bl.cpp", retry=1):
+    return {
+        "log": {
+            "logs_array": [
+                {
+                    "log_message": message,
+                    "log_sourcefile": source,
+                    "additional_info": {"retry_attempt": retry},
+                }
+            ]
+        }
+    }
+
+
+class LogSearchTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.devices = create_fleet(users=2, devices_per_user=2, logs_per_device=0)
+        cls.wifi = DeviceLog.objects.create(
+            device=cls.devices[0], message=firmware_log("WiFi connection failed")
+        )
+        cls.others = DeviceLog.objects.bulk_create(
+            [
+                DeviceLog(
+                    device=cls.devices[1],
+                    message=firmware_log("Display refresh failed", retry=42),
+                ),
+                DeviceLog(
+                    device=cls.devices[2],
+                    message=firmware_log("WiFi connection failed"),
+                ),
+                DeviceLog(device=cls.devices[0], message="Plain text body"),
+            ]
+        )
+
+    def search(self, query):
+        return set(DeviceLog.objects.search(query).values_list("pk", flat=True))
+
+    def test_words_of_the_message(self):
+        self.assertEqual(self.search("wifi"), {self.wifi.pk, self.others[1].pk})
+        self.assertEqual(self.search("Failed  REFRESH"), {self.others[0].pk})
+        self.assertEqual(self.search("42"), {self.others[0].pk})
+        self.assertEqual(self.search("plain"), {self.others[2].pk})
+        self.assertEqual(len(self.search("src/bl.cpp")), 3)
+        self.assertEqual(self.search("wifi refresh"), set())
+        self.assertEqual(self.search("  "), set())
+
+    def test_keys_are_not_indexed(self):
+        self.assertEqual(self.search("log_message"), set())
+
+    def test_query_syntax_is_plain_text(self):
+        for query in ('"', "wifi -failed", "AND(", "NEAR wifi*", "it's"):
+            with self.subTest(query=query):
+                self.search(query)
+        self.assertEqual(self.search('"wifi"'), {self.wifi.pk, self.others[1].pk})
+
+    def test_index_follows_updates_and_deletes(self):
+        self.wifi.message = firmware_log("Battery low")
+        self.wifi.save()
+        self.assertEqual(self.search("wifi"), {self.others[1].pk})
+        self.assertEqual(self.search("battery"), {self.wifi.pk})
+        DeviceLog.objects.filter(pk=self.others[1].pk).delete()
+        self.assertEqual(self.search("wifi"), set())
+        self.assertEqual(self.search("failed"), {self.others[0].pk})
+
+
+class LogSearchApiTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.devices = create_fleet(users=2, devices_per_user=2, logs_per_device=0)
+        cls.user = cls.devices[0].user
+        cls.token = APIKey.objects.create(name="Logs", user=cls.user).raw_key
+        logs = DeviceLog.objects.bulk_create(
+            DeviceLog(
+                device=device,
+                message=firmware_log("WiFi connection failed" if index % 2 else "OK"),
+            )
+            for device in cls.devices
+            for index in range(4)
+        )
+        # One log an hour, the oldest first
+        now = timezone.now()
+        for hours, log in enumerate(reversed(logs)):
+            log.created_at = now - datetime.timedelta(hours=hours)
+        DeviceLog.objects.bulk_update(logs, ["created_at"])
+        cls.logs = logs
+
+    def get(self, **params):
+        return self.client.get(
+            reverse("search_logs"),
+            params,
+            headers={"Authorization": f"Bearer {self.token}"},
+        )
+
+    def test_requires_an_api_key(self):
+        self.assertEqual(self.client.get(reverse("search_logs")).status_code, 403)
+
+    def test_logs_of_the_user_devices(self):
+        logs = self.get().json()["logs"]
+        self.assertEqual(len(logs), 8)
+        self.assertEqual(
+            {log["device"] for log in logs},
+            {device.friendly_id for device in self.devices[:2]},
+        )
+        times = [log["created_at"] for log in logs]
+        self.assertEqual(times, sorted(times, reverse=True))
+
+    def test_filters(self):
+        device = self.devices[1]
+        logs = self.get(q="wifi", device=device.friendly_id.lower()).json()["logs"]
+        self.assertEqual(len(logs), 2)
+        self.assertTrue(all(log["device"] == device.friendly_id for log in logs))
+        self.assertEqual(logs[0]["message"], firmware_log("WiFi connection failed"))
+
+        first, last = self.logs[4], self.logs[6]
+        logs = self.get(
+            since=first.created_at.isoformat(), until=last.created_at.isoformat()
+        ).json()["logs"]
+        self.assertEqual([log["id"] for log in logs], [self.logs[5].pk, first.pk])
+
+        self.assertEqual(len(self.get(limit=3).json()["logs"]), 3)
+
+    def test_other_users_devices(self):
+        response = self.get(device=self.devices[2].friendly_id)
+        self.assertEqual(response.status_code, 404)
+        self.assertIn(self.devices[2].friendly_id, response.json()["message"])
+
+    def test_invalid_parameters(self):
+        self.assertEqual(self.get(since="yesterday").status_code, 400)
+        self.assertEqual(self.get(limit="all").status_code, 400)
+
+
+class LogSearchAdminTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.devices = create_fleet(users=1, devices_per_user=2, logs_per_device=3)
+        cls.failed = [
+            DeviceLog.objects.create(
+                device=device, message=firmware_log("WiFi connection failed")
+            )
+            for device in cls.devices
+        ]
+        cls.admin = User.objects.create_superuser("admin", password="password")
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def search(self, query):
+        response = self.client.get(
+            reverse("admin:trmnl_devicelog_changelist"), {"q": query}
+        )
+        return {log.pk for log in response.context["cl"].result_list}
+
+    def test_message_words(self):
+        self.assertEqual(self.search("wifi FAILED"), {log.pk for log in self.failed})
+
+    def test_friendly_id_and_message_words(self):
+        device = self.devices[1]
+        self.assertEqual(self.search(f"{device.friendly_id} wifi"), {self.failed[1].pk})
+        self.assertEqual(len(self.search(device.friendly_id)), 4)
@@ -0,0 +1,94 @@
+from unittest import mock
+
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from trmnl.bitmap import Bitmap
+from trmnl.models import Screen
+from trmnl.models.screen import LARGE_FIELDS
+
+from .fixtures import SAMPLE_BITMAP, create_fleet
+
+
+class MediaFormatTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.device = create_fleet(users=1, devices_per_user=1)[0]
+        cls.screen = cls.device.current_screen
+        cls.bitmap = Bitmap.from_bmp(SAMPLE_BITMAP)
+
+    def get(self, filename=None, **kwargs):
+        filename = filename or self.screen.image_filename_for_device()
+        return self.client.get(
+            reverse("device_image_view", args=[filename]),
+            {"api_key": self.device.api_key, **kwargs.pop("params", {})},
+            **kwargs,
+        )
+
+    def test_bmp_by_default(self):
+        response = self.get(HTTP_ACCEPT="*/*")
+        self.assertEqual(response["Content-Type"], "image/bmp")
+        self.assertEqual(response.getvalue(), SAMPLE_BITMAP)
+        self.assertEqual(response["Vary"], "Accept")
+
+    def test_format_parameter(self):
+        response = self.get(params={"format": "png"})
+        self.assertEqual(response["Content-Type"], "image/png")
+        self.assertTrue(response.getvalue().startswith(b"\x89PNG"))
+
+    def test_file_extension(self):
+        response = self.get(self.screen.image_filename_for_device("rle"))
+        self.assertEqual(Bitmap.from_rle(response.getvalue()), self.bitmap)
+
+    def test_accept_header(self):
+        response = self.get(HTTP_ACCEPT="image/png;q=0.5, application/x-trmnl-rle")
+        self.assertEqual(response["Content-Type"], "application/x-trmnl-rle")
+        self.assertLess(len(response.getvalue()), len(SAMPLE_BITMAP) / 10)
+
+    def test_accept_header_quality(self):
+        response = self.get(HTTP_ACCEPT="image/png;q=0.9, application/x-trmnl-rle;q=1")
+        self.assertEqual(response["Content-Type"], "application/x-trmnl-rle")
+        # Refused, whatever its spelling
+        for refused in ("0", "0.00", "0.000"):
+            response = self.get(HTTP_ACCEPT=f"image/png;q={refused}")
+            self.assertEqual(response["Content-Type"], "image/bmp")
+
+    def test_single_query(self):
+        Screen.objects.filter(pk=self.screen.pk).update(screen_png=self.bitmap.to_png())
+        filename = self.screen.image_filename_for_device()
+        with self.assertNumQueries(1) as context:
+            response = self.get(filename, params={"format": "png"})
+        self.assertFalse(response.streaming)
+        self.assertEqual(int(response["Content-Length"]), len(response.content))
+        sql = context.captured_queries[0]["sql"]
+        self.assertIn('"screen_png"', sql)
+        self.assertNotIn('"screen"', sql)
+        self.assertNotIn('"html"', sql)
+
+    def test_format_encoded_on_the_fly(self):
+        # Screens rendered before the compact encodings were stored
+        Screen.objects.filter(pk=self.screen.pk).update(screen_rle=None)
+        response = self.get(params={"format": "rle"})
+        self.assertEqual(Bitmap.from_rle(response.getvalue()), self.bitmap)
+
+    def test_large_fields_are_deferred(self):
+        screen = Screen.objects.get(pk=self.screen.pk)
+        self.assertEqual(screen.get_deferred_fields(), set(LARGE_FIELDS))
+        screen = Screen.objects.with_data("html").get(pk=self.screen.pk)
+        self.assertNotIn("html", screen.get_deferred_fields())
+        self.assertIn("screen", screen.get_deferred_fields())
+
+    def test_unsupported_format(self):
+        self.assertEqual(self.get(params={"format": "gif"}).status_code, 400)
+
+    @mock.patch("scheduler.models.task.Task._schedule", return_value=False)
+    def test_display_format(self, _schedule):
+        response = self.client.get(
+            reverse("display"),
+            {"format": "png", "base64": "1"},
+            HTTP_ACCESS_TOKEN=self.device.api_key,
+            HTTP_ID=self.device.mac_address,
+        )
+        data = response.json()
+        self.assertTrue(data["image_url"].startswith("data:image/png;base64,"))
+        self.assertTrue(data["filename"].endswith(".png"))
@@ -0,0 +1,60 @@
+import importlib.util
+import os
+import runpy
+import unittest
+from unittest import mock
+
+from django.db import connections
+from django.test import SimpleTestCase
+
+import byos_django.settings
+
+HAS_PSYCOPG_POOL = (
+    importlib.util.find_spec("psycopg") is not None
+    and importlib.util.find_spec("psycopg_pool") is not None
+)
+
+
+def load_settings(**environ):
+    """The settings module evaluated with these environment variables"""
+    with mock.patch.dict(os.environ, environ):
+        return runpy.run_path(byos_django.settings.__file__)
+
+
+class PostgresSettingsTest(SimpleTestCase):
+    """
+    The PostgreSQL profile of the settings (DB_ENGINE=postgres), whatever the
+    database used by the other tests.
+    """
+
+    def test_sqlite_by_default(self):
+        database = load_settings(DB_ENGINE="sqlite")["DATABASES"]["default"]
+        self.assertEqual(database["ENGINE"], "django.db.backends.sqlite3")
+
+    def test_postgres(self):
+        database = load_settings(
+            DB_ENGINE="postgres",
+            POSTGRES_HOST="db",
+            POSTGRES_POOL_MIN_SIZE="1",
+            POSTGRES_POOL_MAX_SIZE="4",
+        )["DATABASES"]["default"]
+        self.assertEqual(database["ENGINE"], "django.db.backends.postgresql")
+        self.assertEqual(database["HOST"], "db")
+        self.assertEqual(database["CONN_MAX_AGE"], 0)
+        self.assertEqual(database["OPTIONS"]["pool"]["min_size"], 1)
+        self.assertEqual(database["OPTIONS"]["pool"]["max_size"], 4)
+
+    @unittest.skipUnless(HAS_PSYCOPG_POOL, "needs the postgres extra")
+    def test_pool_is_accepted_by_the_backend(self):
+        from django.db.backends.postgresql.base import DatabaseWrapper
+
+        database = load_settings(DB_ENGINE="postgres", POSTGRES_POOL_MAX_SIZE="4")[
+            "DATABASES"
+        ]["default"]
+        databases = connections.configure_settings({"default": database})
+        wrapper = DatabaseWrapper(databases["default"], alias="pool-settings")
+        # Created closed, no connection is made
+        pool = wrapper.pool
+        self.addCleanup(wrapper.close_pool)
+        self.assertEqual((pool.min_size, pool.max_size, pool.timeout), (2, 4, 10))
+        self.assertNotIn("pool", wrapper.get_connection_params())
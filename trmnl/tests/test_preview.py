@@ -0,0 +1,131 @@
+import asyncio
+import json
+from types import SimpleNamespace
+from unittest import mock
+
+from channels.testing import WebsocketCommunicator
+from django.test import SimpleTestCase
+
+from trmnl.browser_pool import BrowserPool
+from trmnl.consumers import PreviewConsumer
+
+
+class PreviewConsumerTest(SimpleTestCase):
+    def setUp(self):
+        self.rendered = []
+
+        async def screenshot(page, html, timings=None):
+            await asyncio.sleep(0.05)
+            self.rendered.append(html)
+            timings["load"] = 0.05
+            return html.encode()
+
+        pool = BrowserPool(2)
+        pool.get_browser = mock.AsyncMock(return_value=mock.AsyncMock())
+        patches = [
+            mock.patch("trmnl.consumers.get_browser_pool", return_value=pool),
+            mock.patch("trmnl.render.async_screenshot", side_effect=screenshot),
+            mock.patch("trmnl.render.dither", side_effect=lambda png: b"BM" + png),
+        ]
+        for patcher in patches:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    async def communicate(self, *messages):
+        communicator = WebsocketCommunicator(PreviewConsumer.as_asgi(), "/ws/preview")
+        communicator.scope["user"] = SimpleNamespace(is_superuser=True)
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        for html in messages:
+            await communicator.send_to(text_data=json.dumps({"html": html}))
+        metadata = json.loads(await communicator.receive_from(timeout=2))
+        image = await communicator.receive_from(timeout=2)
+        self.assertTrue(await communicator.receive_nothing(timeout=0.3))
+        await communicator.disconnect()
+        return metadata, image
+
+    def test_only_latest_html_is_rendered(self):
+        metadata, image = asyncio.run(
+            self.communicate("<p>1</p>", "<p>12</p>", "<p>123</p>")
+        )
+        self.assertEqual(self.rendered, ["<p>123</p>"])
+        self.assertEqual(metadata["id"], 3)
+        self.assertEqual(metadata["content_type"], "image/bmp")
+        self.assertEqual(set(metadata["timings"]), {"load", "dither"})
+        self.assertEqual(image, b"BM<p>123</p>")
+
+    def test_in_flight_render_is_cancelled(self):
+        async def scenario():
+            communicator = WebsocketCommunicator(
+                PreviewConsumer.as_asgi(), "/ws/preview"
+            )
+            communicator.scope["user"] = SimpleNamespace(is_superuser=True)
+            await communicator.connect()
+            await communicator.send_to(text_data=json.dumps({"html": "old"}))
+            # Past the debounce delay, during the screenshot
+            await asyncio.sleep(PreviewConsumer.debounce + 0.02)
+            await communicator.send_to(text_data=json.dumps({"html": "new"}))
+            metadata = json.loads(await communicator.receive_from(timeout=2))
+            image = await communicator.receive_from(timeout=2)
+            await communicator.disconnect()
+            return metadata, image
+
+        metadata, image = asyncio.run(scenario())
+        self.assertEqual(metadata["id"], 2)
+        self.assertEqual(image, b"BMnew")
+        self.assertEqual(self.rendered, ["new"])
+
+
+class BrowserPoolTest(SimpleTestCase):
+    def setUp(self):
+        self.browser = mock.AsyncMock()
+        self.browser.is_connected = mock.Mock(return_value=True)
+        patches = [
+            mock.patch(
+                "trmnl.browser_pool.async_playwright",
+                return_value=mock.Mock(start=mock.AsyncMock()),
+            ),
+            mock.patch(
+                "trmnl.render.launch_browser",
+                new=mock.AsyncMock(return_value=self.browser),
+            ),
+        ]
+        for patcher in patches:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.launch_browser = patches[1].new
+
+    def test_sessions_share_one_browser(self):
+        async def scenario():
+            pool = BrowserPool(2)
+            first, second = await asyncio.gather(pool.acquire(), pool.acquire())
+            self.assertTrue(pool.full)
+            await pool.release(first)
+            await pool.release(second)
+            self.assertFalse(pool.full)
+
+        asyncio.run(scenario())
+        self.launch_browser.assert_awaited_once()
+        self.assertEqual(self.browser.new_context.await_count, 2)
+
+    def test_waits_for_a_free_slot(self):
+        async def scenario():
+            pool = BrowserPool(1)
+            context = await pool.acquire()
+            waiting = asyncio.create_task(pool.acquire())
+            await asyncio.sleep(0.01)
+            self.assertFalse(waiting.done())
+            await pool.release(context)
+            await asyncio.wait_for(waiting, 1)
+
+        asyncio.run(scenario())
+
+    def test_restarts_a_disconnected_browser(self):
+        async def scenario():
+            pool = BrowserPool(1)
+            await pool.release(await pool.acquire())
+            self.browser.is_connected.return_value = False
+            await pool.release(await pool.acquire())
+
+        asyncio.run(scenario())
+        self.assertEqual(self.launch_browser.await_count, 2)
@@ -0,0 +1,109 @@
+import json
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.test.client import Client
+from django.urls import reverse
+
+from .fixtures import create_fleet
+from .utils import QueryBudgetMixin, clear_key_caches
+
+
+def device_headers(device):
+    return {"HTTP_ACCESS_TOKEN": device.api_key, "HTTP_ID": device.mac_address}
+
+
+@mock.patch("scheduler.models.task.Task._schedule", return_value=False)
+class DeviceApiQueryBudgetTest(QueryBudgetMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.devices = create_fleet()
+        cls.device = cls.devices[0]
+
+    def setUp(self):
+        clear_key_caches()
+
+    def test_display(self, _schedule):
+        # The first poll creates the screen generation task, later ones update it
+        for budget in (20, 13, 13):
+            with self.assertQueryBudget(budget):
+                response = self.client.get(
+                    reverse("display"), **device_headers(self.device)
+                )
+            self.assertEqual(response.json()["status"], 0)
+
+    def test_log(self, _schedule):
+        with self.assertQueryBudget(2):
+            response = self.client.post(
+                reverse("log"),
+                data=json.dumps({"log": "battery low"}),
+                content_type="application/json",
+                **device_headers(self.device),
+            )
+        self.assertEqual(response.status_code, 200)
+
+    def test_device_image_view(self, _schedule):
+        filename = self.device.current_image_filename()
+        with self.assertQueryBudget(2):
+            response = self.client.get(
+                reverse("device_image_view", args=[filename]),
+                {"api_key": self.device.api_key},
+            )
+            response.getvalue()
+        self.assertEqual(response.status_code, 200)
+
+
+class AdminChangelistQueryBudgetTest(QueryBudgetMixin, TestCase):
+    budgets = {
+        "device": 8,
+        "devicelog": 6,
+        "screen": 6,
+        "apikey": 6,
+        "playlist": 5,
+        "playlistitem": 5,
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        create_fleet()
+        cls.admin = User.objects.create_superuser("admin", password="password")
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def test_changelists(self):
+        for model, budget in self.budgets.items():
+            with self.subTest(model=model), self.assertQueryBudget(budget):
+                response = self.client.get(reverse(f"admin:trmnl_{model}_changelist"))
+                self.assertEqual(response.status_code, 200)
+
+
+class QueryStatsMiddlewareTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.device = create_fleet(users=1, devices_per_user=1)[0]
+
+    def setUp(self):
+        clear_key_caches()
+
+    @override_settings(QUERY_STATS=True)
+    def test_headers(self):
+        # Middleware are instantiated with the client handler
+        response = Client().post(
+            reverse("log"),
+            data="{}",
+            content_type="application/json",
+            **device_headers(self.device),
+        )
+        self.assertEqual(response["X-DB-Queries"], "2")
+        self.assertTrue(response["X-DB-Time"].endswith("ms"))
+
+    def test_disabled_by_default(self):
+        response = Client().post(
+            reverse("log"),
+            data="{}",
+            content_type="application/json",
+            **device_headers(self.device),
+        )
+        self.assertNotIn("X-DB-Queries", response)
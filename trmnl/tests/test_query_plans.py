@@ -0,0 +1,101 @@
+import unittest
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from plugins.models import Plugin
+from trmnl.key_cache import get_device_id
+from trmnl.models import DeviceLog, PlaylistItem, Screen
+
+from .fixtures import SAMPLE_BITMAP, create_fleet
+from .utils import clear_key_caches
+
+
+@unittest.skipUnless(connection.vendor == "sqlite", "EXPLAIN QUERY PLAN is SQLite's")
+class QueryPlanTest(TestCase):
+    """
+    The hot queries (device polling, screen rotation, logs) must be answered
+    from an index: no full table scan, no temporary B-tree to sort the rows.
+    Queries are captured from the code paths themselves, so a change to one of
+    them is checked as well. The database isn't ANALYZEd, as in production.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.devices = create_fleet(
+            users=4,
+            devices_per_user=5,
+            screens_per_device=20,
+            logs_per_device=50,
+        )
+        cls.device = cls.devices[7]
+
+    def query_plan(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN QUERY PLAN {sql}")
+            return [row[-1] for row in cursor.fetchall()]
+
+    def assertIndexedPlans(self, function, table=None):
+        with CaptureQueriesContext(connection) as context:
+            function()
+        selects = [
+            query["sql"]
+            for query in context.captured_queries
+            if query["sql"].startswith("SELECT")
+            and (table is None or f'FROM "{table}"' in query["sql"])
+        ]
+        self.assertTrue(selects)
+        for sql in selects:
+            plan = self.query_plan(sql)
+            with self.subTest(sql=sql):
+                for step in plan:
+                    # A SELECT without FROM scans its constant row
+                    self.assertFalse(
+                        step.startswith("SCAN") and step != "SCAN CONSTANT ROW",
+                        f"Full scan: {step}\n{plan}",
+                    )
+                    self.assertNotIn("TEMP B-TREE", step, f"Sort: {step}\n{plan}")
+
+    def test_current_screen(self):
+        self.assertIndexedPlans(lambda: self.device.current_screen)
+
+    def test_store_bitmap(self):
+        screen = Screen.objects.create(device=self.device, html="<p>New</p>")
+        self.assertIndexedPlans(lambda: screen.store_bitmap(SAMPLE_BITMAP))
+
+    def test_last_screen_of_playlist_item(self):
+        item = self.device.current_screen.playlist_item
+        self.assertIndexedPlans(lambda: Plugin.reuse_last_screen(self.device, item))
+
+    def test_next_playlist_item(self):
+        PlaylistItem.objects.filter(playlist__device=self.device).update(
+            last_displayed_at=self.device.last_seen_at
+        )
+        self.assertIndexedPlans(self.device.get_next_playlist_item)
+
+    def test_device_logs_by_time(self):
+        self.assertIndexedPlans(
+            lambda: list(
+                DeviceLog.objects.filter(
+                    device=self.device, created_at__gte=self.device.created_at
+                )[:20]
+            )
+        )
+
+    def test_device_by_key_and_mac_address(self):
+        clear_key_caches()
+        self.assertIndexedPlans(
+            lambda: get_device_id(self.device.api_key, self.device.mac_address)
+        )
+
+    def test_admin_log_pages(self):
+        admin = User.objects.create_superuser("admin", password="password")
+        self.client.force_login(admin)
+        url = reverse("admin:trmnl_devicelog_changelist")
+        next_page = self.client.get(url).context["cl"].next_cursor_url
+        self.assertIndexedPlans(
+            lambda: self.client.get(url + next_page), table="trmnl_devicelog"
+        )
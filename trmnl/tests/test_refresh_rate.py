@@ -0,0 +1,266 @@
+import datetime
+import io
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from trmnl.models import Playlist
+from utils.weekday_field import Weekday
+
+from .fixtures import create_fleet
+from .utils import clear_key_caches
+
+# A Wednesday
+NOW = datetime.datetime(2026, 3, 4, 12, 0, tzinfo=datetime.timezone.utc)
+
+
+def weekday_of(when):
+    return Weekday(1 << when.weekday())
+
+
+class PlaylistScheduleTest(TestCase):
+    def playlist(self, weekdays, active_from=None, active_to=None):
+        return Playlist(weekdays=weekdays, active_from=active_from, active_to=active_to)
+
+    def test_weekdays(self):
+        for day in range(7):
+            when = NOW + datetime.timedelta(days=day)
+            with self.subTest(day=when.strftime("%A")):
+                self.assertTrue(self.playlist(weekday_of(when)).is_active_at(when))
+                other_days = ~weekday_of(when) & ~Weekday.NONE
+                self.assertFalse(self.playlist(other_days).is_active_at(when))
+
+    def test_time_window(self):
+        playlist = self.playlist(
+            Weekday.WEDNESDAY, datetime.time(8), datetime.time(11, 30)
+        )
+        self.assertFalse(playlist.is_active_at(NOW))
+        self.assertTrue(playlist.is_active_at(NOW.replace(hour=9)))
+
+    def test_next_activation(self):
+        working_hours = self.playlist(
+            Weekday.MONDAY | Weekday.FRIDAY, datetime.time(8), datetime.time(18)
+        )
+        self.assertEqual(
+            working_hours.next_activation(NOW),
+            datetime.datetime(2026, 3, 6, 8, 0, tzinfo=NOW.tzinfo),
+        )
+        friday_evening = datetime.datetime(2026, 3, 6, 19, 0, tzinfo=NOW.tzinfo)
+        self.assertEqual(
+            working_hours.next_activation(friday_evening),
+            datetime.datetime(2026, 3, 9, 8, 0, tzinfo=NOW.tzinfo),
+        )
+        all_day = self.playlist(Weekday.WEDNESDAY)
+        self.assertEqual(
+            all_day.next_activation(NOW),
+            datetime.datetime(2026, 3, 11, tzinfo=NOW.tzinfo),
+        )
+        self.assertIsNone(self.playlist(Weekday.NONE).next_activation(NOW))
+        self.assertIsNone(
+            self.playlist(
+                Weekday.WEDNESDAY, datetime.time(18), datetime.time(8)
+            ).next_activation(NOW)
+        )
+
+
+@override_settings(
+    ADAPTIVE_REFRESH=True,
+    ADAPTIVE_REFRESH_MIN_SECONDS=60,
+    ADAPTIVE_REFRESH_MAX_SECONDS=4 * 3600,
+    SCREEN_REFRESH_SECONDS_BEFORE_EXPIRY=10,
+    LOW_BATTERY_VOLTAGE=None,
+    POLL_SPREAD_SECONDS=0,
+)
+class AdaptiveRefreshRateTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.device = create_fleet(users=1, devices_per_user=1, logs_per_device=0)[0]
+        cls.playlist = cls.device.playlists.get(is_active=True)
+
+    def refresh_rate(self, next_screen_at=None):
+        return self.device.adaptive_refresh_rate(next_screen_at, now=NOW)
+
+    def test_until_the_next_screen(self):
+        next_screen_at = NOW + datetime.timedelta(seconds=890)
+        self.assertEqual(self.refresh_rate(next_screen_at), 900)
+        # Generated right away, the device comes back for it soon
+        self.assertEqual(self.refresh_rate(NOW + datetime.timedelta(seconds=5)), 60)
+
+    def test_until_the_end_of_the_time_window(self):
+        self.playlist.weekdays = Weekday.WEDNESDAY
+        self.playlist.active_from = datetime.time(8)
+        self.playlist.active_to = datetime.time(12, 5)
+        self.playlist.save()
+        next_screen_at = NOW + datetime.timedelta(seconds=890)
+        self.assertEqual(self.refresh_rate(next_screen_at), 300 + 10)
+
+    def test_until_another_playlist_starts(self):
+        other = self.device.playlists.exclude(pk=self.playlist.pk).first()
+        other.is_active = True
+        other.weekdays = Weekday.WEDNESDAY
+        other.active_from = datetime.time(12, 10)
+        other.active_to = datetime.time(13)
+        other.save()
+        next_screen_at = NOW + datetime.timedelta(seconds=890)
+        self.assertEqual(self.refresh_rate(next_screen_at), 600 + 10)
+
+    def test_until_the_last_weekday_ends(self):
+        self.playlist.weekdays = Weekday.TUESDAY | Weekday.WEDNESDAY
+        self.playlist.save()
+        self.assertEqual(
+            self.playlist.active_until(NOW),
+            datetime.datetime(2026, 3, 5, tzinfo=NOW.tzinfo),
+        )
+
+    def test_until_the_next_playlist(self):
+        self.playlist.weekdays = Weekday.WEDNESDAY
+        self.playlist.active_from = datetime.time(13)
+        self.playlist.active_to = datetime.time(17)
+        self.playlist.save()
+        self.assertEqual(self.refresh_rate(), 3600 + 10)
+        # Tomorrow
+        self.playlist.weekdays = Weekday.THURSDAY
+        self.playlist.save()
+        self.device.refresh_from_db()
+        self.assertEqual(self.refresh_rate(), 4 * 3600)
+
+    def test_without_playlists(self):
+        self.device.playlists.update(is_active=False)
+        self.assertEqual(self.refresh_rate(), self.device.display_duration)
+
+    @override_settings(LOW_BATTERY_VOLTAGE=3.5, LOW_BATTERY_REFRESH_FACTOR=2)
+    def test_low_battery(self):
+        next_screen_at = NOW + datetime.timedelta(seconds=890)
+        self.device.battery_voltage = 3.9
+        self.assertEqual(self.refresh_rate(next_screen_at), 900)
+        self.device.battery_voltage = 3.4
+        self.assertEqual(self.refresh_rate(next_screen_at), 1800)
+
+    @override_settings(ADAPTIVE_REFRESH=False)
+    def test_disabled(self):
+        self.device.playlists.update(is_active=False)
+        self.assertEqual(self.refresh_rate(NOW), self.device.display_duration)
+
+
+@override_settings(
+    ADAPTIVE_REFRESH=True, ADAPTIVE_REFRESH_MAX_SECONDS=4 * 3600, POLL_SPREAD_SECONDS=0
+)
+@mock.patch("scheduler.models.task.Task._schedule", return_value=False)
+class DisplayRefreshRateTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.device = create_fleet(users=1, devices_per_user=1, logs_per_device=0)[0]
+
+    def setUp(self):
+        clear_key_caches()
+
+    def poll(self):
+        response = self.client.get(
+            reverse("display"),
+            HTTP_ACCESS_TOKEN=self.device.api_key,
+            HTTP_ID=self.device.mac_address,
+        )
+        return int(response.json()["refresh_rate"])
+
+    def test_active_playlist(self, _schedule):
+        self.assertEqual(self.poll(), self.device.display_duration)
+
+    def test_outside_of_the_playlists(self, _schedule):
+        in_two_days = timezone.localtime() + datetime.timedelta(days=2)
+        self.device.playlists.update(weekdays=weekday_of(in_two_days))
+        self.assertEqual(self.poll(), 4 * 3600)
+
+
+@override_settings(
+    ADAPTIVE_REFRESH=True,
+    POLL_SPREAD_SECONDS=60,
+    SCREEN_REFRESH_SECONDS_BEFORE_EXPIRY=10,
+    LOW_BATTERY_VOLTAGE=None,
+)
+class PollSpreadTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.devices = create_fleet(users=2, devices_per_user=10, logs_per_device=0)
+
+    def test_slots(self):
+        device = self.devices[0]
+        slot = device.spread(NOW)
+        self.assertTrue(NOW - datetime.timedelta(seconds=10) < slot)
+        self.assertTrue(slot < NOW + datetime.timedelta(seconds=60))
+        # The same phase every time, every 60 seconds
+        self.assertEqual(
+            device.spread(NOW + datetime.timedelta(hours=1)),
+            slot + datetime.timedelta(hours=1),
+        )
+        self.assertEqual(device.spread(slot), slot)
+        # Late by a few seconds, the slot is kept
+        self.assertEqual(device.spread(slot + datetime.timedelta(seconds=3)), slot)
+        self.assertEqual(
+            device.spread(slot + datetime.timedelta(seconds=11)),
+            slot + datetime.timedelta(seconds=60),
+        )
+        self.assertEqual(device.spread(NOW, window=0), NOW)
+
+    def test_devices_due_together_are_spread(self):
+        slots = {device.spread(NOW) for device in self.devices}
+        self.assertEqual(len(slots), len(self.devices))
+        spread = max(slots) - min(slots)
+        self.assertGreater(spread, datetime.timedelta(seconds=30))
+        self.assertLess(spread, datetime.timedelta(seconds=70))
+
+    def test_renders_and_polls_share_the_slot(self):
+        device = self.devices[0]
+        device.last_seen_at = NOW
+        next_screen_at = device.next_screen_time(NOW)
+        self.assertEqual(next_screen_at, device.spread(next_screen_at))
+        refresh_rate = device.adaptive_refresh_rate(next_screen_at, now=NOW)
+        self.assertAlmostEqual(
+            NOW + datetime.timedelta(seconds=refresh_rate),
+            next_screen_at + datetime.timedelta(seconds=10),
+            delta=datetime.timedelta(seconds=1),
+        )
+        # Within the tolerance of the screen duration
+        self.assertLess(abs(refresh_rate - device.display_duration), 60)
+
+    @override_settings(
+        LOW_BATTERY_VOLTAGE=3.5,
+        LOW_BATTERY_REFRESH_FACTOR=2,
+        ADAPTIVE_REFRESH_MIN_SECONDS=60,
+        ADAPTIVE_REFRESH_MAX_SECONDS=3600,
+    )
+    def test_battery_and_bounds_keep_the_slot(self):
+        device = self.devices[0]
+        device.last_seen_at = NOW
+        device.battery_voltage = 3.4
+        margin = datetime.timedelta(seconds=10)
+        for next_screen_at in (
+            device.next_screen_time(NOW),
+            device.spread(NOW + datetime.timedelta(seconds=5)),
+            device.spread(NOW + datetime.timedelta(hours=2)),
+        ):
+            with self.subTest(next_screen_at=next_screen_at):
+                refresh_rate = device.adaptive_refresh_rate(next_screen_at, now=NOW)
+                wake_at = NOW + datetime.timedelta(seconds=refresh_rate)
+                self.assertAlmostEqual(
+                    device.spread(wake_at - margin) + margin,
+                    wake_at,
+                    delta=datetime.timedelta(seconds=1),
+                )
+                self.assertLess(refresh_rate, 3600 + 60)
+                self.assertGreater(refresh_rate, 60 - 10)
+
+    def test_report(self):
+        output = io.StringIO()
+        call_command("pollspread", hours=2, window=120, stdout=output)
+        rows = {}
+        for line in output.getvalue().splitlines()[2:]:
+            *label, lockstep, spread = line.split()
+            rows[" ".join(label)] = (int(lockstep), int(spread))
+        lockstep, spread = rows["peak polls / s"]
+        self.assertEqual(lockstep, len(self.devices))
+        self.assertLess(spread, lockstep / 4)
+        lockstep, spread = rows["peak renders / s"]
+        self.assertLess(spread, lockstep / 4)
@@ -0,0 +1,40 @@
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+
+from trmnl import render
+
+
+@override_settings(RENDER_ASSET_CACHE=False, RENDER_READY_TIMEOUT=2)
+class ScreenshotReadinessTest(SimpleTestCase):
+    def setUp(self):
+        self.page = mock.Mock()
+        self.page.evaluate.return_value = True
+        self.page.screenshot.return_value = b"png"
+
+    def test_waits_for_readiness_not_load(self):
+        timings = {}
+        png = render.screenshot(self.page, "<html></html>", timings=timings)
+        self.assertEqual(png, b"png")
+        self.page.set_content.assert_called_once_with(
+            "<html></html>", wait_until="domcontentloaded"
+        )
+        self.page.add_style_tag.assert_called_once_with(
+            content=render.NO_ANIMATIONS_CSS
+        )
+        self.page.evaluate.assert_called_with(render.READY_JS, 2000)
+        self.page.screenshot.assert_called_once_with(animations="disabled")
+        self.assertEqual(list(timings), ["load", "ready", "screenshot"])
+
+    def test_captures_anyway_after_deadline(self):
+        self.page.evaluate.return_value = False
+        with self.assertLogs("trmnl", "WARNING") as logs:
+            png = render.screenshot(self.page, "<html></html>")
+        self.assertEqual(png, b"png")
+        self.assertIn("not ready after 2s", logs.output[0])
+
+    def test_format_timings(self):
+        self.assertEqual(
+            render.format_timings({"load": 0.1, "ready": 0.25}),
+            "load 0.10s, ready 0.25s",
+        )
@@ -0,0 +1,168 @@
+import json
+from unittest import mock
+
+from django.test import TestCase, override_settings
+
+from trmnl.models import APIKey, RenderJob, Screen
+from trmnl.models.render_job import notify_render_job, run_render_job
+
+from .fixtures import SAMPLE_BITMAP, create_fleet
+
+
+@override_settings(RENDER_MODE="inline")
+class RenderJobApiTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.devices = create_fleet(users=2, devices_per_user=3, screens_per_device=0)
+        cls.user = cls.devices[0].user
+        cls.token = APIKey.objects.create(name="Jobs", user=cls.user).raw_key
+        cls.friendly_ids = [device.friendly_id for device in cls.devices[:3]]
+
+    def post(self, data):
+        return self.client.post(
+            "/api/v1/generate_screen",
+            json.dumps(data),
+            content_type="application/json",
+            headers={"Authorization": f"Bearer {self.token}"},
+        )
+
+    @mock.patch("trmnl.models.render_job.run_render_job.delay")
+    @mock.patch("trmnl.render.render_html")
+    def test_async_mode_never_renders_in_the_request(self, render_html, delay):
+        response = self.post(
+            {"device": self.friendly_ids[0], "html": "<p>Hi</p>", "async": True}
+        )
+        self.assertEqual(response.status_code, 202)
+        job_id = response.json()["job"]
+        delay.assert_called_once_with(job_id)
+        render_html.assert_not_called()
+
+        status = self.client.get(
+            response.json()["status_url"],
+            headers={"Authorization": f"Bearer {self.token}"},
+        ).json()
+        self.assertEqual(status["state"], "pending")
+        self.assertEqual(status["screens"][0]["device"], self.friendly_ids[0])
+
+    @mock.patch("trmnl.models.render_job.run_render_job.delay")
+    def test_batch_modes(self, delay):
+        response = self.post(
+            {
+                "screens": [
+                    {"device": self.friendly_ids[0], "html": "<p>A</p>"},
+                    {"device": self.friendly_ids[1], "html": "<p>B</p>"},
+                ]
+            }
+        )
+        self.assertEqual(response.status_code, 202)
+        response = self.post({"devices": self.friendly_ids, "html": "<p>All</p>"})
+        self.assertEqual(response.status_code, 202)
+        job = RenderJob.objects.get(pk=response.json()["job"])
+        self.assertEqual(job.screens.count(), 3)
+        self.assertEqual(delay.call_count, 2)
+
+    @override_settings(RENDER_JOB_CALLBACK_HOSTS=[".example.com"])
+    @mock.patch("trmnl.models.render_job.run_render_job.delay")
+    def test_callback_hosts(self, delay):
+        data = {"device": self.friendly_ids[0], "html": "<p>Hi</p>", "async": True}
+        for callback_url in (
+            "http://redis:6379/",
+            "http://169.254.169.254/latest/meta-data",
+            "ftp://hooks.example.com/",
+        ):
+            with self.subTest(callback_url=callback_url):
+                response = self.post({**data, "callback_url": callback_url})
+                self.assertEqual(response.status_code, 400)
+        response = self.post({**data, "callback_url": "https://hooks.example.com/"})
+        self.assertEqual(response.status_code, 202)
+
+    def test_unknown_devices_are_rejected(self):
+        other_device = self.devices[-1].friendly_id
+        response = self.post(
+            {"devices": [self.friendly_ids[0], other_device], "html": "<p>A</p>"}
+        )
+        self.assertEqual(response.status_code, 404)
+        self.assertIn(other_device, response.json()["message"])
+        self.assertFalse(RenderJob.objects.exists())
+
+    @override_settings(RENDER_JOB_MAX_SCREENS=2)
+    def test_batch_size_limit(self):
+        response = self.post({"devices": self.friendly_ids, "html": "<p>A</p>"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_status_of_other_users_jobs(self):
+        job = RenderJob.objects.create(user=self.devices[-1].user)
+        response = self.client.get(
+            f"/api/v1/render_jobs/{job.id}",
+            headers={"Authorization": f"Bearer {self.token}"},
+        )
+        self.assertEqual(response.status_code, 404)
+
+
+class RunRenderJobTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.devices = create_fleet(users=1, devices_per_user=3, screens_per_device=0)
+
+    def create_job(self, callback_url=""):
+        job = RenderJob.objects.create(
+            user=self.devices[0].user, callback_url=callback_url
+        )
+        for device in self.devices:
+            Screen.objects.create(device=device, html="<p>Same</p>", render_job=job)
+        return job
+
+    @mock.patch("trmnl.models.render_job.notify_render_job.delay")
+    @mock.patch("trmnl.render.render_html", return_value=SAMPLE_BITMAP)
+    def test_same_html_is_rendered_once(self, render_html, notify):
+        job = self.create_job(callback_url="https://example.com/hook")
+        run_render_job(str(job.id))
+        render_html.assert_called_once()
+        job.refresh_from_db()
+        self.assertEqual(job.status, RenderJob.Status.DONE)
+        self.assertTrue(all(screen.generated for screen in job.screens.all()))
+        notify.assert_called_once_with(str(job.id))
+
+    @mock.patch("trmnl.render.render_html", side_effect=TimeoutError("slow"))
+    def test_failure(self, render_html):
+        job = self.create_job()
+        run_render_job(str(job.id))
+        job.refresh_from_db()
+        self.assertEqual(job.status, RenderJob.Status.FAILED)
+        self.assertEqual(job.error, "slow")
+
+    @mock.patch("trmnl.render.render_html")
+    def test_failed_html_does_not_stop_the_others(self, render):
+        job = self.create_job()
+        failing = Screen.objects.create(
+            device=self.devices[0], html="<p>Broken</p>", render_job=job
+        )
+
+        def render_html(html, timeout):
+            if html == failing.html:
+                raise TimeoutError("slow")
+            return SAMPLE_BITMAP
+
+        render.side_effect = render_html
+        run_render_job(str(job.id))
+        job.refresh_from_db()
+        self.assertEqual(job.status, RenderJob.Status.FAILED)
+        self.assertEqual(job.error, "slow")
+        failing.refresh_from_db()
+        self.assertFalse(failing.generated)
+        self.assertEqual(job.screens.filter(generated=True).count(), 3)
+
+    @mock.patch("trmnl.models.render_job.requests.post")
+    def test_callback_to_a_host_not_allowed(self, post):
+        job = self.create_job(callback_url="http://redis:6379/")
+        notify_render_job(str(job.id))
+        post.assert_not_called()
+        with self.settings(RENDER_JOB_CALLBACK_HOSTS=["redis"]):
+            notify_render_job(str(job.id))
+        self.assertFalse(post.call_args.kwargs["allow_redirects"])
+
+    @override_settings(RENDER_MODE="worker")
+    def test_worker_claims_screens_with_the_same_html(self):
+        job = self.create_job()
+        job.enqueue()
+        self.assertEqual(len(Screen.objects.claim_pending(1)), 3)
@@ -0,0 +1,47 @@
+import datetime
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from trmnl.models import Screen
+
+from .fixtures import create_fleet
+
+
+class RenderQueueTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.device = create_fleet(users=1, devices_per_user=1)[0]
+
+    def queue_screens(self, count):
+        return [
+            Screen.objects.create(
+                device=self.device, html=f"<p>{index}</p>", queued_at=timezone.now()
+            )
+            for index in range(count)
+        ]
+
+    @override_settings(RENDER_MODE="worker")
+    def test_request_render_queues_in_worker_mode(self):
+        screen = Screen.objects.create(device=self.device, html="<p>Hello</p>")
+        screen.request_render()
+        self.assertFalse(screen.generated)
+        self.assertEqual(list(Screen.objects.pending_render()), [screen])
+
+    def test_claim_pending_oldest_first(self):
+        screens = self.queue_screens(3)
+        self.assertEqual(Screen.objects.claim_pending(2), screens[:2])
+        self.assertEqual(Screen.objects.claim_pending(2), [screens[2]])
+        self.assertEqual(Screen.objects.claim_pending(2), [])
+
+    def test_generated_screens_are_not_claimed(self):
+        self.assertEqual(Screen.objects.claim_pending(10), [])
+
+    @override_settings(RENDER_WORKER_CLAIM_TIMEOUT=60)
+    def test_stale_claims_are_claimed_again(self):
+        (screen,) = self.queue_screens(1)
+        Screen.objects.claim_pending(1)
+        Screen.objects.filter(pk=screen.pk).update(
+            claimed_at=timezone.now() - datetime.timedelta(seconds=61)
+        )
+        self.assertEqual(Screen.objects.claim_pending(1), [screen])
@@ -0,0 +1,128 @@
+import tempfile
+import threading
+from pathlib import Path
+
+from django.conf import settings
+from django.db import OperationalError, connections
+from django.db.backends.sqlite3.base import DatabaseWrapper
+from django.test import SimpleTestCase
+
+from utils.sqlite_backend.base import DatabaseWrapper as SerializedDatabaseWrapper
+
+POLLERS = 8
+POLLS = 40
+RENDERS = 20
+
+
+class SQLiteConcurrencyTest(SimpleTestCase):
+    """
+    Devices polling (read then update their row, in a transaction) while a
+    render worker writes screens, on a database file with the SQLite profile
+    of the settings, whatever the database used by the other tests.
+    """
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.name = str(Path(directory.name) / "stress.sqlite3")
+        connection = self.connect(DatabaseWrapper)
+        with connection.cursor() as cursor:
+            cursor.execute("CREATE TABLE device (id INTEGER PRIMARY KEY, polls INT)")
+            cursor.execute(
+                "CREATE TABLE screen (id INTEGER PRIMARY KEY, device_id INT, data BLOB)"
+            )
+            cursor.executemany(
+                "INSERT INTO device (id, polls) VALUES (%s, 0)",
+                [(device_id,) for device_id in range(POLLERS)],
+            )
+            cursor.execute("PRAGMA journal_mode")
+            self.assertEqual(cursor.fetchone()[0], "wal")
+        connection.close()
+
+    def connect(self, wrapper_class):
+        databases = connections.configure_settings(
+            {"default": {**settings.SQLITE_DATABASE, "NAME": self.name}}
+        )
+        return wrapper_class(databases["default"], alias="stress")
+
+    @staticmethod
+    def in_transaction(connection, statements):
+        connection.set_autocommit(
+            False, force_begin_transaction_with_broken_autocommit=True
+        )
+        try:
+            with connection.cursor() as cursor:
+                for sql, params in statements:
+                    cursor.execute(sql, params)
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+        finally:
+            connection.set_autocommit(True)
+
+    def run_stress(self, wrapper_class):
+        errors = []
+
+        def poller(device_id):
+            connection = self.connect(wrapper_class)
+            try:
+                for _ in range(POLLS):
+                    self.in_transaction(
+                        connection,
+                        [
+                            ("SELECT polls FROM device WHERE id = %s", [device_id]),
+                            (
+                                "UPDATE device SET polls = polls + 1 WHERE id = %s",
+                                [device_id],
+                            ),
+                        ],
+                    )
+                    with connection.cursor() as cursor:
+                        cursor.execute("SELECT COUNT(*) FROM screen")
+            except OperationalError as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        def render_worker():
+            connection = self.connect(wrapper_class)
+            try:
+                for index in range(RENDERS):
+                    self.in_transaction(
+                        connection,
+                        [
+                            (
+                                "INSERT INTO screen (device_id, data) VALUES (%s, %s)",
+                                [index % POLLERS, bytes(48 * 1024)],
+                            )
+                        ],
+                    )
+            except OperationalError as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [
+            threading.Thread(target=poller, args=(device_id,))
+            for device_id in range(POLLERS)
+        ] + [threading.Thread(target=render_worker)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        connection = self.connect(DatabaseWrapper)
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT SUM(polls) FROM device")
+            self.assertEqual(cursor.fetchone()[0], POLLERS * POLLS)
+            cursor.execute("SELECT COUNT(*) FROM screen")
+            self.assertEqual(cursor.fetchone()[0], RENDERS)
+        connection.close()
+
+    def test_no_lock_errors(self):
+        self.run_stress(DatabaseWrapper)
+
+    def test_no_lock_errors_with_serialized_writes(self):
+        self.run_stress(SerializedDatabaseWrapper)
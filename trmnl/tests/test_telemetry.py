@@ -0,0 +1,258 @@
+import datetime
+import json
+from unittest import mock
+
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from trmnl import telemetry
+from trmnl.models import APIKey, DeviceLog, TelemetryRollup
+from trmnl.models.telemetry import delete_old_telemetry
+
+from .fixtures import create_fleet
+from .utils import QueryBudgetMixin, clear_key_caches
+
+NOON = datetime.datetime(2026, 3, 2, 12, 0, 30, tzinfo=datetime.timezone.utc)
+
+
+def status_log(battery, rssi, at, version="1.4.7"):
+    return {
+        "log": {
+            "logs_array": [
+                {
+                    "creation_timestamp": int(at.timestamp()),
+                    "log_message": "Wakeup",
+                    "device_status_stamp": {
+                        "battery_voltage": battery,
+                        "wifi_rssi_level": rssi,
+                        "current_fw_version": version,
+                    },
+                }
+            ]
+        }
+    }
+
+
+def telemetry_headers(device, battery="4.01", rssi="-60", version="1.4.8"):
+    return {
+        "HTTP_ACCESS_TOKEN": device.api_key,
+        "HTTP_ID": device.mac_address,
+        "HTTP_BATTERY_VOLTAGE": battery,
+        "HTTP_RSSI": rssi,
+        "HTTP_FW_VERSION": version,
+    }
+
+
+class SampleTest(TestCase):
+    def test_from_headers(self):
+        sample = telemetry.from_headers(
+            {"Battery-Voltage": "3.87", "RSSI": "-71", "FW-Version": "1.4.7"}, NOON
+        )
+        self.assertEqual(sample, telemetry.Sample(NOON, 3.87, -71, "1.4.7"))
+        sample = telemetry.from_headers({"Battery-Voltage": "nan", "RSSI": "x"}, NOON)
+        self.assertTrue(sample.is_empty)
+
+    def test_from_log(self):
+        at = NOON - datetime.timedelta(hours=3)
+        [sample] = telemetry.from_log(status_log(3.9, -65, at), received_at=NOON)
+        self.assertEqual(sample, telemetry.Sample(at, 3.9, -65, "1.4.7"))
+        # The device clock isn't set
+        epoch = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+        [sample] = telemetry.from_log(status_log(3.9, -65, epoch), received_at=NOON)
+        self.assertEqual(sample.at, NOON)
+
+    def test_logs_without_telemetry(self):
+        for message in ("text", {"log": "entry"}, {"log": {"logs_array": [1, {}]}}):
+            with self.subTest(message=message):
+                self.assertEqual(telemetry.from_log(message), [])
+
+
+class RollupTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.device = create_fleet(users=1, devices_per_user=1, logs_per_device=0)[0]
+
+    def record(self, *samples):
+        TelemetryRollup.record(self.device.pk, samples)
+
+    def test_samples_are_aggregated_in_each_resolution(self):
+        self.record(
+            telemetry.Sample(NOON, 4.0, -60, "1.4.7"),
+            telemetry.Sample(NOON + datetime.timedelta(seconds=20), 3.8, None),
+        )
+        self.record(telemetry.Sample(NOON + datetime.timedelta(hours=1), 3.6, -80))
+
+        minutes = TelemetryRollup.objects.filter(resolution=60)
+        self.assertEqual(minutes.count(), 2)
+        first = minutes.first()
+        self.assertEqual(first.bucket, NOON.replace(second=0))
+        self.assertEqual(
+            first.as_json(),
+            {
+                "at": "2026-03-02T12:00:00+00:00",
+                "samples": 2,
+                "battery_voltage": {"min": 3.8, "max": 4.0, "avg": 3.9},
+                "rssi": {"min": -60, "max": -60, "avg": -60.0},
+                "firmware_version": "1.4.7",
+            },
+        )
+        self.assertEqual(TelemetryRollup.objects.filter(resolution=3600).count(), 2)
+        day = TelemetryRollup.objects.get(resolution=86400)
+        self.assertEqual(day.bucket, datetime.datetime(2026, 3, 2, tzinfo=NOON.tzinfo))
+        self.assertEqual((day.samples, day.battery_count, day.rssi_count), (3, 3, 2))
+        self.assertEqual((day.battery_min, day.rssi_min, day.rssi_max), (3.6, -80, -60))
+        self.assertEqual(day.firmware_version, "1.4.7")
+
+    def test_recording_is_a_single_query(self):
+        samples = [
+            telemetry.Sample(NOON + datetime.timedelta(minutes=minute), 4.0, -60)
+            for minute in range(5)
+        ]
+        with self.assertNumQueries(1):
+            self.record(*samples)
+        with self.assertNumQueries(0):
+            self.record(telemetry.Sample(NOON))
+        self.assertEqual(TelemetryRollup.objects.count(), 5 + 1 + 1)
+
+    @override_settings(DEVICE_LOG_RETENTION_DAYS=7)
+    def test_retention(self):
+        now = timezone.now()
+        self.record(telemetry.Sample(now - datetime.timedelta(days=3), 4.0))
+        self.record(telemetry.Sample(now, 4.0))
+        old_log = DeviceLog.objects.create(device=self.device, message="old")
+        DeviceLog.objects.filter(pk=old_log.pk).update(
+            created_at=now - datetime.timedelta(days=8)
+        )
+        DeviceLog.objects.create(device=self.device, message="new")
+
+        delete_old_telemetry()
+
+        resolutions = TelemetryRollup.objects.values_list("resolution", flat=True)
+        self.assertEqual(sorted(resolutions), [60, 3600, 3600, 86400, 86400])
+        self.assertEqual(
+            list(DeviceLog.objects.values_list("message", flat=True)), ["new"]
+        )
+
+
+@mock.patch("scheduler.models.task.Task._schedule", return_value=False)
+class TelemetryIngestTest(QueryBudgetMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.device = create_fleet(users=1, devices_per_user=1)[0]
+
+    def setUp(self):
+        clear_key_caches()
+
+    def test_display_headers(self, _schedule):
+        self.client.get(reverse("display"), **telemetry_headers(self.device))
+        # A poll without telemetry keeps the latest values
+        self.client.get(
+            reverse("display"),
+            HTTP_ACCESS_TOKEN=self.device.api_key,
+            HTTP_ID=self.device.mac_address,
+        )
+        self.device.refresh_from_db()
+        self.assertEqual(self.device.battery_voltage, 4.01)
+        self.assertEqual(self.device.rssi, -60)
+        self.assertEqual(self.device.firmware_version, "1.4.8")
+        self.assertEqual(self.device.telemetry.count(), 3)
+
+    def test_display_budget_with_telemetry(self, _schedule):
+        for _ in range(2):
+            with self.assertQueryBudget(21):
+                self.client.get(reverse("display"), **telemetry_headers(self.device))
+
+    def test_log_status_stamps(self, _schedule):
+        at = timezone.now() - datetime.timedelta(minutes=5)
+        with self.assertQueryBudget(3):
+            self.client.post(
+                reverse("log"),
+                data=json.dumps(status_log(3.7, -75, at)),
+                content_type="application/json",
+                HTTP_ACCESS_TOKEN=self.device.api_key,
+            )
+        minute = self.device.telemetry.get(resolution=60)
+        self.assertEqual(minute.bucket, TelemetryRollup.bucket_start(at, 60))
+        self.assertEqual(minute.battery_min, 3.7)
+
+
+class TelemetryApiTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.devices = create_fleet(users=2, devices_per_user=3, logs_per_device=0)
+        cls.user = cls.devices[0].user
+        cls.token = APIKey.objects.create(name="Fleet", user=cls.user).raw_key
+        now = timezone.now()
+        for device, battery in zip(cls.devices, (3.3, 3.9, 4.1, 3.0, 3.0, 3.0)):
+            device.mark_seen(telemetry.Sample(now, battery, -70, "1.4.7"))
+            TelemetryRollup.record(
+                device.pk,
+                [
+                    telemetry.Sample(now - datetime.timedelta(hours=2), battery + 0.2),
+                    telemetry.Sample(now, battery, -70, "1.4.7"),
+                    telemetry.Sample(now - datetime.timedelta(days=3), 4.2),
+                ],
+            )
+
+    def get(self, url, **params):
+        return self.client.get(
+            url, params, headers={"Authorization": f"Bearer {self.token}"}
+        )
+
+    def test_fleet(self):
+        data = self.get(reverse("fleet_telemetry")).json()
+        self.assertEqual(len(data["devices"]), 3)
+        device = next(
+            device
+            for device in data["devices"]
+            if device["device"] == self.devices[0].friendly_id
+        )
+        self.assertEqual(device["battery_voltage"], 3.3)
+        self.assertEqual(device["window"]["samples"], 2)
+        self.assertEqual(
+            device["window"]["battery_voltage"], {"min": 3.3, "max": 3.5, "avg": 3.4}
+        )
+        self.assertEqual(device["window"]["rssi"], {"min": -70, "max": -70, "avg": -70})
+
+    def test_fleet_filters(self):
+        data = self.get(reverse("fleet_telemetry"), battery_below="4").json()
+        self.assertEqual(
+            {device["device"] for device in data["devices"]},
+            {device.friendly_id for device in self.devices[:2]},
+        )
+        data = self.get(
+            reverse("fleet_telemetry"),
+            battery_below="4",
+            device=self.devices[1].friendly_id.lower(),
+            since=(timezone.now() - datetime.timedelta(days=7)).isoformat(),
+            resolution="day",
+        ).json()
+        [device] = data["devices"]
+        self.assertEqual(device["window"]["battery_voltage"]["max"], 4.2)
+
+    def test_fleet_queries(self):
+        clear_key_caches()
+        # The API key, the devices and their rollups
+        with self.assertNumQueries(3):
+            self.get(reverse("fleet_telemetry"))
+
+    def test_device_series(self):
+        device = self.devices[0]
+        data = self.get(reverse("device_telemetry", args=[device.friendly_id])).json()
+        self.assertEqual(data["resolution"], "hour")
+        batteries = [bucket["battery_voltage"]["max"] for bucket in data["buckets"]]
+        self.assertEqual(batteries, [3.5, 3.3])
+        data = self.get(
+            reverse("device_telemetry", args=[device.friendly_id]), resolution="minute"
+        ).json()
+        self.assertEqual(len(data["buckets"]), 2)
+
+    def test_errors(self):
+        other = self.devices[3]
+        url = reverse("device_telemetry", args=[other.friendly_id])
+        self.assertEqual(self.get(url).status_code, 404)
+        url = reverse("fleet_telemetry")
+        self.assertEqual(self.get(url, resolution="week").status_code, 400)
+        self.assertEqual(self.get(url, battery_below="low").status_code, 400)
+        self.assertEqual(self.client.get(url).status_code, 403)
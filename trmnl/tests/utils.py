@@ -0,0 +1,27 @@
+from contextlib import contextmanager
+
+from django.core.cache import cache
+
+from trmnl import key_cache
+from utils.query_stats import QueryStats
+
+
+def clear_key_caches():
+    """Forget the verified keys, so that the next lookups hit the database."""
+    cache.clear()
+    key_cache.api_keys.local.clear()
+    key_cache.device_keys.local.clear()
+
+
+class QueryBudgetMixin:
+    """Assert that a block of code stays within a number of queries."""
+
+    @contextmanager
+    def assertQueryBudget(self, budget, using="default"):
+        with QueryStats(using=using, keep_slowest=0) as stats:
+            yield stats
+        if stats.count > budget:
+            queries = "\n".join(
+                f"{index}. {sql}" for index, sql in enumerate(stats.queries, 1)
+            )
+            self.fail(f"{stats.count} queries executed, budget is {budget}:\n{queries}")
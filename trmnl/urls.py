@@ -8,6 +8,18 @@ urlpatterns = [
     path("api/display/", views.display, name="display"),
     path("api/log", views.log, name="log"),
     path("api/v1/generate_screen", views.generate_screen, name="generate_screen"),
+    path(
+        "api/v1/render_jobs/<uuid:job_id>",
+        views.render_job_status,
+        name="render_job_status",
+    ),
+    path("api/v1/logs", views.search_logs, name="search_logs"),
+    path("api/v1/telemetry", views.fleet_telemetry, name="fleet_telemetry"),
+    path(
+        "api/v1/telemetry/<str:friendly_id>",
+        views.device_telemetry,
+        name="device_telemetry",
+    ),
     path(
         "api/v1/media/<str:filename>", views.device_image_view, name="device_image_view"
     ),
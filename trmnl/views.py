@@ -1,14 +1,28 @@
 import base64
+import datetime
+import hmac
 import json
 import logging
 
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
+from django.core.exceptions import ValidationError
+from django.core.validators import URLValidator
+from django.db import transaction
 from django.http import HttpResponse, JsonResponse
 from django.shortcuts import redirect, render
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.cache import patch_vary_headers
+from django.utils.dateparse import parse_datetime
 from django.views.decorators.csrf import csrf_exempt
 
+from . import telemetry
+from .key_cache import get_device_id
 from .middleware import require_api_key
-from .models import Device, Screen
+from .models import Device, DeviceLog, RenderJob, Screen, TelemetryRollup
+from .models.render_job import is_allowed_callback
+from .models.screen import IMAGE_COLUMNS, IMAGE_FORMATS
 
 logger = logging.getLogger(__name__)
 
@@ -87,7 +101,10 @@ def display(request):
             status=200,
         )
     # get device from database
-    device = Device.objects.filter(api_key=api_key, mac_address=mac).first()
+    device_id = get_device_id(api_key, mac)
+    device = None
+    if device_id:
+        device = Device.objects.select_related("user").filter(pk=device_id).first()
     if not device:
         return JsonResponse(
             {
@@ -114,19 +131,24 @@ def display(request):
             status=200,
         )
 
-    # get latest screen, or rover if no screen
-    screen = device.get_screen(update_last_seen=True)
-    device.schedule_next_screen()
-    refresh_rate = screen.display_duration if screen else device.refresh_rate
-    if not screen:
+    # current screen (from the device row), or rover if no screen
+    sample = telemetry.from_headers(request.headers)
+    device.mark_seen(sample)
+    TelemetryRollup.record(device.pk, [sample])
+    next_screen_at = device.schedule_next_screen()
+    refresh_rate = device.adaptive_refresh_rate(next_screen_at)
+    image_format = request.GET.get("format", "bmp")
+    if image_format not in IMAGE_FORMATS:
+        image_format = "bmp"
+    if not device.current_screen_id:
         image_url = request.build_absolute_uri("/static/images/rover.bmp")
         filename = "rover.bmp"
     elif request.GET.get("base64"):
-        image_url = screen.image_as_base64
-        filename = screen.image_as_url_for_device_filename
+        image_url = device.current_screen.image_as_data_uri(image_format)
+        filename = device.current_image_filename(image_format)
     else:
-        image_url = request.build_absolute_uri(screen.image_as_url_for_device)
-        filename = screen.image_as_url_for_device_filename
+        image_url = request.build_absolute_uri(device.current_image_url(image_format))
+        filename = device.current_image_filename(image_format)
 
     return JsonResponse(
         {
@@ -155,9 +177,8 @@ def log(request):
             },
             status=500,
         )
-    # get device from database
-    device = Device.objects.filter(api_key=api_key).first()
-    if not device:
+    device_id = get_device_id(api_key)
+    if not device_id:
         return JsonResponse(
             {
                 "status": 500,
@@ -171,7 +192,8 @@ def log(request):
     except json.JSONDecodeError:
         message = request.body.decode("utf-8")
 
-    device.devicelog_set.create(message=message)
+    DeviceLog.objects.create(device_id=device_id, message=message)
+    TelemetryRollup.record(device_id, telemetry.from_log(message))
 
     return JsonResponse(
         {
@@ -182,8 +204,38 @@ def log(request):
     )
 
 
+def media_type_quality(media_type):
+    """The q parameter of an Accept header media type, 0 when invalid"""
+    try:
+        return float(media_type.params.get("q", 1))
+    except ValueError:
+        return 0
+
+
+def get_image_format(request, extension):
+    """
+    The image format requested with the `format` query parameter, a file
+    extension or the Accept header, in that order. Defaults to BMP, which is
+    what the stock firmware expects.
+    """
+    requested = request.GET.get("format") or (extension if extension != "bmp" else "")
+    if requested:
+        return requested if requested in IMAGE_FORMATS else None
+    accepted_types = sorted(
+        request.accepted_types, key=media_type_quality, reverse=True
+    )
+    for media_type in accepted_types:
+        if media_type_quality(media_type) <= 0:
+            continue
+        for image_format, content_type in IMAGE_FORMATS.items():
+            if f"{media_type.main_type}/{media_type.sub_type}" == content_type:
+                return image_format
+    return "bmp"
+
+
 def device_image_view(request, filename):
-    device_id, screen_id = filename.replace(".bmp", "").split("-")
+    name, _, extension = filename.partition(".")
+    device_id, screen_id = name.split("-")
     # get api_key from params
     api_key = request.GET.get("api_key", None)
     if not api_key:
@@ -195,8 +247,25 @@ def device_image_view(request, filename):
             status=404,
         )
 
-    screen = Screen.objects.filter(device__friendly_id=device_id, id=screen_id).first()
-    if not screen or screen.device.api_key != api_key:
+    image_format = get_image_format(request, extension)
+    if image_format is None:
+        return JsonResponse(
+            {
+                "status": 400,
+                "message": "Unsupported image format",
+            },
+            status=400,
+        )
+
+    # A single query, loading the image in the requested format only
+    screen = (
+        Screen.objects.defer(None)
+        .select_related("device")
+        .only("device", "device__api_key", IMAGE_COLUMNS[image_format])
+        .filter(device__friendly_id=device_id, id=screen_id)
+        .first()
+    )
+    if not screen or not hmac.compare_digest(screen.device.api_key, api_key):
         return JsonResponse(
             {
                 "status": 404,
@@ -205,7 +274,26 @@ def device_image_view(request, filename):
             status=404,
         )
 
-    return HttpResponse(screen.screen, content_type="image/bmp")
+    response = HttpResponse(
+        screen.image_data(image_format), content_type=IMAGE_FORMATS[image_format]
+    )
+    response["Content-Length"] = len(response.content)
+    patch_vary_headers(response, ["Accept"])
+    return response
+
+
+def parse_screens(data):
+    """
+    The (device friendly id, html) pairs of a generate_screen call:
+    - {"device": ..., "html": ...} for a single screen,
+    - {"screens": [{"device": ..., "html": ...}, ...]} for a batch,
+    - {"devices": [...], "html": ...} for the same HTML on several devices.
+    """
+    if "screens" in data:
+        return [(screen["device"], screen["html"]) for screen in data["screens"]]
+    if "devices" in data:
+        return [(device, data["html"]) for device in data["devices"]]
+    return [(data["device"], data["html"])]
 
 
 @csrf_exempt
@@ -214,7 +302,8 @@ def generate_screen(request):
     # get JSON body
     try:
         data = json.loads(request.body.decode("utf-8"))
-    except json.JSONDecodeError:
+        pairs = parse_screens(data)
+    except (json.JSONDecodeError, KeyError, TypeError):
         return JsonResponse(
             {
                 "status": 400,
@@ -223,20 +312,38 @@ def generate_screen(request):
             status=400,
         )
 
-    device = Device.objects.filter(
-        user=request.api_key.user, friendly_id=data["device"].upper()
-    ).first()
-    if not device:
+    if not pairs or len(pairs) > settings.RENDER_JOB_MAX_SCREENS:
+        return JsonResponse(
+            {
+                "status": 400,
+                "message": f"Between 1 and {settings.RENDER_JOB_MAX_SCREENS} "
+                f"screens can be generated at once",
+            },
+            status=400,
+        )
+
+    friendly_ids = {str(device).upper() for device, _ in pairs}
+    devices = {
+        device.friendly_id: device
+        for device in Device.objects.filter(
+            user=request.api_key.user, friendly_id__in=friendly_ids
+        )
+    }
+    if missing := friendly_ids - devices.keys():
         return JsonResponse(
             {
                 "status": 404,
-                "message": "Device not found",
+                "message": f"Device not found: {', '.join(sorted(missing))}",
             },
             status=404,
         )
 
-    screen = device.screen_set.create(
-        html=data["html"],
+    # Batches and async calls are rendered outside of the request
+    if len(pairs) > 1 or data.get("async"):
+        return queue_render_job(request, data, devices, pairs)
+
+    screen = devices[friendly_ids.pop()].screen_set.create(
+        html=pairs[0][1],
     )
 
     try:
@@ -259,6 +366,267 @@ def generate_screen(request):
         )
 
 
+def queue_render_job(request, data, devices, pairs):
+    callback_url = data.get("callback_url") or ""
+    if callback_url:
+        try:
+            URLValidator(schemes=["http", "https"])(callback_url)
+        except ValidationError:
+            return JsonResponse(
+                {"status": 400, "message": "Invalid callback_url"}, status=400
+            )
+        if not is_allowed_callback(callback_url):
+            return JsonResponse(
+                {"status": 400, "message": "callback_url host not allowed"},
+                status=400,
+            )
+
+    with transaction.atomic():
+        render_job = RenderJob.objects.create(
+            user=request.api_key.user, callback_url=callback_url
+        )
+        Screen.objects.bulk_create(
+            Screen(
+                device=devices[str(device).upper()], html=html, render_job=render_job
+            )
+            for device, html in pairs
+        )
+    render_job.enqueue()
+    return JsonResponse(
+        {
+            "status": 202,
+            "message": "Render job queued",
+            "job": str(render_job.id),
+            "status_url": reverse("render_job_status", args=[render_job.id]),
+        },
+        status=202,
+    )
+
+
+@require_api_key
+def render_job_status(request, job_id):
+    render_job = RenderJob.objects.filter(pk=job_id, user=request.api_key.user).first()
+    if not render_job:
+        return JsonResponse(
+            {"status": 404, "message": "Render job not found"}, status=404
+        )
+    return JsonResponse({"status": 200, **render_job.as_json()})
+
+
+def parse_time_param(request, name):
+    """
+    A date and time query parameter (ISO 8601, in the current time zone
+    unless given), None when absent.
+    :raise ValueError: if it isn't a date and time
+    """
+    value = request.GET.get(name)
+    if not value:
+        return None
+    parsed = parse_datetime(value)
+    if parsed is None:
+        raise ValueError(f"Invalid {name}")
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+@require_api_key
+def search_logs(request):
+    """
+    The latest logs of the devices of the API key's user, newest first:
+    - `q`: words the message contains (full-text search),
+    - `device`: friendly IDs of the devices (comma separated),
+    - `since`, `until`: time range of the logs,
+    - `limit`: number of logs, up to LOG_SEARCH_MAX_RESULTS.
+    """
+    try:
+        since = parse_time_param(request, "since")
+        until = parse_time_param(request, "until")
+    except ValueError as e:
+        return JsonResponse({"status": 400, "message": f"{e}"}, status=400)
+    try:
+        limit = int(request.GET.get("limit", settings.LOG_SEARCH_MAX_RESULTS))
+    except ValueError:
+        return JsonResponse({"status": 400, "message": "Invalid limit"}, status=400)
+    limit = max(1, min(limit, settings.LOG_SEARCH_MAX_RESULTS))
+
+    logs = DeviceLog.objects.filter(device__user=request.api_key.user)
+    if friendly_ids := {
+        friendly_id.strip().upper()
+        for friendly_id in request.GET.get("device", "").split(",")
+        if friendly_id.strip()
+    }:
+        devices = dict(
+            Device.objects.filter(
+                user=request.api_key.user, friendly_id__in=friendly_ids
+            ).values_list("friendly_id", "pk")
+        )
+        if missing := friendly_ids - devices.keys():
+            return JsonResponse(
+                {
+                    "status": 404,
+                    "message": f"Device not found: {', '.join(sorted(missing))}",
+                },
+                status=404,
+            )
+        logs = logs.filter(device__in=devices.values())
+    if since:
+        logs = logs.filter(created_at__gte=since)
+    if until:
+        logs = logs.filter(created_at__lt=until)
+    if query := request.GET.get("q", "").strip():
+        logs = logs.search(query)
+
+    logs = logs.select_related("device").order_by("-created_at", "-pk")[:limit]
+    return JsonResponse(
+        {
+            "status": 200,
+            "logs": [
+                {
+                    "id": log.id,
+                    "device": log.device.friendly_id,
+                    "created_at": log.created_at.isoformat(),
+                    "message": log.message,
+                }
+                for log in logs
+            ],
+        }
+    )
+
+
+def parse_number_param(request, name, cast=float):
+    """
+    A number query parameter, None when absent.
+    :raise ValueError: if it isn't a number
+    """
+    value = request.GET.get(name)
+    if not value:
+        return None
+    try:
+        return cast(value)
+    except ValueError:
+        raise ValueError(f"Invalid {name}")
+
+
+def parse_resolution_param(request):
+    """
+    The `resolution` query parameter (minute, hour or day), hour by default.
+    :raise ValueError: if it isn't one of them
+    """
+    name = request.GET.get("resolution") or "hour"
+    try:
+        return TelemetryRollup.Resolution[name.upper()]
+    except KeyError:
+        raise ValueError("Invalid resolution")
+
+
+@require_api_key
+def fleet_telemetry(request):
+    """
+    The telemetry of the devices of the API key's user: the latest values,
+    which the devices can be filtered by (`battery_below`, `rssi_below`,
+    `firmware_version`, `device`), and their minimum, maximum and average over
+    a time window (`since`, `until`, the last TELEMETRY_DEFAULT_WINDOW_HOURS
+    by default) from the rollups of a `resolution`.
+    """
+    try:
+        since = parse_time_param(request, "since")
+        until = parse_time_param(request, "until")
+        resolution = parse_resolution_param(request)
+        battery_below = parse_number_param(request, "battery_below")
+        rssi_below = parse_number_param(request, "rssi_below", int)
+    except ValueError as e:
+        return JsonResponse({"status": 400, "message": f"{e}"}, status=400)
+    if since is None:
+        since = (until or timezone.now()) - datetime.timedelta(
+            hours=settings.TELEMETRY_DEFAULT_WINDOW_HOURS
+        )
+
+    devices = Device.objects.filter(user=request.api_key.user).order_by("friendly_id")
+    if friendly_ids := request.GET.get("device"):
+        devices = devices.filter(
+            friendly_id__in=[
+                friendly_id.strip().upper() for friendly_id in friendly_ids.split(",")
+            ]
+        )
+    if battery_below is not None:
+        devices = devices.filter(battery_voltage__lt=battery_below)
+    if rssi_below is not None:
+        devices = devices.filter(rssi__lt=rssi_below)
+    if firmware_version := request.GET.get("firmware_version"):
+        devices = devices.filter(firmware_version=firmware_version)
+    devices = list(
+        devices.only(
+            "friendly_id", "last_seen_at", "battery_voltage", "rssi", "firmware_version"
+        )
+    )
+
+    summaries = (
+        TelemetryRollup.objects.window(resolution, since, until)
+        .filter(device__in=[device.pk for device in devices])
+        .summary_by_device()
+        if devices
+        else {}
+    )
+    return JsonResponse(
+        {
+            "status": 200,
+            "since": since.isoformat(),
+            "until": until.isoformat() if until else None,
+            "devices": [
+                {
+                    "device": device.friendly_id,
+                    "last_seen_at": (
+                        device.last_seen_at.isoformat() if device.last_seen_at else None
+                    ),
+                    "battery_voltage": device.battery_voltage,
+                    "rssi": device.rssi,
+                    "firmware_version": device.firmware_version or None,
+                    "window": summaries.get(device.pk),
+                }
+                for device in devices
+            ],
+        }
+    )
+
+
+@require_api_key
+def device_telemetry(request, friendly_id):
+    """
+    The telemetry series of a device: the rollups of a `resolution` starting
+    in a time window (`since`, `until`, the last TELEMETRY_DEFAULT_WINDOW_HOURS
+    by default), oldest first.
+    """
+    try:
+        since = parse_time_param(request, "since")
+        until = parse_time_param(request, "until")
+        resolution = parse_resolution_param(request)
+    except ValueError as e:
+        return JsonResponse({"status": 400, "message": f"{e}"}, status=400)
+    if since is None:
+        since = (until or timezone.now()) - datetime.timedelta(
+            hours=settings.TELEMETRY_DEFAULT_WINDOW_HOURS
+        )
+
+    device = Device.objects.filter(
+        user=request.api_key.user, friendly_id=friendly_id.upper()
+    ).first()
+    if not device:
+        return JsonResponse(
+            {"status": 404, "message": f"Device not found: {friendly_id}"},
+            status=404,
+        )
+    rollups = device.telemetry.window(resolution, since, until)
+    return JsonResponse(
+        {
+            "status": 200,
+            "device": device.friendly_id,
+            "resolution": resolution.name.lower(),
+            "buckets": [rollup.as_json() for rollup in rollups],
+        }
+    )
+
+
 @login_required(login_url="/admin/login/")
 def preview(request):
     return render(
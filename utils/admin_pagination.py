@@ -0,0 +1,139 @@
+"""
+Admin changelists for tables that grow without bound (screens, device logs).
+
+- The row count of an unfiltered list is estimated from the table statistics
+  instead of a COUNT(*) scanning the whole table.
+- In their default order (newest first), lists are paged with a cursor: the
+  "Older" link carries the key of the last row shown, and the next page starts
+  from there in the index, however deep it is, instead of skipping rows with
+  an OFFSET.
+"""
+
+import datetime
+
+from django.contrib import admin
+from django.contrib.admin.views.main import ChangeList
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+CURSOR_VAR = "cursor"
+# Tables with fewer (estimated) rows are counted exactly
+ESTIMATED_COUNT_THRESHOLD = 10_000
+KEYSET_ORDERING = ["-created_at", "-pk"]
+
+
+def estimated_count(model, using="default"):
+    """An estimate of the number of rows of the model's table, or None."""
+    connection = connections[using]
+    table = connection.ops.quote_name(model._meta.db_table)
+    with connection.cursor() as cursor:
+        if connection.vendor == "postgresql":
+            cursor.execute(
+                "SELECT reltuples FROM pg_class WHERE oid = %s::regclass",
+                [model._meta.db_table],
+            )
+        elif connection.vendor == "sqlite":
+            # Both ends of the rowid B-tree: old rows are deleted first, the
+            # estimate is close as long as rows aren't deleted in the middle.
+            # One subquery each, SQLite scans the table for MAX() - MIN()
+            cursor.execute(
+                f"SELECT (SELECT MAX(rowid) FROM {table}) "
+                f"- (SELECT MIN(rowid) FROM {table}) + 1"
+            )
+        else:
+            return None
+        row = cursor.fetchone()
+    # reltuples is -1 until the table is first vacuumed or analyzed
+    if row is None or row[0] is None or row[0] < 0:
+        return None
+    return int(row[0])
+
+
+class EstimatedCountPaginator(Paginator):
+    estimated = False
+
+    @cached_property
+    def count(self):
+        # Rows of every page, whatever the cursor of this one
+        queryset = getattr(self.object_list, "uncursored", self.object_list)
+        if not queryset.query.has_filters():
+            estimate = estimated_count(queryset.model, queryset.db)
+            if estimate is not None and estimate >= ESTIMATED_COUNT_THRESHOLD:
+                self.estimated = True
+                return estimate
+        return super().count
+
+
+class KeysetChangeList(ChangeList):
+    def __init__(self, request, *args, **kwargs):
+        self.cursor = request.GET.get(CURSOR_VAR)
+        self.next_cursor_url = None
+        super().__init__(request, *args, **kwargs)
+
+    @property
+    def first_page_url(self):
+        return self.get_query_string({CURSOR_VAR: None})
+
+    def get_filters_params(self, params=None):
+        params = super().get_filters_params(params)
+        params.pop(CURSOR_VAR, None)
+        return params
+
+    def get_query_string(self, new_params=None, remove=None):
+        # Filtering, searching or sorting starts over from the newest rows
+        return super().get_query_string(
+            {CURSOR_VAR: None, **(new_params or {})}, remove
+        )
+
+    def parse_cursor(self):
+        try:
+            created_at, pk = self.cursor.rsplit("~", 1)
+            return (
+                datetime.datetime.fromisoformat(created_at),
+                self.lookup_opts.pk.to_python(pk),
+            )
+        except (AttributeError, ValueError, TypeError):
+            return None
+
+    def get_queryset(self, request, exclude_parameters=None):
+        queryset = super().get_queryset(request, exclude_parameters)
+        # The admin repeats the default ordering after the explicit one
+        ordering = list(dict.fromkeys(queryset.query.order_by))
+        self.keyset = ordering == KEYSET_ORDERING
+        cursor = self.parse_cursor() if self.keyset else None
+        if cursor:
+            created_at, pk = cursor
+            # The first condition bounds the index range, the second one only
+            # skips the rows of the previous page sharing its last timestamp
+            uncursored = queryset
+            queryset = queryset.filter(created_at__lte=created_at).filter(
+                Q(created_at__lt=created_at) | Q(pk__lt=pk)
+            )
+            # Counted by the paginator, the cursor isn't a filter of the user
+            queryset.uncursored = uncursored
+        return queryset
+
+    def get_results(self, request):
+        super().get_results(request)
+        if not self.keyset or self.show_all or not self.multi_page:
+            return
+        # Evaluates (and caches) the page
+        rows = list(self.result_list)
+        if len(rows) == self.list_per_page:
+            last = rows[-1]
+            self.next_cursor_url = self.get_query_string(
+                {CURSOR_VAR: f"{last.created_at.isoformat()}~{last.pk}"}
+            )
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """A ModelAdmin with estimated counts and cursor pagination."""
+
+    ordering = KEYSET_ORDERING
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_changelist(self, request, **kwargs):
+        return KeysetChangeList
@@ -0,0 +1,63 @@
+import heapq
+import time
+
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+class QueryStats:
+    """
+    Record the queries executed on a database connection.
+
+    Usable as a context manager:
+
+        with QueryStats() as stats:
+            ...
+        stats.count, stats.total_time, stats.slowest
+    """
+
+    def __init__(self, using=DEFAULT_DB_ALIAS, keep_slowest=3):
+        self.using = using
+        self.keep_slowest = keep_slowest
+        self.count = 0
+        self.total_time = 0.0
+        self.queries = []
+        self._slowest = []
+        self._wrapper = None
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start
+            self.count += 1
+            self.total_time += duration
+            self.queries.append(sql)
+            entry = (duration, self.count, sql)
+            if len(self._slowest) < self.keep_slowest:
+                heapq.heappush(self._slowest, entry)
+            elif self.keep_slowest:
+                heapq.heappushpop(self._slowest, entry)
+
+    def __enter__(self):
+        self._wrapper = connections[self.using].execute_wrapper(self)
+        self._wrapper.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._wrapper.__exit__(exc_type, exc_value, traceback)
+        self._wrapper = None
+
+    @property
+    def total_time_ms(self):
+        return self.total_time * 1000
+
+    @property
+    def slowest(self):
+        """The slowest queries as (duration in seconds, sql), slowest first."""
+        return [
+            (duration, sql) for duration, _, sql in sorted(self._slowest, reverse=True)
+        ]
+
+    def summary(self):
+        return f"{self.count} queries in {self.total_time_ms:.1f}ms"
@@ -0,0 +1,83 @@
+"""
+SQLite backend with a single writer at a time, across threads and processes.
+
+SQLite allows one writer per database: when several try at once, all but one
+wait in SQLite's busy handler, which polls with growing sleeps and lets late
+writers overtake the ones waiting for a while, until the timeout ends in
+"database is locked". Here writers queue on an exclusive lock of a lock file
+next to the database instead, held from BEGIN to COMMIT/ROLLBACK (or around a
+single write statement in autocommit mode). With WAL, readers never wait.
+"""
+
+import fcntl
+
+from django.db.backends.sqlite3 import base
+
+READ_STATEMENTS = ("SELECT", "PRAGMA", "EXPLAIN")
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.lock_file = None
+        self.writer_lock_held = False
+        self.execute_wrappers.append(self.serialize_writes)
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        if not self.is_in_memory_db():
+            # One file descriptor per connection: flock() then excludes the
+            # other connections of the process too
+            self.lock_file = open(f"{self.settings_dict['NAME']}.lock", "a")
+        return conn
+
+    def _close(self):
+        try:
+            super()._close()
+        finally:
+            self.release_writer_lock()
+            if self.lock_file:
+                self.lock_file.close()
+                self.lock_file = None
+
+    def acquire_writer_lock(self):
+        if self.lock_file and not self.writer_lock_held:
+            fcntl.flock(self.lock_file, fcntl.LOCK_EX)
+            self.writer_lock_held = True
+
+    def release_writer_lock(self):
+        if self.lock_file and self.writer_lock_held:
+            fcntl.flock(self.lock_file, fcntl.LOCK_UN)
+            self.writer_lock_held = False
+
+    def _start_transaction_under_autocommit(self):
+        self.acquire_writer_lock()
+        try:
+            super()._start_transaction_under_autocommit()
+        except Exception:
+            self.release_writer_lock()
+            raise
+
+    def _commit(self):
+        try:
+            super()._commit()
+        finally:
+            self.release_writer_lock()
+
+    def _rollback(self):
+        try:
+            super()._rollback()
+        finally:
+            self.release_writer_lock()
+
+    def serialize_writes(self, execute, sql, params, many, context):
+        if self.writer_lock_held or sql.lstrip()[:7].upper().startswith(
+            READ_STATEMENTS
+        ):
+            return execute(sql, params, many, context)
+        # A write statement in autocommit mode
+        self.acquire_writer_lock()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.release_writer_lock()